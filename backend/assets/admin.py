@@ -1,67 +1,411 @@
+"""
+Admin site. Transaction, inventory and log tables can hold millions of
+rows, so their changelists (LargeTableAdmin) avoid whole-table work:
+
+- foreign keys in list_display come from one join (list_select_related)
+- foreign-key filters and form fields are autocomplete boxes instead of
+  one entry per related row
+- the result count is the planner's row estimate when that is above
+  ADMIN_EXACT_COUNT_LIMIT, and the unfiltered total is not counted at all
+- date drilldowns probe the date index per year, month or day instead of
+  truncating every row
+"""
+import functools
+import json
+from datetime import datetime, time, timedelta
+
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, models
+from django.utils import timezone
+from django.utils.functional import cached_property
+
 from .models import (
     Base, EquipmentType, Inventory, Purchase, Transfer,
-    Assignment, Expenditure, UserRole, RoleCode, APILog
+    Assignment, Expenditure, UserRole, RoleCode, APILog, StockThreshold, StockAlert, TransferCost, OrgNode, SerializedAsset,
+    StockLot
 )
 
 
+# More periods than this and a drilldown falls back to the database's DISTINCT
+MAX_DATE_PROBES = 400
+
+HTTP_METHODS = ['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS']
+
+
+def estimated_count(queryset):
+    """Planner row estimate for ``queryset``, or None if the database has none"""
+    connection = connections[queryset.db]
+    filtered = bool(queryset.query.where)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            if not filtered:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+                # -1 until the table is first analyzed
+                return int(row[0]) if row and row[0] >= 0 else None
+            sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            return int(plan[0]['Plan']['Plan Rows'])
+    if connection.vendor == 'sqlite' and not filtered:
+        # Row counts recorded by ANALYZE; the first number of each stat is the row count
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+        except DatabaseError:
+            # Never analyzed: no sqlite_stat1 table
+            return None
+        return row[0] if row else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Counts exactly only when the planner expects few enough rows for that to be cheap"""
+    
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is None or estimate <= settings.ADMIN_EXACT_COUNT_LIMIT:
+            return super().count
+        return estimate
+
+
+def _period_start(day, kind):
+    if kind == 'year':
+        return day.replace(month=1, day=1)
+    if kind == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(day, kind):
+    if kind == 'year':
+        return day.replace(year=day.year + 1)
+    if kind == 'month':
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+class IndexedDatesMixin:
+    """
+    QuerySet methods behind the admin's date_hierarchy, answered from the
+    date field's index: Min/Max aggregates become ordered LIMIT 1 queries
+    and dates()/datetimes() an EXISTS probe per year, month or day between
+    them. They return lists rather than querysets.
+    """
+    
+    def _bound(self, field_name, last=False):
+        return self.exclude(**{f'{field_name}__isnull': True}).order_by(
+            f'-{field_name}' if last else field_name
+        ).values_list(field_name, flat=True).first()
+    
+    def aggregate(self, *args, **kwargs):
+        bounds = {}
+        for alias, expression in kwargs.items():
+            source = expression.get_source_expressions() if isinstance(expression, (models.Min, models.Max)) else None
+            if args or not source or len(source) != 1 or not isinstance(source[0], models.F) or expression.filter:
+                return super().aggregate(*args, **kwargs)
+            bounds[alias] = (source[0].name, isinstance(expression, models.Max))
+        return {alias: self._bound(field_name, last) for alias, (field_name, last) in bounds.items()}
+    
+    def _periods(self, field_name, kind, order, tz):
+        first, last = self._bound(field_name), self._bound(field_name, last=True)
+        if first is None:
+            return []
+        is_datetime = isinstance(first, datetime)
+        if is_datetime and tz is not None:
+            first, last = timezone.localtime(first, tz), timezone.localtime(last, tz)
+        if is_datetime:
+            first, last = first.date(), last.date()
+        
+        starts = [_period_start(first, kind)]
+        while starts[-1] < _period_start(last, kind):
+            if len(starts) > MAX_DATE_PROBES:
+                return None
+            starts.append(_next_period(starts[-1], kind))
+        
+        def bound(day):
+            if not is_datetime:
+                return day
+            moment = datetime.combine(day, time.min)
+            return timezone.make_aware(moment, tz) if tz is not None else moment
+        
+        def probe(start):
+            # The period's range goes first: SQLite seeks on the first of several bounds on a column
+            period = self.model._default_manager.using(self.db).filter(**{
+                f'{field_name}__gte': bound(start),
+                f'{field_name}__lt': bound(_next_period(start, kind)),
+            })
+            return (period & self).exists()
+        
+        periods = [bound(start) if is_datetime else start for start in starts if probe(start)]
+        return periods[::-1] if order == 'DESC' else periods
+    
+    def dates(self, field_name, kind, order='ASC'):
+        periods = self._periods(field_name, kind, order, None) if kind in ('year', 'month', 'day') else None
+        return super().dates(field_name, kind, order) if periods is None else periods
+    
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None, is_dst=timezone.NOT_PASSED):
+        tz = (tzinfo or timezone.get_current_timezone()) if settings.USE_TZ else None
+        periods = self._periods(field_name, kind, order, tz) if kind in ('year', 'month', 'day') else None
+        if periods is None:
+            return super().datetimes(field_name, kind, order, tzinfo, is_dst)
+        return periods
+
+
+@functools.cache
+def _indexed_dates_class(queryset_class):
+    return type(queryset_class.__name__, (IndexedDatesMixin, queryset_class), {})
+
+
+class LargeTableChangeList(ChangeList):
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if not isinstance(queryset, IndexedDatesMixin):
+            queryset = queryset._chain()
+            queryset.__class__ = _indexed_dates_class(type(queryset))
+        return queryset
+
+
+class AutocompleteFilter(admin.RelatedFieldListFilter):
+    """Foreign-key filter with an autocomplete box; only the selected row is loaded"""
+    template = 'admin/assets/autocomplete_filter.html'
+    
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.form_field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            required=False,
+            widget=AutocompleteSelect(field, model_admin.admin_site, attrs={
+                'data-width': '100%',
+                # An empty value would be an invalid lookup; drop the parameter instead
+                'onchange': 'if (!this.value) this.disabled = true; this.form.submit()',
+            }),
+        )
+        # Everything else in the query string survives picking a value
+        dropped = {self.lookup_kwarg, self.lookup_kwarg_isnull, PAGE_VAR}
+        self.hidden_params = [
+            (key, value) for key, values in request.GET.lists() if key not in dropped for value in values
+        ]
+    
+    def field_choices(self, field, request, model_admin):
+        if self.lookup_val is None:
+            return []
+        try:
+            selected = field.remote_field.model._default_manager.filter(pk=self.lookup_val)
+            return [(obj.pk, str(obj)) for obj in selected]
+        except (ValueError, ValidationError):
+            return []
+    
+    def has_output(self):
+        return True
+    
+    def autocomplete(self):
+        return self.form_field.widget.render(self.lookup_kwarg, self.lookup_val)
+
+
+class StatusClassFilter(admin.SimpleListFilter):
+    """Status codes by class, without a DISTINCT over the whole log"""
+    title = 'status'
+    parameter_name = 'status_class'
+    
+    def lookups(self, request, model_admin):
+        return [(str(digit), f'{digit}xx') for digit in range(1, 6)]
+    
+    def queryset(self, request, queryset):
+        if self.value() in {str(digit) for digit in range(1, 6)}:
+            low = int(self.value()) * 100
+            return queryset.filter(status_code__gte=low, status_code__lt=low + 100)
+        return queryset
+
+
+class MethodFilter(admin.SimpleListFilter):
+    title = 'method'
+    parameter_name = 'method'
+    
+    def lookups(self, request, model_admin):
+        return [(method, method) for method in HTTP_METHODS]
+    
+    def queryset(self, request, queryset):
+        return queryset.filter(method=self.value()) if self.value() else queryset
+
+
+class AutocompleteFilterAdmin(admin.ModelAdmin):
+    """Loads the scripts AutocompleteFilter needs on the changelist"""
+    
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(None, self.admin_site).media
+
+
+class LargeTableAdmin(AutocompleteFilterAdmin):
+    """Changelist settings for tables too large to count or scan per page view"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def get_changelist(self, request, **kwargs):
+        return LargeTableChangeList
+
+
+@admin.register(OrgNode)
+class OrgNodeAdmin(AutocompleteFilterAdmin):
+    list_display = ['name', 'code', 'level', 'parent', 'updated_at']
+    list_select_related = ['parent']
+    list_filter = ['level', ('parent', AutocompleteFilter)]
+    autocomplete_fields = ['parent']
+    search_fields = ['name', 'code']
+
+
 @admin.register(Base)
-class BaseAdmin(admin.ModelAdmin):
-    list_display = ['name', 'code', 'location', 'created_at', 'is_deleted']
-    list_filter = ['is_deleted', 'created_at']
+class BaseAdmin(AutocompleteFilterAdmin):
+    list_display = ['name', 'code', 'location', 'org_node', 'created_at', 'is_deleted']
+    list_select_related = ['org_node']
+    list_filter = ['is_deleted', 'created_at', ('org_node', AutocompleteFilter)]
+    autocomplete_fields = ['org_node']
     search_fields = ['name', 'code', 'location']
 
 
 @admin.register(EquipmentType)
 class EquipmentTypeAdmin(admin.ModelAdmin):
-    list_display = ['name', 'unit', 'created_at', 'is_deleted']
-    list_filter = ['is_deleted', 'created_at']
+    list_display = ['name', 'unit', 'minimum_stock', 'is_serialized', 'lot_policy', 'created_at', 'is_deleted']
+    list_filter = ['is_deleted', 'is_serialized', 'lot_policy', 'created_at']
     search_fields = ['name', 'description']
 
 
 @admin.register(Inventory)
-class InventoryAdmin(admin.ModelAdmin):
+class InventoryAdmin(LargeTableAdmin):
     list_display = ['base', 'equipment_type', 'quantity', 'updated_at']
-    list_filter = ['base', 'equipment_type']
+    list_select_related = ['base', 'equipment_type']
+    list_filter = [('base', AutocompleteFilter), ('equipment_type', AutocompleteFilter)]
+    autocomplete_fields = ['base', 'equipment_type']
     search_fields = ['base__name', 'equipment_type__name']
 
 
 @admin.register(Purchase)
-class PurchaseAdmin(admin.ModelAdmin):
+class PurchaseAdmin(LargeTableAdmin):
     list_display = ['base', 'equipment_type', 'quantity', 'supplier', 'purchase_date', 'created_by']
-    list_filter = ['base', 'equipment_type', 'purchase_date', 'is_deleted']
+    list_select_related = ['base', 'equipment_type', 'created_by']
+    list_filter = [('base', AutocompleteFilter), ('equipment_type', AutocompleteFilter), 'purchase_date', 'is_deleted']
+    autocomplete_fields = ['base', 'equipment_type', 'created_by']
     search_fields = ['supplier', 'base__name', 'equipment_type__name']
     date_hierarchy = 'purchase_date'
 
 
 @admin.register(Transfer)
-class TransferAdmin(admin.ModelAdmin):
+class TransferAdmin(LargeTableAdmin):
     list_display = ['from_base', 'to_base', 'equipment_type', 'quantity', 'status', 'transfer_date']
-    list_filter = ['status', 'from_base', 'to_base', 'transfer_date', 'is_deleted']
+    list_select_related = ['from_base', 'to_base', 'equipment_type']
+    list_filter = [
+        'status', ('from_base', AutocompleteFilter), ('to_base', AutocompleteFilter), 'transfer_date', 'is_deleted'
+    ]
+    autocomplete_fields = ['from_base', 'to_base', 'equipment_type', 'created_by']
     search_fields = ['from_base__name', 'to_base__name', 'equipment_type__name']
     date_hierarchy = 'transfer_date'
 
 
 @admin.register(Assignment)
-class AssignmentAdmin(admin.ModelAdmin):
+class AssignmentAdmin(LargeTableAdmin):
     list_display = ['base', 'equipment_type', 'personnel_name', 'assigned_quantity', 'returned_quantity', 'assignment_date']
-    list_filter = ['base', 'equipment_type', 'assignment_date', 'is_deleted']
+    list_select_related = ['base', 'equipment_type']
+    list_filter = [('base', AutocompleteFilter), ('equipment_type', AutocompleteFilter), 'assignment_date', 'is_deleted']
+    autocomplete_fields = ['base', 'equipment_type', 'created_by']
     search_fields = ['personnel_name', 'personnel_id', 'base__name', 'equipment_type__name']
     date_hierarchy = 'assignment_date'
 
 
 @admin.register(Expenditure)
-class ExpenditureAdmin(admin.ModelAdmin):
+class ExpenditureAdmin(LargeTableAdmin):
     list_display = ['base', 'equipment_type', 'quantity', 'expenditure_date', 'created_by']
-    list_filter = ['base', 'equipment_type', 'expenditure_date', 'is_deleted']
+    list_select_related = ['base', 'equipment_type', 'created_by']
+    list_filter = [('base', AutocompleteFilter), ('equipment_type', AutocompleteFilter), 'expenditure_date', 'is_deleted']
+    autocomplete_fields = ['base', 'equipment_type', 'created_by']
     search_fields = ['reason', 'base__name', 'equipment_type__name']
     date_hierarchy = 'expenditure_date'
 
 
+@admin.register(SerializedAsset)
+class SerializedAssetAdmin(LargeTableAdmin):
+    list_display = ['serial_number', 'equipment_type', 'base', 'status', 'assignee', 'updated_at']
+    list_select_related = ['equipment_type', 'base']
+    list_filter = ['status', ('base', AutocompleteFilter), ('equipment_type', AutocompleteFilter)]
+    autocomplete_fields = ['equipment_type', 'base']
+    search_fields = ['=serial_number']
+    
+    # Items change through the API so Inventory follows them
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockLot)
+class StockLotAdmin(LargeTableAdmin):
+    list_display = ['lot_number', 'equipment_type', 'base', 'remaining', 'quantity', 'expires_at', 'recalled']
+    list_select_related = ['equipment_type', 'base']
+    list_filter = ['recalled', ('base', AutocompleteFilter), ('equipment_type', AutocompleteFilter), 'expires_at']
+    autocomplete_fields = ['equipment_type', 'base']
+    search_fields = ['=lot_number']
+    readonly_fields = [
+        'base', 'equipment_type', 'purchase', 'lot_number', 'received_at', 'quantity', 'remaining',
+        'created_at', 'updated_at'
+    ]
+    
+    # Lots are opened and drawn by the transactions (assets/lots.py)
+    def has_add_permission(self, request):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockThreshold)
+class StockThresholdAdmin(AutocompleteFilterAdmin):
+    list_display = ['base', 'equipment_type', 'minimum', 'resolve_at', 'target', 'updated_at']
+    list_select_related = ['base', 'equipment_type']
+    list_filter = [('base', AutocompleteFilter), ('equipment_type', AutocompleteFilter)]
+    autocomplete_fields = ['base', 'equipment_type']
+
+
+@admin.register(TransferCost)
+class TransferCostAdmin(AutocompleteFilterAdmin):
+    list_display = ['from_base', 'to_base', 'cost', 'updated_at']
+    list_select_related = ['from_base', 'to_base']
+    list_filter = [('from_base', AutocompleteFilter), ('to_base', AutocompleteFilter)]
+    autocomplete_fields = ['from_base', 'to_base']
+
+
+@admin.register(StockAlert)
+class StockAlertAdmin(LargeTableAdmin):
+    list_display = ['base', 'equipment_type', 'minimum', 'lowest_quantity', 'opened_at', 'resolved_at']
+    list_select_related = ['base', 'equipment_type']
+    list_filter = [('base', AutocompleteFilter), ('equipment_type', AutocompleteFilter), 'opened_at']
+    readonly_fields = [
+        'base', 'equipment_type', 'minimum', 'quantity', 'lowest_quantity',
+        'opened_at', 'resolved_at', 'resolved_quantity'
+    ]
+
+
 @admin.register(UserRole)
-class UserRoleAdmin(admin.ModelAdmin):
-    list_display = ['user', 'role', 'assigned_base', 'created_at']
-    list_filter = ['role', 'assigned_base']
+class UserRoleAdmin(AutocompleteFilterAdmin):
+    list_display = ['user', 'role', 'assigned_base', 'assigned_node', 'created_at']
+    list_select_related = ['user', 'assigned_base', 'assigned_node']
+    list_filter = ['role', ('assigned_base', AutocompleteFilter), ('assigned_node', AutocompleteFilter)]
+    autocomplete_fields = ['user', 'assigned_base', 'assigned_node']
     search_fields = ['user__username', 'user__email']
 
 
@@ -74,9 +418,10 @@ class RoleCodeAdmin(admin.ModelAdmin):
 
 
 @admin.register(APILog)
-class APILogAdmin(admin.ModelAdmin):
+class APILogAdmin(LargeTableAdmin):
     list_display = ['user', 'method', 'endpoint', 'status_code', 'timestamp']
-    list_filter = ['method', 'status_code', 'timestamp']
+    list_select_related = ['user']
+    list_filter = [MethodFilter, StatusClassFilter, 'timestamp']
     search_fields = ['endpoint', 'user__username']
     date_hierarchy = 'timestamp'
     readonly_fields = ['user', 'endpoint', 'method', 'status_code', 'request_body', 'response_body', 'ip_address', 'timestamp']
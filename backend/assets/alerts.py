@@ -0,0 +1,86 @@
+"""
+Low-stock alerts, evaluated in the inventory write path.
+
+Thresholds come from ``StockThreshold`` per (base, equipment type), falling
+back to ``EquipmentType.minimum_stock``; both are read from the reference
+cache, so a write to a pair without a threshold costs nothing extra. For a
+pair with one, the new quantity is read back and compared:
+
+- below ``minimum``: an alert opens, or the open one records the new low
+- at or above ``resolve_at``: the open alert resolves
+- in between: nothing changes, so stock hovering around the minimum
+  does not open and resolve alerts over and over
+
+At most one alert per pair is open (a partial unique constraint).
+Openings and resolutions are published as ``alert`` events
+(assets/events.py).
+Nothing ever scans the whole inventory.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from . import reference
+from .events import publish
+from .models import StockAlert, quantity_value
+
+
+def levels(base_id, equipment_type_id):
+    """``(minimum, resolve_at)`` for a pair, or None if it has no threshold"""
+    thresholds = reference.stock_thresholds()
+    return thresholds['pairs'].get((base_id, equipment_type_id)) or thresholds['defaults'].get(equipment_type_id)
+
+
+def _publish(alert, state):
+    publish({
+        'type': 'alert',
+        'base_ids': [alert.base_id],
+        'id': alert.pk,
+        'state': state,
+        'base_id': alert.base_id,
+        'equipment_type_id': alert.equipment_type_id,
+        'minimum': str(alert.minimum),
+        'quantity': str(alert.resolved_quantity if state == 'resolved' else alert.lowest_quantity),
+    })
+
+
+def evaluate(base_id, equipment_type_id, quantity):
+    """Open, update or resolve the pair's alert for its new ``quantity``"""
+    pair_levels = levels(base_id, equipment_type_id)
+    if pair_levels is None or quantity is None:
+        return
+    minimum, resolve_at = pair_levels
+    open_alerts = StockAlert.objects.filter(
+        base_id=base_id, equipment_type_id=equipment_type_id, resolved_at__isnull=True
+    )
+
+    if quantity < minimum:
+        if open_alerts.update(lowest_quantity=Least(F('lowest_quantity'), quantity_value(quantity))):
+            return
+        try:
+            with transaction.atomic():
+                alert = StockAlert.objects.create(
+                    base_id=base_id, equipment_type_id=equipment_type_id, minimum=minimum,
+                    quantity=quantity, lowest_quantity=quantity
+                )
+        except IntegrityError:
+            # Opened concurrently by another write
+            open_alerts.update(lowest_quantity=Least(F('lowest_quantity'), quantity_value(quantity)))
+            return
+        _publish(alert, 'opened')
+    elif quantity >= resolve_at:
+        now = timezone.now()
+        if open_alerts.update(resolved_at=now, resolved_quantity=quantity):
+            alert = StockAlert.objects.filter(
+                base_id=base_id, equipment_type_id=equipment_type_id, resolved_at=now
+            ).first()
+            if alert is not None:
+                _publish(alert, 'resolved')
+
+
+def evaluate_many(rows):
+    """evaluate() for ``(base_id, equipment_type_id, quantity)`` rows, skipping pairs without a threshold"""
+    for base_id, equipment_type_id, quantity in rows:
+        if levels(base_id, equipment_type_id) is not None:
+            evaluate(base_id, equipment_type_id, quantity)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AssetsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'assets'
+
+    def ready(self):
+        from . import reference, sharding, tasks  # noqa: F401 (tasks registers job handlers)
+        reference.connect_signals()
+        sharding.connect_signals()
@@ -0,0 +1,84 @@
+"""
+Write-behind buffers.
+
+Hot paths hand small writes (a last-login timestamp, a revoked token) to
+a ``BatchWriter`` instead of hitting the database. A daemon thread
+flushes the buffer every ``interval`` seconds, or sooner once
+``max_size`` items are waiting, in one bulk statement. Anything still
+buffered is flushed at interpreter exit; a hard crash loses at most one
+interval of writes.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from django.db import DatabaseError, connection
+
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    def __init__(self, name, flush, interval=5.0, max_size=500):
+        """``flush(items)`` receives the buffered dict's values in one call"""
+        self.name = name
+        self.flush_items = flush
+        self.interval = interval
+        self.max_size = max_size
+        self._items = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    def add(self, key, item):
+        """Buffer ``item``; a later item with the same key replaces it"""
+        with self._lock:
+            self._items[key] = item
+            size = len(self._items)
+            self._ensure_thread()
+        if size >= self.max_size:
+            self._wake.set()
+
+    def pending(self, key):
+        """The buffered item for ``key``, or None once flushed"""
+        with self._lock:
+            return self._items.get(key)
+
+    def pending_items(self):
+        with self._lock:
+            return list(self._items.values())
+
+    def flush(self):
+        with self._lock:
+            items, self._items = self._items, {}
+        if not items:
+            return 0
+        try:
+            self.flush_items(list(items.values()))
+        except DatabaseError:
+            logger.exception('Flushing %s failed; keeping %s items for the next attempt', self.name, len(items))
+            with self._lock:
+                for key, item in items.items():
+                    self._items.setdefault(key, item)
+            return 0
+        return len(items)
+
+    def _ensure_thread(self):
+        # Threads do not survive a fork, so each process starts its own
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name=f'batch-{self.name}', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                connection.close()
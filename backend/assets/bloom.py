@@ -0,0 +1,47 @@
+"""
+Bloom filter over strings.
+
+A fixed-size bit array with ``hash_count`` probes per item derived from
+one BLAKE2b digest (double hashing). Membership answers are "definitely
+not present" or "probably present"; the false positive rate for the
+configured capacity is ``error_rate``.
+"""
+import hashlib
+import math
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001, bits=None, hash_count=None):
+        capacity = max(1, int(capacity))
+        size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.capacity = capacity
+        self.size = size if bits is None else len(bits) * 8
+        self.hash_count = hash_count or max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8) if bits is None else bytearray(bits)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        """Add ``item``; returns False if it was (probably) present already"""
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def saturated(self):
+        """Whether more items were added than the filter was sized for"""
+        return self.count > self.capacity
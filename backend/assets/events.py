@@ -0,0 +1,411 @@
+"""
+Server-sent events for inventory and transfer-status changes.
+
+``GET /api/v1/events/`` is served straight from the ASGI application
+(military_ams/asgi.py) as a ``text/event-stream`` that stays open. A
+connection is one coroutine waiting on a small queue, so a worker can
+hold thousands of idle dashboards without a thread or database
+connection each.
+
+- The write path calls ``publish_inventory`` / ``publish_transfer``.
+  Events are sent after the transaction commits, so listeners never
+  hear about writes that were rolled back.
+- Events go through a relay to every ASGI worker on the host: PostgreSQL
+  LISTEN/NOTIFY when default is PostgreSQL, otherwise a Unix datagram
+  socket per worker in EVENTS_SOCKET_DIR. ``EVENTS_RELAY=local`` keeps
+  events inside the publishing process.
+- Each worker's ``Hub`` fans an event out to the connections whose scope
+  covers it: base commanders only receive events of their bases.
+- A client that falls EVENTS_QUEUE_SIZE events behind gets a ``resync``
+  event instead of the backlog and should catch up through /sync/.
+
+Browsers' EventSource cannot send headers, so the access token may be
+passed as ``?token=``. A stream lasts as long as its token: when the
+token expires the client gets ``resync`` and the stream ends, so it
+reconnects with a fresh token. Every heartbeat re-reads the user; a
+deactivated user's stream ends, and a changed scope takes effect with a
+``resync``.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, transaction
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'assets_events'
+
+
+def relay_mode():
+    mode = settings.EVENTS_RELAY
+    if mode == 'auto':
+        return 'postgres' if connections['default'].vendor == 'postgresql' else 'unix'
+    return mode
+
+
+class Subscription:
+    def __init__(self, base_ids):
+        # None: every base
+        self.base_ids = None if base_ids is None else frozenset(base_ids)
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def wants(self, event):
+        return self.base_ids is None or not self.base_ids.isdisjoint(event['base_ids'])
+
+
+class Hub:
+    """Fans events out to this process's open streams"""
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.loop = None
+        self._listener = None
+
+    def subscribe(self, base_ids):
+        subscription = Subscription(base_ids)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    def dispatch(self, event):
+        for subscription in self.subscriptions:
+            if subscription.overflowed or not subscription.wants(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+
+    def dispatch_payload(self, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning('Dropped malformed event %r', payload[:200])
+            return
+        self.dispatch(event)
+
+    def dispatch_threadsafe(self, event):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.dispatch, event)
+
+    async def start(self):
+        if self.loop is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        mode = relay_mode()
+        if mode == 'postgres':
+            self._listener = PostgresListener(self)
+        elif mode == 'unix':
+            self._listener = UnixSocketListener(self)
+        if self._listener is not None:
+            await self._listener.start()
+
+    async def stop(self):
+        if self._listener is not None:
+            await self._listener.stop()
+            self._listener = None
+        self.loop = None
+
+
+hub = Hub()
+
+
+class PostgresListener:
+    """LISTEN on a dedicated connection, read from the event loop without a thread"""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.connection = None
+        self._task = None
+
+    def _connect(self):
+        wrapper = connections.create_connection('default')
+        connection = wrapper.get_new_connection(wrapper.get_connection_params())
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+        return connection
+
+    def _readable(self):
+        try:
+            self.connection.poll()
+        except Exception:
+            logger.exception('Event listener connection lost')
+            self.hub.loop.remove_reader(self.connection.fileno())
+            self._task = self.hub.loop.create_task(self._reconnect())
+            return
+        while self.connection.notifies:
+            self.hub.dispatch_payload(self.connection.notifies.pop(0).payload)
+
+    async def _reconnect(self):
+        delay = 1
+        while True:
+            try:
+                await self.start()
+                return
+            except Exception:
+                logger.exception('Could not LISTEN for events, retrying in %ss', delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    async def start(self):
+        self.connection = await sync_to_async(self._connect, thread_sensitive=False)()
+        self.hub.loop.add_reader(self.connection.fileno(), self._readable)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self.connection is not None and not self.connection.closed:
+            self.hub.loop.remove_reader(self.connection.fileno())
+            self.connection.close()
+
+
+class UnixSocketListener:
+    """A datagram socket per worker; publishers send each event to every socket in the directory"""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.path = os.path.join(settings.EVENTS_SOCKET_DIR, f'{os.getpid()}.sock')
+        self.socket = None
+
+    def _readable(self):
+        while True:
+            try:
+                payload = self.socket.recv(65536)
+            except BlockingIOError:
+                return
+            self.hub.dispatch_payload(payload)
+
+    async def start(self):
+        os.makedirs(settings.EVENTS_SOCKET_DIR, mode=0o700, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.socket.bind(self.path)
+        self.socket.setblocking(False)
+        self.hub.loop.add_reader(self.socket.fileno(), self._readable)
+
+    async def stop(self):
+        self.hub.loop.remove_reader(self.socket.fileno())
+        self.socket.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def _send_unix(payload):
+    try:
+        names = os.listdir(settings.EVENTS_SOCKET_DIR)
+    except FileNotFoundError:
+        return
+    sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sender.setblocking(False)
+    try:
+        for name in names:
+            if not name.endswith('.sock'):
+                continue
+            path = os.path.join(settings.EVENTS_SOCKET_DIR, name)
+            try:
+                sender.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a worker that exited
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                logger.warning('Event dropped for %s: receive buffer full', path)
+    finally:
+        sender.close()
+
+
+def _deliver(event):
+    mode = relay_mode()
+    payload = json.dumps(event, separators=(',', ':'))
+    try:
+        if mode == 'postgres':
+            with connections['default'].cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+        elif mode == 'unix':
+            _send_unix(payload.encode())
+        else:
+            hub.dispatch_threadsafe(event)
+    except Exception:
+        # Events are best-effort; the write has already committed
+        logger.exception('Could not publish %s event', event['type'])
+
+
+def publish(event, using='default'):
+    """Send ``event`` to every stream once the current transaction on ``using`` commits"""
+    transaction.on_commit(lambda: _deliver(event), using=using)
+
+
+def publish_inventory(base_id, equipment_type_id, delta, using='default'):
+    publish({
+        'type': 'inventory',
+        'base_ids': [base_id],
+        'base_id': base_id,
+        'equipment_type_id': equipment_type_id,
+        'delta': str(delta),
+    }, using=using)
+
+
+def publish_transfer(transfer, previous_status=None):
+    publish({
+        'type': 'transfer',
+        'base_ids': [transfer.from_base_id, transfer.to_base_id],
+        'id': transfer.pk,
+        'from_base_id': transfer.from_base_id,
+        'to_base_id': transfer.to_base_id,
+        'equipment_type_id': transfer.equipment_type_id,
+        'status': transfer.status,
+        'previous_status': previous_status,
+    }, using=transfer._state.db or 'default')
+
+
+def _frame(event_type, data):
+    return f'event: {event_type}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+
+def _authenticate(token):
+    """
+    (user, base ids in scope or None for all, expiry as a Unix time) for a
+    raw access token, or None
+    """
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+    from .hierarchy import user_scope
+
+    authentication = JWTAuthentication()
+    try:
+        validated = authentication.get_validated_token(token)
+        user = authentication.get_user(validated)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return user, user_scope(user), validated['exp']
+
+
+def _reauthorize(user_id):
+    """(user, base ids in scope) for a stream's user, or None once they are deactivated"""
+    from django.contrib.auth.models import User
+    from .hierarchy import user_scope
+
+    user = User.objects.select_related('role').filter(pk=user_id, is_active=True).first()
+    if user is None:
+        return None
+    return user, user_scope(user)
+
+
+def _token(scope):
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            kind, _, token = value.decode('latin-1').partition(' ')
+            if kind.lower() == 'bearer':
+                return token.strip()
+    return (parse_qs(scope.get('query_string', b'').decode('latin-1')).get('token') or [None])[0]
+
+
+def _cors_headers(scope):
+    origin = next((value for name, value in scope.get('headers', []) if name == b'origin'), None)
+    if origin is None:
+        return []
+    if settings.CORS_ALLOW_ALL_ORIGINS or origin.decode('latin-1') in settings.CORS_ALLOWED_ORIGINS:
+        return [(b'access-control-allow-origin', origin), (b'access-control-allow-credentials', b'true'), (b'vary', b'Origin')]
+    return []
+
+
+async def _reject(send, scope, status, detail):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), *_cors_headers(scope)],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps({'detail': detail}).encode()})
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream(scope, receive, send):
+    """ASGI application for GET /api/v1/events/"""
+    if scope['method'] not in ('GET', 'HEAD'):
+        await _reject(send, scope, 405, 'Method not allowed.')
+        return
+    token = _token(scope)
+    identity = await sync_to_async(_authenticate)(token) if token else None
+    if identity is None:
+        await _reject(send, scope, 401, 'Authentication credentials were not provided or are invalid.')
+        return
+    user, base_ids, expires_at = identity
+
+    await hub.start()
+    subscription = hub.subscribe(base_ids)
+    disconnected = asyncio.ensure_future(_disconnected(receive))
+    pending = None
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # Stop nginx from buffering the stream
+                (b'x-accel-buffering', b'no'),
+                *_cors_headers(scope),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+        while True:
+            if subscription.overflowed:
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.overflowed = False
+                await send({'type': 'http.response.body', 'body': _frame('resync', {}), 'more_body': True})
+            pending = pending or asyncio.ensure_future(subscription.queue.get())
+            timeout = min(settings.EVENTS_HEARTBEAT_SECONDS, max(expires_at - time.time(), 0))
+            done, _ = await asyncio.wait({pending, disconnected}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                return
+            if pending in done:
+                event = pending.result()
+                pending = None
+                data = {key: value for key, value in event.items() if key not in ('type', 'base_ids')}
+                body = _frame(event['type'], data)
+            elif time.time() >= expires_at:
+                # The client reconnects with a fresh token and catches up
+                await send({'type': 'http.response.body', 'body': _frame('resync', {}), 'more_body': False})
+                return
+            else:
+                identity = await sync_to_async(_reauthorize)(user.pk)
+                if identity is None:
+                    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                    return
+                user, base_ids = identity
+                base_ids = None if base_ids is None else frozenset(base_ids)
+                if base_ids != subscription.base_ids:
+                    # Events queued under the old scope are dropped; the resync covers them
+                    subscription.base_ids = base_ids
+                    subscription.overflowed = True
+                    pending.cancel()
+                    pending = None
+                    continue
+                body = b': keep-alive\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        hub.unsubscribe(subscription)
+        for task in (pending, disconnected):
+            if task is not None:
+                task.cancel()
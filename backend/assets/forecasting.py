@@ -0,0 +1,211 @@
+"""
+Consumption rates and days-of-supply for every (base, equipment type).
+
+Daily consumption (expenditures plus outstanding assignments) over the
+last FORECAST_HISTORY_DAYS is summed by the database in one UNION ALL
+query per shard and loaded into a pairs x days NumPy matrix, from which
+every pair's figures are computed at once:
+
+- ``rate_7d`` / ``rate_28d``: mean daily consumption over the last 7 and
+  28 days (from cumulative sums)
+- ``trend``: least-squares slope of daily consumption over the whole
+  window, in units per day per day
+- ``days_of_supply``: current stock over ``rate_28d``; None when nothing
+  was consumed
+
+The rates are cached per process and rebuilt when the date changes or
+when an expenditure or assignment is written, detected through the
+highest ``change_seq`` of those tables (one indexed MAX per shard), so
+the cache stays correct across processes. Stock is read fresh on every
+call.
+"""
+import threading
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F, Max, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from . import reference
+from .models import Assignment, Expenditure, Inventory
+from .sharding import owned_by, sharding_enabled
+
+
+WINDOWS = (7, 28)
+
+# Stock-outs further away than this get no date
+MAX_FORECAST_DAYS = 3650
+
+# (model, date field, consumed quantity)
+CONSUMPTION = [
+    (Expenditure, 'expenditure_date', F('quantity')),
+    (Assignment, 'assignment_date', F('assigned_quantity') - F('returned_quantity')),
+]
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def _aliases():
+    return list(settings.SHARDS) if sharding_enabled() else [None]
+
+
+def _watermark():
+    """Changes whenever consumption history is written on any shard"""
+    return tuple(
+        model.objects.using(alias).aggregate(last=Max('change_seq'))['last']
+        for alias in _aliases()
+        for model, _, _ in CONSUMPTION
+    )
+
+
+def _consumption_rows(start, end):
+    """(base_id, equipment_type_id, day, total) rows, one UNION ALL query per shard"""
+    for alias in _aliases():
+        querysets = []
+        for model, date_field, quantity in CONSUMPTION:
+            queryset = owned_by(model.objects.all(), alias).filter(**{
+                'is_deleted': False,
+                f'{date_field}__gte': start,
+                f'{date_field}__lt': end,
+            })
+            querysets.append(queryset.order_by().annotate(day=TruncDay(date_field)).values_list(
+                'base_id', 'equipment_type_id', 'day'
+            ).annotate(total=Sum(quantity)))
+        yield from querysets[0].union(*querysets[1:], all=True)
+
+
+def _date(day, tz):
+    if isinstance(day, datetime):
+        return timezone.localtime(day, tz).date() if timezone.is_aware(day) else day.date()
+    return day
+
+
+def _pair_keys(base_ids, equipment_type_ids):
+    return base_ids.astype(np.int64) << 32 | equipment_type_ids.astype(np.int64)
+
+
+def compute_rates(history_days, today):
+    """Rates for every pair with consumption in the window ending with ``today``"""
+    tz = timezone.get_current_timezone()
+    first_day = today - timedelta(days=history_days - 1)
+    start = timezone.make_aware(datetime.combine(first_day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(today + timedelta(days=1), time.min), tz)
+
+    rows = list(_consumption_rows(start, end))
+    base_ids, equipment_type_ids, days, totals = zip(*rows) if rows else ((), (), (), ())
+    day_index = np.fromiter(((_date(day, tz) - first_day).days for day in days), dtype=np.int64, count=len(days))
+    keys, pair_index = np.unique(
+        _pair_keys(np.array(base_ids, dtype=np.int64), np.array(equipment_type_ids, dtype=np.int64)),
+        return_inverse=True
+    )
+
+    consumption = np.zeros((len(keys), history_days))
+    np.add.at(consumption, (pair_index, day_index), np.array(totals, dtype=float))
+
+    cumulative = np.cumsum(consumption, axis=1)
+    rates = {}
+    for window in WINDOWS:
+        span = min(window, history_days)
+        before = cumulative[:, -span - 1] if span < history_days else 0
+        rates[window] = (cumulative[:, -1] - before) / span
+
+    t = np.arange(history_days) - (history_days - 1) / 2
+    trend = consumption @ t / (t @ t) if history_days > 1 else np.zeros(len(keys))
+    return {'keys': keys, 'rates': rates, 'trend': trend}
+
+
+def cached_rates(history_days=None):
+    history_days = history_days or settings.FORECAST_HISTORY_DAYS
+    today = timezone.localdate()
+    key = (history_days, today, _watermark())
+    with _lock:
+        entry = _cache.get(history_days)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+    rates = compute_rates(history_days, today)
+    with _lock:
+        _cache[history_days] = (key, rates)
+    return rates
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+
+
+def _stock(base_ids):
+    """(base_id, equipment_type_id, quantity) rows for the given bases (None: all)"""
+    rows = []
+    for alias in _aliases():
+        queryset = owned_by(Inventory.objects.all(), alias)
+        if base_ids is not None:
+            queryset = queryset.filter(base_id__in=base_ids)
+        rows.extend(queryset.values_list('base_id', 'equipment_type_id', 'quantity'))
+    return rows
+
+
+def forecast(base_ids=None, equipment_type_id=None, max_days=None, history_days=None):
+    """
+    Days-of-supply rows for every stocked or consumed pair, soonest
+    stock-out first. ``max_days`` keeps pairs running out within that many days.
+    """
+    rates = cached_rates(history_days)
+    stock = _stock(base_ids)
+
+    stock_keys = _pair_keys(
+        np.fromiter((row[0] for row in stock), dtype=np.int64, count=len(stock)),
+        np.fromiter((row[1] for row in stock), dtype=np.int64, count=len(stock)),
+    )
+    quantities = np.fromiter((row[2] for row in stock), dtype=float, count=len(stock))
+
+    keys = np.union1d(stock_keys, rates['keys'])
+    if base_ids is not None:
+        keys = keys[np.isin(keys >> 32, np.asarray(list(base_ids), dtype=np.int64))]
+    if equipment_type_id is not None:
+        keys = keys[(keys & 0xFFFFFFFF) == int(equipment_type_id)]
+
+    quantity = np.zeros(len(keys))
+    found = np.isin(stock_keys, keys)
+    quantity[np.searchsorted(keys, stock_keys[found])] = quantities[found]
+
+    # Rates aligned with keys; pairs without consumption get zeros
+    position = np.searchsorted(rates['keys'], keys).clip(max=max(len(rates['keys']) - 1, 0))
+    present = rates['keys'][position] == keys if len(rates['keys']) else np.zeros(len(keys), dtype=bool)
+
+    def aligned(values):
+        out = np.zeros(len(keys))
+        out[present] = values[position[present]]
+        return out
+
+    rate_short, rate_long = (aligned(rates['rates'][window]) for window in WINDOWS)
+    trend = aligned(rates['trend'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_supply = np.where(rate_long > 0, np.maximum(quantity, 0) / rate_long, np.inf)
+
+    order = np.argsort(days_of_supply, kind='stable')
+    if max_days is not None:
+        order = order[days_of_supply[order] <= max_days]
+
+    bases = reference.bases()
+    equipment_types = reference.equipment_types()
+    today = timezone.localdate()
+    results = []
+    for i in order:
+        base, equipment_type = int(keys[i] >> 32), int(keys[i] & 0xFFFFFFFF)
+        days = float(days_of_supply[i])
+        results.append({
+            'base_id': base,
+            'base_name': bases.get(base, {}).get('name'),
+            'equipment_type_id': equipment_type,
+            'equipment_name': equipment_types.get(equipment_type, {}).get('name'),
+            'quantity': round(float(quantity[i]), 2),
+            f'rate_{WINDOWS[0]}d': round(float(rate_short[i]), 3),
+            f'rate_{WINDOWS[1]}d': round(float(rate_long[i]), 3),
+            'trend': round(float(trend[i]), 4),
+            'days_of_supply': round(days, 1) if days != np.inf else None,
+            'stockout_date': (today + timedelta(days=int(days))).isoformat() if days < MAX_FORECAST_DAYS else None,
+        })
+    return results
@@ -0,0 +1,42 @@
+"""
+Organizational hierarchy: theater -> region -> command -> base.
+
+OrgNode rows form the tree and OrgNodeClosure holds every (ancestor,
+descendant) pair, so the bases beneath any node are one indexed join
+(closure -> base.org_node) however deep the tree is. Dashboard, series
+and inventory endpoints take a ``node_id`` to roll up those bases.
+
+Base commanders see their assigned base plus every base beneath their
+assigned node.
+"""
+from .models import Base, UserRole
+
+
+def bases_under(node_id):
+    """Bases attached to ``node_id`` or to any node beneath it"""
+    return Base.objects.filter(org_node__ancestor_links__ancestor_id=node_id)
+
+
+def base_ids_under(node_id):
+    # The tree lives on default only
+    return list(bases_under(node_id).using('default').values_list('id', flat=True))
+
+
+def scope_base_ids(user_role):
+    """Ids of the bases a base commander may see; None for roles that see every base"""
+    if user_role.role != 'base_commander':
+        return None
+    base_ids = base_ids_under(user_role.assigned_node_id) if user_role.assigned_node_id else []
+    if user_role.assigned_base_id is not None and user_role.assigned_base_id not in base_ids:
+        base_ids.append(user_role.assigned_base_id)
+    return base_ids
+
+
+def user_scope(user):
+    """scope_base_ids() for ``user``; None when the user has no role"""
+    try:
+        user_role = user.role
+    except UserRole.DoesNotExist:
+        return None
+    return scope_base_ids(user_role)
+
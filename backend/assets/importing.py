@@ -0,0 +1,432 @@
+"""
+Streaming CSV import of historical transactions.
+
+Backfills purchases, transfers, assignments and expenditures from legacy
+exports without going through the API:
+
+- Files are read with ``csv.reader`` one batch of records at a time, so
+  memory stays flat whatever the file size.
+- Each batch is validated column by column rather than row by row.
+  Base codes and equipment type names resolve through dictionaries
+  loaded once, and each distinct date string is parsed once per import.
+  Valid rows go in with ``bulk_create``. Rejected rows are reported
+  with their line number and never stop the import.
+- Each batch commits together with its ``ImportCheckpoint``. A failed
+  import resumes after the last committed batch when it is run again
+  on the same file.
+- Inventory is not adjusted per row. The bases an import touched are
+  rebuilt once at the end by ``reconcile(repair=True)``. They stay
+  recorded on the checkpoint until that succeeds, so an interrupted
+  rebuild also resumes.
+
+Column headers match the model fields, with ``base``, ``from_base`` and
+``to_base`` given as base codes and ``equipment_type`` as the equipment
+type name. Serialized equipment types are rejected: their items are
+registered one by one through /serialized-assets/. Dates are ISO 8601 (``2021-03-04`` or ``2021-03-04T10:00``);
+naive values are read in TIME_ZONE.
+"""
+import csv
+import hashlib
+import itertools
+import os
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Assignment, Base, EquipmentType, Expenditure, ImportCheckpoint, Purchase, Transfer, next_change_seq
+)
+from .reconciliation import reconcile
+from .sharding import assign_ids, shard_for_base, sharding_enabled
+
+
+DEFAULT_BATCH_SIZE = 2000
+
+# Bytes hashed into a file's fingerprint
+FINGERPRINT_BYTES = 64 * 1024
+
+# Largest value the quantity fields (max_digits=10, decimal_places=2) hold
+MAX_QUANTITY = Decimal('99999999.99')
+CENT = Decimal('0.01')
+
+# kind -> (model, [(column, attribute, parser, required)])
+KINDS = {
+    'purchases': (Purchase, [
+        ('base', 'base_id', 'base', True),
+        ('equipment_type', 'equipment_type_id', 'equipment_type', True),
+        ('quantity', 'quantity', 'quantity', True),
+        ('supplier', 'supplier', 'text', True),
+        ('purchase_date', 'purchase_date', 'date', True),
+    ]),
+    'transfers': (Transfer, [
+        ('from_base', 'from_base_id', 'base', True),
+        ('to_base', 'to_base_id', 'base', True),
+        ('equipment_type', 'equipment_type_id', 'equipment_type', True),
+        ('quantity', 'quantity', 'quantity', True),
+        ('status', 'status', 'status', False),
+        ('transfer_date', 'transfer_date', 'date', True),
+    ]),
+    'assignments': (Assignment, [
+        ('base', 'base_id', 'base', True),
+        ('equipment_type', 'equipment_type_id', 'equipment_type', True),
+        ('personnel_name', 'personnel_name', 'text', True),
+        ('personnel_id', 'personnel_id', 'text', False),
+        ('assigned_quantity', 'assigned_quantity', 'quantity', True),
+        ('returned_quantity', 'returned_quantity', 'returned_quantity', False),
+        ('assignment_date', 'assignment_date', 'date', True),
+        ('return_date', 'return_date', 'date', False),
+    ]),
+    'expenditures': (Expenditure, [
+        ('base', 'base_id', 'base', True),
+        ('equipment_type', 'equipment_type_id', 'equipment_type', True),
+        ('quantity', 'quantity', 'quantity', True),
+        ('reason', 'reason', 'text', True),
+        ('expenditure_date', 'expenditure_date', 'date', True),
+    ]),
+}
+
+# Historical transfers default to completed so they count towards inventory
+DEFAULT_TRANSFER_STATUS = 'completed'
+TRANSFER_STATUSES = {value for value, _ in Transfer.STATUS_CHOICES}
+
+
+class ImportContext:
+    """Lookups shared by every batch of an import"""
+
+    def __init__(self, user=None):
+        self.user_id = user.pk if user is not None else None
+        self.bases = {
+            code.casefold(): base_id
+            for code, base_id in Base.objects.filter(is_deleted=False).values_list('code', 'id')
+        }
+        self.equipment_types = {}
+        # Serialized types are registered item by item (assets/serialized.py)
+        self.serialized_types = set()
+        for name, equipment_type_id, is_serialized in EquipmentType.objects.filter(is_deleted=False).values_list(
+            'name', 'id', 'is_serialized'
+        ):
+            if is_serialized:
+                self.serialized_types.add(name.casefold())
+            else:
+                self.equipment_types[name.casefold()] = equipment_type_id
+        self.dates = {}
+
+
+def _fail(errors, index, message):
+    # Keep the first problem found in a row
+    errors.setdefault(index, message)
+
+
+def _parse_reference(values, column, mapping, label, errors):
+    parsed = []
+    for index, value in enumerate(values):
+        found = mapping.get(value.casefold())
+        if found is None:
+            _fail(errors, index, f'{column}: unknown {label} {value!r}')
+        parsed.append(found)
+    return parsed
+
+
+def _parse_base(values, column, field, errors, context):
+    return _parse_reference(values, column, context.bases, 'base code', errors)
+
+
+def _parse_equipment_type(values, column, field, errors, context):
+    for index, value in enumerate(values):
+        if value.casefold() in context.serialized_types:
+            _fail(errors, index, f'{column}: {value!r} is tracked by serial number')
+    return _parse_reference(values, column, context.equipment_types, 'equipment type', errors)
+
+
+def _parse_date(values, column, field, errors, context):
+    cache = context.dates
+    parsed = []
+    for index, value in enumerate(values):
+        if not value:
+            parsed.append(None)
+            continue
+        if value not in cache:
+            try:
+                moment = datetime.fromisoformat(value)
+            except ValueError:
+                moment = None
+            else:
+                if timezone.is_naive(moment):
+                    moment = timezone.make_aware(moment)
+            cache[value] = moment
+        if cache[value] is None:
+            _fail(errors, index, f'{column}: invalid date {value!r}')
+        parsed.append(cache[value])
+    return parsed
+
+
+def _parse_decimal(values, column, errors, minimum):
+    parsed = []
+    for index, value in enumerate(values):
+        if not value:
+            parsed.append(None)
+            continue
+        try:
+            quantity = Decimal(value)
+        except InvalidOperation:
+            quantity = None
+        if quantity is None or not quantity.is_finite():
+            _fail(errors, index, f'{column}: invalid number {value!r}')
+        elif quantity < minimum:
+            _fail(errors, index, f'{column}: must be at least {minimum}')
+        elif quantity > MAX_QUANTITY:
+            _fail(errors, index, f'{column}: must be at most {MAX_QUANTITY}')
+        elif quantity.quantize(CENT) != quantity:
+            _fail(errors, index, f'{column}: more than 2 decimal places')
+        parsed.append(quantity)
+    return parsed
+
+
+def _parse_quantity(values, column, field, errors, context):
+    return _parse_decimal(values, column, errors, CENT)
+
+
+def _parse_returned_quantity(values, column, field, errors, context):
+    parsed = _parse_decimal(values, column, errors, Decimal('0'))
+    return [Decimal('0') if value is None else value for value in parsed]
+
+
+def _parse_status(values, column, field, errors, context):
+    parsed = []
+    for index, value in enumerate(values):
+        status = value.lower() or DEFAULT_TRANSFER_STATUS
+        if status not in TRANSFER_STATUSES:
+            _fail(errors, index, f'{column}: must be one of {", ".join(sorted(TRANSFER_STATUSES))}')
+        parsed.append(status)
+    return parsed
+
+
+def _parse_text(values, column, field, errors, context):
+    max_length = field.max_length
+    if max_length:
+        for index, value in enumerate(values):
+            if len(value) > max_length:
+                _fail(errors, index, f'{column}: longer than {max_length} characters')
+    return values
+
+
+PARSERS = {
+    'base': _parse_base,
+    'equipment_type': _parse_equipment_type,
+    'date': _parse_date,
+    'quantity': _parse_quantity,
+    'returned_quantity': _parse_returned_quantity,
+    'status': _parse_status,
+    'text': _parse_text,
+}
+
+
+def _check_rows(kind, columns, errors):
+    """Checks spanning several columns"""
+    if kind == 'transfers':
+        for index, (from_base, to_base) in enumerate(zip(columns['from_base_id'], columns['to_base_id'])):
+            if from_base is not None and from_base == to_base:
+                _fail(errors, index, 'from_base and to_base must differ')
+    elif kind == 'assignments':
+        for index, (assigned, returned) in enumerate(zip(columns['assigned_quantity'], columns['returned_quantity'])):
+            if assigned is not None and returned is not None and returned > assigned:
+                _fail(errors, index, 'returned_quantity exceeds assigned_quantity')
+
+
+def validate_batch(kind, header, records, context):
+    """
+    Parse one batch of CSV records.
+
+    Returns ``(instances, errors)``: unsaved model instances for the valid
+    records and a dict of record index -> error message for the rest.
+    """
+    model, spec = KINDS[kind]
+    positions = {name: position for position, name in enumerate(header)}
+    errors = {}
+    columns = {}
+    for column, attribute, parser, required in spec:
+        position = positions.get(column)
+        values = [
+            record[position].strip() if position is not None and position < len(record) else ''
+            for record in records
+        ]
+        if required:
+            for index, value in enumerate(values):
+                if not value:
+                    _fail(errors, index, f'{column} is required')
+        field = model._meta.get_field(attribute)
+        columns[attribute] = PARSERS[parser](values, column, field, errors, context)
+    _check_rows(kind, columns, errors)
+
+    attributes = list(columns)
+    instances = [
+        model(created_by_id=context.user_id, **dict(zip(attributes, values)))
+        for index, values in enumerate(zip(*columns.values()))
+        if index not in errors
+    ]
+    return instances, errors
+
+
+def _base_ids(kind, instances):
+    if kind == 'transfers':
+        return {base_id for transfer in instances for base_id in (transfer.from_base_id, transfer.to_base_id)}
+    return {instance.base_id for instance in instances}
+
+
+def _shard_writes(kind, instances):
+    """Instances to insert per database alias (transfer copies included)"""
+    if not sharding_enabled():
+        return {'default': instances}
+    assign_ids(instances)
+    writes = {}
+    for instance in instances:
+        base_id = instance.from_base_id if kind == 'transfers' else instance.base_id
+        writes.setdefault(shard_for_base(base_id), []).append(instance)
+        if kind == 'transfers':
+            to_alias = shard_for_base(instance.to_base_id)
+            if to_alias != shard_for_base(instance.from_base_id):
+                copy = Transfer(**{field.attname: getattr(instance, field.attname) for field in Transfer._meta.concrete_fields})
+                writes.setdefault(to_alias, []).append(copy)
+    return writes
+
+
+def _save_batch(kind, checkpoint, instances, consumed, failed, batch_size):
+    """Insert a batch and advance its checkpoint in the same transaction(s)"""
+    model = KINDS[kind][0]
+    writes = _shard_writes(kind, instances)
+    with ExitStack() as stack:
+        # Entered first, committed last: the checkpoint only moves once every shard has the rows
+        stack.enter_context(transaction.atomic(using='default'))
+        for alias in writes:
+            if alias != 'default':
+                stack.enter_context(transaction.atomic(using=alias))
+        for alias, objs in writes.items():
+            first = next_change_seq(alias, len(objs))
+            for change_seq, obj in enumerate(objs, first):
+                obj.change_seq = change_seq
+            model.objects.using(alias).bulk_create(objs, batch_size=batch_size)
+
+        checkpoint.rows_done += consumed
+        checkpoint.inserted += len(instances)
+        checkpoint.failed += failed
+        checkpoint.pending_base_ids = sorted(set(checkpoint.pending_base_ids) | _base_ids(kind, instances))
+        checkpoint.save(update_fields=['rows_done', 'inserted', 'failed', 'pending_base_ids', 'updated_at'])
+
+
+def fingerprint(path):
+    """File size plus a hash of its head, to tell a resumed file from a different one"""
+    with open(path, 'rb') as handle:
+        head = handle.read(FINGERPRINT_BYTES)
+    return f'{os.path.getsize(path)}:{hashlib.sha256(head).hexdigest()[:32]}'
+
+
+def _checkpoint(kind, path, restart):
+    source = f'{kind}:{os.path.abspath(path)}'
+    current = fingerprint(path)
+    checkpoint, created = ImportCheckpoint.objects.get_or_create(
+        source=source, defaults={'kind': kind, 'fingerprint': current}
+    )
+    if created:
+        return checkpoint
+    if restart:
+        checkpoint.fingerprint = current
+        checkpoint.rows_done = checkpoint.inserted = checkpoint.failed = 0
+        checkpoint.completed = False
+        checkpoint.save()
+    elif checkpoint.fingerprint != current:
+        raise ValueError(
+            f'{path} changed since its checkpoint was written ({checkpoint.rows_done} rows imported); '
+            'use --restart to import it from the beginning'
+        )
+    return checkpoint
+
+
+def import_file(kind, path, user=None, batch_size=DEFAULT_BATCH_SIZE, restart=False, reject=None, progress=None):
+    """
+    Stream one CSV file of ``kind`` records into the database.
+
+    ``reject(line, record, error)`` is called for every invalid record and
+    ``progress(report)`` after every committed batch. Returns a report
+    with counts, timings and rows per second; rows skipped because an
+    earlier run already imported them are counted in ``resumed_from``.
+    """
+    if kind not in KINDS:
+        raise ValueError(f'Unknown kind {kind!r}; expected one of {", ".join(KINDS)}')
+    checkpoint = _checkpoint(kind, path, restart)
+    report = {
+        'kind': kind,
+        'path': path,
+        'resumed_from': checkpoint.rows_done,
+        'rows': 0,
+        'inserted': 0,
+        'failed': 0,
+        'seconds': 0.0,
+        'rows_per_second': None,
+        'completed': checkpoint.completed,
+    }
+    if checkpoint.completed:
+        return report
+
+    context = ImportContext(user)
+    started = time.perf_counter()
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        reader = csv.reader(handle)
+        header = [name.strip().lower() for name in next(reader, [])]
+        missing = [column for column, _, _, required in KINDS[kind][1] if required and column not in header]
+        if missing:
+            raise ValueError(f'{path}: missing column(s): {", ".join(missing)}')
+
+        # Skip what earlier runs committed; reading is cheap next to inserting
+        for _ in itertools.islice(reader, checkpoint.rows_done):
+            pass
+
+        while True:
+            records = []
+            lines = []
+            for record in itertools.islice(reader, batch_size):
+                records.append(record)
+                lines.append(reader.line_num)
+            if not records:
+                break
+
+            instances, errors = validate_batch(kind, header, records, context)
+            _save_batch(kind, checkpoint, instances, len(records), len(errors), batch_size)
+            if reject is not None:
+                for index, error in sorted(errors.items()):
+                    reject(lines[index], records[index], error)
+
+            report['rows'] += len(records)
+            report['inserted'] += len(instances)
+            report['failed'] += len(errors)
+            report['seconds'] = time.perf_counter() - started
+            report['rows_per_second'] = report['rows'] / report['seconds'] if report['seconds'] else None
+            if progress is not None:
+                progress(report)
+
+    checkpoint.completed = True
+    checkpoint.save(update_fields=['completed', 'updated_at'])
+    report['completed'] = True
+    report['seconds'] = time.perf_counter() - started
+    report['rows_per_second'] = report['rows'] / report['seconds'] if report['seconds'] else None
+    return report
+
+
+def rebuild_inventory(workers=1):
+    """
+    Rebuild inventory for every base an import touched, once.
+
+    Returns the reconciliation report, or None when nothing is pending.
+    """
+    checkpoints = list(ImportCheckpoint.objects.exclude(pending_base_ids=[]))
+    base_ids = sorted({base_id for checkpoint in checkpoints for base_id in checkpoint.pending_base_ids})
+    if not base_ids:
+        return None
+    report = reconcile(base_ids, workers=workers, repair=True)
+    ImportCheckpoint.objects.filter(pk__in=[checkpoint.pk for checkpoint in checkpoints]).update(
+        pending_base_ids=[], updated_at=timezone.now()
+    )
+    return report
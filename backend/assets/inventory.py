@@ -0,0 +1,43 @@
+"""
+The inventory write path.
+
+Every quantity change caused by a transaction goes through
+adjust_inventory() so it lands on the right shard and is applied with a
+single UPDATE ... SET quantity = quantity + delta, stamped with the
+shard's next change sequence number in the same transaction. Once the
+change commits it is published to the event streams (assets/events.py).
+Pairs with a low-stock threshold then have their alert state updated
+(assets/alerts.py).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import alerts
+from .events import publish_inventory
+from .models import Inventory, next_change_seq, quantity_value
+from .sharding import shard_for_base
+
+
+def _add(rows, delta):
+    with transaction.atomic(using=rows.db):
+        return rows.update(
+            quantity=F('quantity') + quantity_value(delta), updated_at=timezone.now(), change_seq=next_change_seq(rows.db)
+        )
+
+
+def adjust_inventory(base_id, equipment_type_id, delta):
+    """Add ``delta`` (negative to remove) to one base's stock of an equipment type"""
+    manager = Inventory.objects.db_manager(shard_for_base(base_id))
+    rows = manager.filter(base_id=base_id, equipment_type_id=equipment_type_id)
+    
+    if not _add(rows, delta):
+        try:
+            with transaction.atomic(using=manager.db):
+                manager.create(base_id=base_id, equipment_type_id=equipment_type_id, quantity=delta)
+        except IntegrityError:
+            # Created concurrently by another request
+            _add(rows, delta)
+    publish_inventory(base_id, equipment_type_id, delta, using=manager.db)
+    if alerts.levels(base_id, equipment_type_id) is not None:
+        alerts.evaluate(base_id, equipment_type_id, rows.values_list('quantity', flat=True).first())
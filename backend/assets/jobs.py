@@ -0,0 +1,213 @@
+"""
+Database-backed background jobs.
+
+Jobs are rows in the ``Job`` table: the API enqueues them and answers
+``202 Accepted``, and ``manage.py run_workers`` runs them. A worker claims
+the oldest due job with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the
+database supports it (PostgreSQL) and with a compare-and-swap UPDATE
+elsewhere (SQLite), so no job runs twice at the same time.
+
+Failed jobs are retried with exponential backoff until ``max_attempts``.
+While a handler runs, a thread refreshes the job's heartbeat every
+JOB_HEARTBEAT_SECONDS. A running job whose heartbeat is older than
+JOB_STALE_SECONDS (its worker died) is picked up again by another worker.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# kind -> (handler, max_attempts or None for JOB_MAX_ATTEMPTS, private_params)
+REGISTRY = {}
+
+# Candidates a worker tries per poll when claiming by compare-and-swap
+CLAIM_BATCH = 10
+
+
+def register(kind, max_attempts=None, private_params=False):
+    """
+    Register ``handler(job, **params)`` for jobs of ``kind``.
+
+    The handler's return value (JSON-serializable) is stored as the job
+    result. Pass ``max_attempts=1`` for handlers that are not safe to retry.
+    With ``private_params`` (params holding secrets, e.g. passwords) the
+    stored params are erased as soon as a worker claims the job, which
+    therefore runs at most once.
+    """
+    def decorator(handler):
+        REGISTRY[kind] = (handler, 1 if private_params else max_attempts, private_params)
+        return handler
+    return decorator
+
+
+def enqueue(kind, params=None, user=None, delay=0):
+    """Queue a job of ``kind`` and return it"""
+    if kind not in REGISTRY:
+        raise ValueError(f'Unknown job kind: {kind}')
+    _, max_attempts, _ = REGISTRY[kind]
+    return Job.objects.create(
+        kind=kind,
+        params=params or {},
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        created_by=user if user is not None and user.is_authenticated else None
+    )
+
+
+def worker_name(suffix=''):
+    return f'{socket.gethostname()}:{os.getpid()}{suffix}'
+
+
+def _claimable(now):
+    stale = now - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    return Job.objects.filter(
+        Q(status='queued', run_at__lte=now)
+        | Q(status='running', heartbeat_at__lt=stale, attempts__lt=F('max_attempts'))
+    ).order_by('run_at', 'id')
+
+
+def _mark_running(job, worker, now):
+    """Take ``job`` unless another worker changed it (or refreshed its heartbeat) since it was read"""
+    claimed = Job.objects.filter(
+        pk=job.pk, status=job.status, attempts=job.attempts, heartbeat_at=job.heartbeat_at
+    ).update(
+        status='running',
+        attempts=job.attempts + 1,
+        locked_by=worker,
+        heartbeat_at=now,
+        started_at=now
+    )
+    if not claimed:
+        return False
+    job.status = 'running'
+    job.attempts += 1
+    job.locked_by = worker
+    job.heartbeat_at = job.started_at = now
+    return True
+
+
+def claim(worker):
+    """Claim the next due job for ``worker``; returns None when nothing is due"""
+    now = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = _claimable(now).select_for_update(skip_locked=True).first()
+            if job is not None and _mark_running(job, worker, now):
+                return job
+        return None
+
+    for job in _claimable(now)[:CLAIM_BATCH]:
+        if _mark_running(job, worker, now):
+            return job
+    return None
+
+
+def retry_delay(attempts):
+    """Seconds before the next attempt: exponential, capped, with jitter"""
+    delay = min(settings.JOB_RETRY_MAX_DELAY, settings.JOB_RETRY_DELAY * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+@contextmanager
+def _heartbeat(job):
+    """Refresh ``job``'s heartbeat from a thread until the block exits"""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.JOB_HEARTBEAT_SECONDS):
+                try:
+                    Job.objects.filter(pk=job.pk, locked_by=job.locked_by, attempts=job.attempts).update(
+                        heartbeat_at=timezone.now()
+                    )
+                except Exception:
+                    logger.exception('Heartbeat for job %s failed', job.pk)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'job-{job.pk}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run(job):
+    """Run a claimed job and record its outcome"""
+    entry = REGISTRY.get(job.kind)
+    if entry is None:
+        _finish(job, status='failed', error=f'No handler registered for job kind {job.kind!r}')
+        return
+
+    handler, _, private_params = entry
+    if private_params:
+        # The handler gets them from the claimed row; the table keeps none
+        Job.objects.filter(pk=job.pk).update(params={})
+    try:
+        with _heartbeat(job):
+            result = handler(job, **job.params)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Job %s (%s) failed on attempt %s', job.pk, job.kind, job.attempts)
+        if job.attempts < job.max_attempts:
+            _finish(job, status='queued', error=error,
+                    run_at=timezone.now() + timedelta(seconds=retry_delay(job.attempts)))
+        else:
+            _finish(job, status='failed', error=error)
+    else:
+        _finish(job, status='succeeded', result=result, progress=100, error='')
+
+
+def _finish(job, **fields):
+    if fields['status'] != 'queued':
+        fields['finished_at'] = timezone.now()
+    # A worker that lost the job (stale heartbeat) must not overwrite the new owner's state
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by, attempts=job.attempts).update(**fields)
+    for name, value in fields.items():
+        setattr(job, name, value)
+
+
+def fail_abandoned():
+    """Fail running jobs whose worker went away during their last attempt"""
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    return Job.objects.filter(
+        status='running', heartbeat_at__lt=stale, attempts__gte=F('max_attempts')
+    ).update(status='failed', finished_at=now, error='Worker stopped responding')
+
+
+def work(worker, stop, poll_interval=1.0, burst=False):
+    """
+    Claim and run jobs until ``stop`` is set.
+
+    With ``burst`` the loop also ends as soon as no job is due.
+    """
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            job = claim(worker)
+            if job is None:
+                if burst:
+                    break
+                stop.wait(poll_interval)
+                continue
+            logger.info('%s running job %s (%s)', worker, job.pk, job.kind)
+            run(job)
+    finally:
+        connection.close()
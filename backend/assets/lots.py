@@ -0,0 +1,147 @@
+"""
+Lot-level stock (``StockLot``) for equipment types with a lot policy.
+
+Each purchase of a lot-tracked type opens a lot at its base. Assignments,
+expenditures and outgoing transfers draw from the open, unrecalled lots
+of their base in policy order, oldest first (FIFO) or soonest expiry
+first (FEFO), and record what they took as ``LotAllocation`` rows; a
+completed transfer reopens the lots it drew at the receiving base with
+the same lot number and expiry. Assignment returns go back into the lots
+the assignment drew from.
+
+A draw never loops over lots in Python: one windowed query computes
+every lot's running total in policy order and keeps the lots needed to
+cover the quantity, with the amount taken from each, and one UPDATE
+applies all the takes. When the lots cannot cover a quantity (stock
+bought before the type was lot-tracked, or recalled lots) only what they
+hold is allocated; ``Inventory`` remains the authoritative total either
+way.
+
+Lots and allocations live on their base's shard.
+"""
+from django.db import transaction
+from django.db.models import Case, F, Sum, When, Window
+from django.db.models.expressions import RowRange
+from django.db.models.functions import Coalesce, Least
+
+from .models import Inventory, LotAllocation, QuantityField, StockLot, quantity_value
+from .sharding import assign_ids, shard_for_base
+
+
+QUANTITY = QuantityField()
+
+# Draw order per EquipmentType.lot_policy; ids break ties so the order is total
+LOT_ORDER = {
+    'fifo': [F('received_at').asc(), F('id').asc()],
+    'fefo': [F('expires_at').asc(nulls_last=True), F('received_at').asc(), F('id').asc()],
+}
+
+# Returns refill the lots an assignment drew from, soonest expiry first
+RETURN_ORDER = [F('lot__expires_at').asc(nulls_last=True), F('lot__received_at').asc(), F('id').asc()]
+
+
+def _draw(queryset, available, ordering, need):
+    """
+    ``[(id, take)]`` covering up to ``need`` from the rows of ``queryset``
+    in ``ordering``, where each row can give ``available``, computed in one
+    windowed query
+    """
+    if need <= 0:
+        return []
+    running = Window(Sum(available), order_by=ordering, frame=RowRange(start=None, end=0), output_field=QUANTITY)
+    rows = queryset.order_by().annotate(
+        available=Coalesce(available, quantity_value(0), output_field=QUANTITY), running=running
+    ).annotate(
+        before=F('running') - F('available')
+    ).filter(available__gt=0, before__lt=need).annotate(
+        take=Least(F('available'), quantity_value(need) - F('before'), output_field=QUANTITY)
+    ).values_list('id', 'take')
+    return [(row_id, take) for row_id, take in rows if take > 0]
+
+
+def _add(queryset, field, amounts, sign=1):
+    """Add (or with ``sign=-1`` subtract) ``{id: amount}`` to ``field`` in one UPDATE"""
+    if not amounts:
+        return
+    delta = Case(
+        *[When(id=row_id, then=quantity_value(amount)) for row_id, amount in amounts.items()],
+        default=quantity_value(0), output_field=QUANTITY
+    )
+    queryset.filter(id__in=list(amounts)).update(**{field: F(field) + delta if sign > 0 else F(field) - delta})
+
+
+def _lock_stock(alias, base_id, equipment_type_id):
+    # The pair's Inventory row serializes draws on its lots; window
+    # queries cannot take row locks themselves
+    list(Inventory.objects.using(alias).select_for_update().filter(
+        base_id=base_id, equipment_type_id=equipment_type_id
+    ).values_list('id', flat=True))
+
+
+def receive(purchase, lot_number='', expires_at=None):
+    """Open the lot ``purchase`` brings in; returns it"""
+    return StockLot.objects.create(
+        base_id=purchase.base_id, equipment_type_id=purchase.equipment_type_id, purchase=purchase,
+        lot_number=lot_number or f'P{purchase.pk}', received_at=purchase.purchase_date,
+        expires_at=expires_at, quantity=purchase.quantity, remaining=purchase.quantity,
+    )
+
+
+def allocate(kind, transaction_id, base_id, equipment_type_id, quantity, policy):
+    """
+    Draw ``quantity`` from the lots of one base and equipment type in
+    ``policy`` order for transaction ``kind`` #``transaction_id``; returns
+    the LotAllocation rows created
+    """
+    alias = shard_for_base(base_id)
+    lots = StockLot.objects.using(alias).filter(
+        base_id=base_id, equipment_type_id=equipment_type_id, remaining__gt=0, recalled=False
+    )
+    with transaction.atomic(using=alias):
+        _lock_stock(alias, base_id, equipment_type_id)
+        takes = dict(_draw(lots, F('remaining'), LOT_ORDER[policy], quantity))
+        _add(lots, 'remaining', takes, sign=-1)
+        allocations = assign_ids([
+            LotAllocation(lot_id=lot_id, base_id=base_id, kind=kind, transaction_id=transaction_id, quantity=take)
+            for lot_id, take in takes.items()
+        ])
+        return LotAllocation.objects.using(alias).bulk_create(allocations)
+
+
+def restore(kind, transaction_id, base_id, equipment_type_id, quantity):
+    """Hand ``quantity`` of what transaction ``kind`` #``transaction_id`` drew back to its lots"""
+    alias = shard_for_base(base_id)
+    allocations = LotAllocation.objects.using(alias).filter(kind=kind, transaction_id=transaction_id)
+    with transaction.atomic(using=alias):
+        _lock_stock(alias, base_id, equipment_type_id)
+        takes = _draw(allocations, F('quantity') - F('returned'), RETURN_ORDER, quantity)
+        if not takes:
+            return
+        lot_ids = dict(allocations.filter(id__in=[row_id for row_id, _ in takes]).values_list('id', 'lot_id'))
+        _add(allocations, 'returned', dict(takes))
+        _add(StockLot.objects.using(alias), 'remaining', {lot_ids[row_id]: take for row_id, take in takes})
+
+
+def transfer(transfer, policy):
+    """
+    Draw a completed transfer's quantity at ``from_base`` and reopen the
+    drawn lots at ``to_base``; returns the lots created there
+    """
+    allocations = allocate(
+        'transfer', transfer.pk, transfer.from_base_id, transfer.equipment_type_id, transfer.quantity, policy
+    )
+    if not allocations:
+        return []
+    source = StockLot.objects.using(shard_for_base(transfer.from_base_id)).in_bulk(
+        [allocation.lot_id for allocation in allocations]
+    )
+    lots = assign_ids([
+        StockLot(
+            base_id=transfer.to_base_id, equipment_type_id=transfer.equipment_type_id,
+            purchase_id=source[allocation.lot_id].purchase_id, lot_number=source[allocation.lot_id].lot_number,
+            received_at=source[allocation.lot_id].received_at, expires_at=source[allocation.lot_id].expires_at,
+            quantity=allocation.quantity, remaining=allocation.quantity,
+        )
+        for allocation in allocations
+    ])
+    return StockLot.objects.using(shard_for_base(transfer.to_base_id)).bulk_create(lots)
@@ -0,0 +1,79 @@
+import gzip
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from assets import projections
+from assets.renderers import ORJSONRenderer
+
+
+PROJECTIONS = {
+    'inventory': projections.INVENTORY,
+    'purchases': projections.PURCHASES,
+    'transfers': projections.TRANSFERS,
+    'assignments': projections.ASSIGNMENTS,
+    'expenditures': projections.EXPENDITURES,
+}
+
+
+def decode(page):
+    """Rebuild row dicts from a columnar page"""
+    data, dictionaries = page['data'], page['dictionaries']
+    columns = [
+        [None if code is None else dictionaries[name][code] for code in data[name]] if name in dictionaries else data[name]
+        for name in page['columns']
+    ]
+    return [dict(zip(page['columns'], values)) for values in zip(*columns)]
+
+
+class Command(BaseCommand):
+    help = 'Compare row-oriented and ?format=columnar list pages: size, build time and client parse time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, action='append', dest='page_sizes', help='Rows per page (repeatable, default 1000, 5000 and 10000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per page size')
+
+    def handle(self, *args, **options):
+        renderer = ORJSONRenderer()
+        for name, projection in PROJECTIONS.items():
+            self.stdout.write(self.style.SUCCESS(f'\n{name}'))
+            serializer = projection.serializer_class()
+            row_plan = projection.compile(serializer)
+            column_plan = projection.compile(serializer, projections.ColumnarPlan)
+            ordering = list(projection.model._meta.ordering)
+
+            for page_size in options['page_sizes'] or [1000, 5000, 10000]:
+                timings = {'rows': [], 'columnar': [], 'parse rows': [], 'parse columnar': []}
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    rows = row_plan.values(projection.model.objects.all(), ordering)[:page_size]
+                    row_body = renderer.render(row_plan.rows(rows))
+                    timings['rows'].append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    rows = column_plan.values(projection.model.objects.all(), ordering)[:page_size]
+                    column_body = renderer.render(column_plan.columnar(rows))
+                    timings['columnar'].append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    parsed_rows = json.loads(row_body)
+                    timings['parse rows'].append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    parsed_columns = json.loads(column_body)
+                    timings['parse columnar'].append(time.perf_counter() - started)
+
+                # Keys the row output omits (NULL relations) are null in columnar output
+                expected = [{column: row.get(column) for column in parsed_columns['columns']} for row in parsed_rows]
+                if decode(parsed_columns) != expected:
+                    raise CommandError(f'{name}: columnar page does not decode to the row page ({page_size} rows)')
+
+                ms = {key: statistics.median(values) * 1000 for key, values in timings.items()}
+                self.stdout.write(
+                    f'  {len(parsed_rows):>6} rows: '
+                    f'{len(row_body):>10,} -> {len(column_body):>9,} bytes '
+                    f'(gzip {len(gzip.compress(row_body)):>8,} -> {len(gzip.compress(column_body)):>7,})  '
+                    f"build {ms['rows']:7.2f} -> {ms['columnar']:7.2f} ms  "
+                    f"parse {ms['parse rows']:6.2f} -> {ms['parse columnar']:6.2f} ms"
+                )
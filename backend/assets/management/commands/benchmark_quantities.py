@@ -0,0 +1,108 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.apps.registry import Apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models
+from django.db.models import Sum
+from assets.models import QuantityField
+from assets.renderers import ORJSONRenderer
+
+
+CENT = Decimal('0.01')
+
+
+def quantity_table(name, field):
+    """An unregistered model for a scratch table holding ``field`` as its quantity"""
+    meta = type('Meta', (), {'apps': Apps(), 'app_label': 'benchmark', 'db_table': f'benchmark_{name}'})
+    return type(f'Benchmark{name.title()}', (models.Model,), {
+        '__module__': __name__,
+        'Meta': meta,
+        'base_id': models.IntegerField(),
+        'equipment_type_id': models.IntegerField(),
+        'quantity': field,
+    })
+
+
+TABLES = {
+    'numeric': quantity_table('numeric', models.DecimalField(max_digits=10, decimal_places=2)),
+    'hundredths': quantity_table('hundredths', QuantityField()),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare NUMERIC and fixed-point integer (QuantityField) quantity columns: aggregation and list page time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help='Rows per scratch table')
+        parser.add_argument('--page-size', type=int, action='append', dest='page_sizes', help='Rows per page (repeatable, default 1000 and 10000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per measurement')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        rows = [
+            (rng.randrange(50), rng.randrange(200), Decimal(rng.randrange(1, 10000000)).scaleb(-2))
+            for _ in range(options['rows'])
+        ]
+        with connection.schema_editor() as schema_editor:
+            for model in TABLES.values():
+                schema_editor.create_model(model)
+        try:
+            for model in TABLES.values():
+                model.objects.bulk_create(
+                    [model(base_id=base_id, equipment_type_id=type_id, quantity=quantity) for base_id, type_id, quantity in rows],
+                    batch_size=5000,
+                )
+            self.stdout.write(f"{options['rows']:,} rows per table on {connection.vendor}")
+            self.report(options)
+        finally:
+            with connection.schema_editor() as schema_editor:
+                for model in TABLES.values():
+                    schema_editor.delete_model(model)
+
+    def time(self, repeat, run):
+        """Median wall time of ``run()`` in ms, and its last result"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = run()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings) * 1000, result
+
+    def compare(self, label, repeat, runs):
+        (numeric_ms, numeric), (integer_ms, integer) = (self.time(repeat, runs[name]) for name in TABLES)
+        if numeric != integer:
+            raise CommandError(f'{label}: NUMERIC and fixed-point results differ')
+        self.stdout.write(f'  {label:<24} {numeric_ms:9.2f} -> {integer_ms:9.2f} ms  ({numeric_ms / max(integer_ms, 1e-9):.2f}x)')
+
+    def report(self, options):
+        renderer = ORJSONRenderer()
+        repeat = options['repeat']
+
+        # SQLite sums NUMERIC as floating point, so totals compare to the cent
+        self.compare('SUM', repeat, {
+            name: lambda model=model: model.objects.aggregate(total=Sum('quantity'))['total'].quantize(CENT)
+            for name, model in TABLES.items()
+        })
+        self.compare('SUM per base and type', repeat, {
+            name: lambda model=model: [
+                (base_id, type_id, total.quantize(CENT))
+                for base_id, type_id, total in model.objects.values('base_id', 'equipment_type_id')
+                .annotate(total=Sum('quantity')).order_by('base_id', 'equipment_type_id')
+                .values_list('base_id', 'equipment_type_id', 'total')
+            ]
+            for name, model in TABLES.items()
+        })
+        # Fetch and render as the list projections do ('{:f}' for decimals)
+        for page_size in options['page_sizes'] or [1000, 10000]:
+            self.compare(f'page of {page_size}', repeat, {
+                name: lambda model=model: renderer.render([
+                    {'id': row_id, 'base': base_id, 'equipment_type': type_id, 'quantity': '{:f}'.format(quantity)}
+                    for row_id, base_id, type_id, quantity in model.objects.order_by('id').values_list(
+                        'id', 'base_id', 'equipment_type_id', 'quantity'
+                    )[:page_size]
+                ])
+                for name, model in TABLES.items()
+            })
@@ -0,0 +1,55 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from assets import rebalancing
+
+
+class Command(BaseCommand):
+    help = 'Time the rebalancing solver on a synthetic fleet (no database access)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bases', type=int, default=500)
+        parser.add_argument('--equipment-types', type=int, default=2000)
+        parser.add_argument('--below', type=float, default=0.1, help='Fraction of pairs below target')
+        parser.add_argument('--above', type=float, default=0.3, help='Fraction of pairs above target')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        bases, below, above = options['bases'], options['below'], options['above']
+        # Bases on a 1000 x 1000 grid; cost is distance in hundredths
+        points = rng.random((bases, 2)) * 1000
+        costs = np.sqrt(((points[:, None] - points[None]) ** 2).sum(axis=-1)).round().astype(np.int64) * 100
+        np.fill_diagonal(costs, rebalancing.INF)
+
+        problems = []
+        for _ in range(options['equipment_types']):
+            target = rng.integers(10, 1000, bases) * 100
+            draw = rng.random(bases)
+            quantity = np.where(
+                draw < below, target * rng.uniform(0, 1, bases),
+                np.where(draw < below + above, target * rng.uniform(1, 2, bases), target)
+            ).astype(np.int64)
+            problems.append(quantity - target)
+
+        started = time.perf_counter()
+        transfers = moved = shortfall = cost = 0
+        for excess in problems:
+            suppliers, receivers = np.nonzero(excess > 0)[0], np.nonzero(excess < 0)[0]
+            shortfall -= int(excess[receivers].sum())
+            block = costs[np.ix_(suppliers, receivers)]
+            flow = rebalancing.solve(excess[suppliers], -excess[receivers], block)
+            transfers += int(np.count_nonzero(flow))
+            moved += int(flow.sum())
+            cost += int((flow * np.where(flow > 0, block, 0)).sum())
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{bases} bases x {options['equipment_types']} equipment types "
+            f"({below:.0%} below target, {above:.0%} above): {transfers} transfers moving "
+            f"{moved / 100:.0f} of {shortfall / 100:.0f} short units"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Solved in {elapsed:.2f}s ({elapsed / len(problems) * 1000:.2f} ms per equipment type)"
+        ))
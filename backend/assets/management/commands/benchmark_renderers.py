@@ -0,0 +1,82 @@
+import json
+import statistics
+import time
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from assets.models import Assignment, Expenditure, Purchase, Transfer
+from assets.renderers import MessagePackRenderer, ORJSONRenderer, msgpack, orjson
+from assets.serializers import (
+    AssignmentSerializer, ExpenditureSerializer, PurchaseSerializer, TransferSerializer
+)
+
+
+EXPORTS = [
+    (Purchase, PurchaseSerializer, ['base', 'equipment_type', 'created_by']),
+    (Transfer, TransferSerializer, ['from_base', 'to_base', 'equipment_type', 'created_by']),
+    (Assignment, AssignmentSerializer, ['base', 'equipment_type', 'created_by']),
+    (Expenditure, ExpenditureSerializer, ['base', 'equipment_type', 'created_by']),
+]
+
+
+class Command(BaseCommand):
+    help = 'Time DRF JSON, orjson and MessagePack rendering on list and export payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, action='append', dest='page_sizes', help='List page size (repeatable, default 100 and 1000)')
+        parser.add_argument('--export-rows', type=int, default=5000, help='Rows per table in the export payload')
+        parser.add_argument('--repeat', type=int, default=20, help='Renders timed per payload and renderer')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError('orjson is not installed')
+
+        payloads = []
+        for page_size in options['page_sizes'] or [100, 1000]:
+            rows = Purchase.objects.select_related('base', 'equipment_type', 'created_by')[:page_size]
+            payloads.append((f'purchases list, {page_size} rows', OrderedDict([
+                ('count', Purchase.objects.count()),
+                ('next', None),
+                ('previous', None),
+                ('results', PurchaseSerializer(rows, many=True).data),
+            ])))
+
+        export = {}
+        for model, serializer_class, related in EXPORTS:
+            rows = model.objects.select_related(*related)[:options['export_rows']]
+            export[str(model._meta.verbose_name_plural)] = serializer_class(rows, many=True).data
+        payloads.append((f"export, {sum(len(rows) for rows in export.values())} rows", export))
+
+        # Raw Decimals and datetimes, as returned by aggregates and values() rows
+        values = list(Purchase.objects.values()[:options['export_rows']])
+        payloads.append((f'values() rows, {len(values)} rows', values))
+
+        renderers = [('DRF JSONRenderer', JSONRenderer()), ('ORJSONRenderer', ORJSONRenderer())]
+        if msgpack is not None:
+            renderers.append(('MessagePackRenderer', MessagePackRenderer()))
+
+        for label, data in payloads:
+            self.stdout.write(self.style.SUCCESS(f'\n{label}'))
+            baseline = None
+            outputs = {}
+            for name, renderer in renderers:
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    body = renderer.render(data, renderer.media_type, {})
+                    timings.append(time.perf_counter() - started)
+                outputs[name] = body
+                median = statistics.median(timings) * 1000
+                baseline = baseline or median
+                self.stdout.write(
+                    f'  {name:<20} {median:8.2f} ms  {len(body):>10,} bytes  {baseline / median:5.1f}x'
+                )
+
+            if outputs['ORJSONRenderer'] != outputs['DRF JSONRenderer']:
+                raise CommandError(f'{label}: orjson output differs from JSONRenderer')
+            if msgpack is not None:
+                unpacked = msgpack.unpackb(outputs['MessagePackRenderer'], raw=False)
+                if unpacked != json.loads(outputs['DRF JSONRenderer']):
+                    raise CommandError(f'{label}: MessagePack output decodes to different values')
+            self.stdout.write('  orjson bytes identical to JSONRenderer; MessagePack decodes to the same values')
@@ -0,0 +1,78 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from assets import projections
+from assets.renderers import ORJSONRenderer
+
+
+PROJECTIONS = {
+    'inventory': projections.INVENTORY,
+    'purchases': projections.PURCHASES,
+    'transfers': projections.TRANSFERS,
+    'assignments': projections.ASSIGNMENTS,
+    'expenditures': projections.EXPENDITURES,
+}
+
+
+class Command(BaseCommand):
+    help = 'Check the values() list projections against the serializers and time both'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, action='append', dest='page_sizes', help='Rows per timed page (repeatable, default 100, 1000 and 5000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per page size')
+        parser.add_argument('--check-only', action='store_true', help='Only run the parity check')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows compared per parity chunk')
+
+    def handle(self, *args, **options):
+        renderer = ORJSONRenderer()
+        for name, projection in PROJECTIONS.items():
+            self.stdout.write(self.style.SUCCESS(f'\n{name}'))
+            serializer_class = projection.serializer_class
+            all_fields = list(serializer_class().fields)
+            field_sets = [None, all_fields[:1], all_fields[::2], all_fields[1::3]]
+
+            for fields in field_sets:
+                kwargs = {} if fields is None else {'fields': fields}
+                serializer = serializer_class(**kwargs)
+                plan = projection.compile(serializer)
+                if plan is None:
+                    raise CommandError(f'{name}: no projection for fields {fields}')
+                queryset = projection.model.objects.order_by('pk')
+                checked = 0
+                for start in range(0, queryset.count(), options['chunk_size']):
+                    chunk = queryset[start:start + options['chunk_size']]
+                    expected = renderer.render(serializer_class(serializer.optimize(chunk), many=True, **kwargs).data)
+                    actual = renderer.render(plan.rows(plan.values(chunk)))
+                    if actual != expected:
+                        raise CommandError(f'{name}: output differs from {serializer_class.__name__} (fields={fields}, rows {start}+)')
+                    checked += chunk.count()
+                self.stdout.write(f"  parity: {checked} rows identical (fields={','.join(fields) if fields else 'all'})")
+
+            if options['check_only']:
+                continue
+
+            serializer = serializer_class()
+            plan = projection.compile(serializer)
+            ordering = list(projection.model._meta.ordering)
+            for page_size in options['page_sizes'] or [100, 1000, 5000]:
+                timings = {'serializer': [], 'values': []}
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    rows = serializer.optimize(projection.model.objects.all(), ordering)[:page_size]
+                    serialized = renderer.render(serializer_class(rows, many=True).data)
+                    timings['serializer'].append(time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    rows = plan.values(projection.model.objects.all(), ordering)[:page_size]
+                    projected = renderer.render(plan.rows(rows))
+                    timings['values'].append(time.perf_counter() - started)
+                if serialized != projected:
+                    raise CommandError(f'{name}: timed pages differ')
+
+                serializer_ms = statistics.median(timings['serializer']) * 1000
+                values_ms = statistics.median(timings['values']) * 1000
+                self.stdout.write(
+                    f'  {page_size:>6} rows: serializer {serializer_ms:8.2f} ms  values() {values_ms:8.2f} ms  '
+                    f'{serializer_ms / values_ms:4.1f}x'
+                )
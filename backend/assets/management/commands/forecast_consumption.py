@@ -0,0 +1,56 @@
+import csv
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from assets import forecasting
+
+
+class Command(BaseCommand):
+    help = 'Consumption rates and days of supply for every base and equipment type'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base', type=int, action='append', dest='base_ids', help='Only this base id (repeatable)')
+        parser.add_argument('--equipment-type', type=int, help='Only this equipment type id')
+        parser.add_argument('--max-days', type=float, help='Only pairs running out within this many days')
+        parser.add_argument('--history-days', type=int, default=settings.FORECAST_HISTORY_DAYS, help='Days of history used for the rates')
+        parser.add_argument('--csv', metavar='FILE', help="Write all rows as CSV to FILE ('-' for stdout)")
+        parser.add_argument('--limit', type=int, default=30, help='Rows printed (without --csv)')
+
+    def handle(self, *args, **options):
+        forecasting.clear()
+        started = time.perf_counter()
+        rows = forecasting.forecast(
+            options['base_ids'], options['equipment_type'], options['max_days'], options['history_days']
+        )
+        elapsed = time.perf_counter() - started
+        started = time.perf_counter()
+        forecasting.forecast(options['base_ids'], options['equipment_type'], options['max_days'], options['history_days'])
+        cached = time.perf_counter() - started
+
+        if options['csv']:
+            handle = sys.stdout if options['csv'] == '-' else open(options['csv'], 'w', newline='')
+            try:
+                writer = csv.DictWriter(handle, fieldnames=list(rows[0]) if rows else ['base_id'])
+                writer.writeheader()
+                writer.writerows(rows)
+            finally:
+                if handle is not sys.stdout:
+                    handle.close()
+            if options['csv'] == '-':
+                return
+        else:
+            for row in rows[:options['limit']]:
+                days = '-' if row['days_of_supply'] is None else f"{row['days_of_supply']:.1f}"
+                self.stdout.write(
+                    f"  {row['base_name'] or row['base_id']:<28} {row['equipment_name'] or row['equipment_type_id']:<28} "
+                    f"stock {row['quantity']:>10.2f}  7d {row['rate_7d']:>8.2f}/day  28d {row['rate_28d']:>8.2f}/day  "
+                    f"trend {row['trend']:>+8.4f}  days {days:>7}"
+                )
+            if len(rows) > options['limit']:
+                self.stdout.write(f"  ... {len(rows) - options['limit']} more")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(rows)} pairs in {elapsed * 1000:.1f} ms ({cached * 1000:.1f} ms with cached rates)"
+        ))
@@ -0,0 +1,98 @@
+import csv
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from assets.importing import DEFAULT_BATCH_SIZE, KINDS, import_file, rebuild_inventory
+
+
+class Command(BaseCommand):
+    help = 'Stream historical purchases, transfers, assignments and expenditures from CSV files'
+
+    def add_arguments(self, parser):
+        for kind in KINDS:
+            columns = ', '.join(column for column, _, _, _ in KINDS[kind][1])
+            parser.add_argument(f'--{kind}', action='append', default=[], metavar='CSV', help=f'CSV of {kind} ({columns})')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows validated and inserted per batch')
+        parser.add_argument('--user', metavar='USERNAME', help='Record the rows as created by this user')
+        parser.add_argument('--rejects-out', metavar='FILE', help='Write rejected rows with their line and error to this CSV')
+        parser.add_argument('--restart', action='store_true', help='Ignore existing checkpoints and import the files from the start')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processes used for the inventory rebuild')
+        parser.add_argument('--no-inventory', action='store_true', help='Leave the inventory rebuild to a later run')
+        parser.add_argument('--limit', type=int, default=20, help='Maximum rejected rows to print')
+
+    def handle(self, *args, **options):
+        files = [(kind, path) for kind in KINDS for path in options[kind]]
+        for kind, path in files:
+            if not os.path.isfile(path):
+                raise CommandError(f'{path} does not exist')
+
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"Unknown user {options['user']!r}")
+
+        rejects_file = open(options['rejects_out'], 'a', newline='') if options['rejects_out'] else None
+        rejects_writer = csv.writer(rejects_file) if rejects_file else None
+        printed = [0]
+
+        def reject(line, record, error):
+            if rejects_writer:
+                rejects_writer.writerow([kind, line, error, *record])
+            if printed[0] < options['limit']:
+                self.stdout.write(self.style.ERROR(f'  {kind} line {line}: {error}'))
+            printed[0] += 1
+
+        def progress(report):
+            self.stdout.write(
+                f"  {report['kind']}: {report['resumed_from'] + report['rows']} rows "
+                f"({report['rows_per_second'] or 0:,.0f} rows/s)"
+            )
+
+        total_rows = total_seconds = 0
+        try:
+            for kind, path in files:
+                try:
+                    report = import_file(
+                        kind, path, user=user, batch_size=options['batch_size'],
+                        restart=options['restart'], reject=reject, progress=progress
+                    )
+                except (OSError, ValueError) as error:
+                    raise CommandError(str(error))
+
+                if not report['rows'] and report['resumed_from']:
+                    self.stdout.write(f"{path}: already imported ({report['resumed_from']} rows)")
+                    continue
+                resumed = f", resumed after {report['resumed_from']} rows" if report['resumed_from'] else ''
+                self.stdout.write(self.style.SUCCESS(
+                    f"{path}: {report['inserted']} {kind} imported, {report['failed']} rejected "
+                    f"in {report['seconds']:.2f}s ({report['rows_per_second'] or 0:,.0f} rows/s{resumed})"
+                ))
+                total_rows += report['rows']
+                total_seconds += report['seconds']
+        finally:
+            if rejects_file:
+                rejects_file.close()
+
+        if printed[0] > options['limit']:
+            self.stdout.write(f"  ... {printed[0] - options['limit']} more rejected rows")
+        if len(files) > 1 and total_seconds:
+            self.stdout.write(f'{total_rows} rows in {total_seconds:.2f}s ({total_rows / total_seconds:,.0f} rows/s)')
+
+        if options['no_inventory']:
+            self.stdout.write('Skipped the inventory rebuild; run again with no files to rebuild it')
+            return
+        report = rebuild_inventory(workers=options['workers'])
+        if report is None:
+            self.stdout.write('No inventory to rebuild')
+        else:
+            repaired = report['repaired'] or {'updated': 0, 'created': 0}
+            self.stdout.write(self.style.SUCCESS(
+                f"Rebuilt inventory: {report['checked']} positions checked, "
+                f"{repaired['updated']} updated, {repaired['created']} created"
+            ))
+            if report['negative_count']:
+                self.stdout.write(self.style.WARNING(
+                    f"{report['negative_count']} positions have a negative balance in the imported history"
+                ))
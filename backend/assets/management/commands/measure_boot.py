@@ -0,0 +1,100 @@
+import os
+import re
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from military_ams.warmup import memory_usage, worker_pids
+
+
+WORKER_READY = re.compile(r'Worker (\d+) ready in ([\d.]+)ms')
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = 'Boot gunicorn with and without preloading and report per-worker boot time and memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Gunicorn workers per run')
+        parser.add_argument('--requests', type=int, default=20, help='Requests sent after boot')
+        parser.add_argument('--path', default='/api/v1/auth/role-codes/', help='Endpoint requested after boot')
+        parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for the workers')
+
+    def handle(self, *args, **options):
+        if not sys.platform.startswith('linux'):
+            raise CommandError('Memory is read from /proc, so this only runs on Linux')
+
+        for preload in (False, True):
+            self.stdout.write(self.style.SUCCESS(f"\npreload_app={preload}"))
+            self.measure(preload, options)
+
+    def measure(self, preload, options):
+        port = _free_port()
+        env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(options['workers']),
+                   GUNICORN_PRELOAD=str(preload), GUNICORN_MAX_REQUESTS='0')
+        config = os.path.join(settings.BASE_DIR, 'gunicorn.conf.py')
+
+        with tempfile.TemporaryFile(mode='w+') as log:
+            started = time.monotonic()
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '-c', config, 'military_ams.asgi:application'],
+                cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+            )
+            try:
+                ready = self.wait_for_workers(process, log, options['workers'], options['timeout'])
+                boot_seconds = time.monotonic() - started
+
+                url = f'http://127.0.0.1:{port}{options["path"]}'
+                latencies = []
+                for _ in range(options['requests']):
+                    request_started = time.perf_counter()
+                    with urllib.request.urlopen(url, timeout=10) as response:
+                        response.read()
+                    latencies.append((time.perf_counter() - request_started) * 1000)
+
+                master = memory_usage(process.pid)
+                workers = {pid: memory_usage(pid) for pid in worker_pids(process.pid)}
+            finally:
+                process.send_signal(signal.SIGTERM)
+                process.wait(timeout=30)
+
+        self.stdout.write(f'  all workers ready after {boot_seconds * 1000:.0f}ms')
+        self.stdout.write(f'  master: rss={master["rss"] / 1024:.1f}MiB')
+        for pid, usage in sorted(workers.items()):
+            self.stdout.write(
+                f'  worker {pid}: boot={ready.get(pid, float("nan")):.0f}ms '
+                f'rss={usage["rss"] / 1024:.1f}MiB pss={usage["pss"] / 1024:.1f}MiB '
+                f'private={usage["private"] / 1024:.1f}MiB'
+            )
+        total_pss = sum(usage['pss'] for usage in workers.values()) + master.get('pss', 0)
+        self.stdout.write(f'  total pss (master + workers): {total_pss / 1024:.1f}MiB')
+        self.stdout.write(
+            f'  first request {latencies[0]:.1f}ms, median {statistics.median(latencies):.1f}ms, '
+            f'max {max(latencies):.1f}ms'
+        )
+
+    def wait_for_workers(self, process, log, count, timeout):
+        """Worker pid -> boot milliseconds, parsed from the gunicorn log"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                log.seek(0)
+                raise CommandError(f'gunicorn exited:\n{log.read()[-2000:]}')
+            log.seek(0)
+            ready = {int(pid): float(ms) for pid, ms in WORKER_READY.findall(log.read())}
+            if len(ready) >= count:
+                return ready
+            time.sleep(0.1)
+        raise CommandError(f'Workers not ready after {timeout}s')
@@ -0,0 +1,47 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from assets.provisioning import provision_users, read_csv
+
+
+class Command(BaseCommand):
+    help = 'Create users in bulk from a CSV of username, email, role and base (code)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='CSV with username, email, role, base[, first_name, last_name, password]')
+        parser.add_argument('--workers', type=int, default=None, help='Processes used for password hashing (default: CPU count)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per INSERT')
+        parser.add_argument('--passwords-out', metavar='FILE', help='Write generated passwords to this CSV instead of stdout')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as handle:
+                rows = read_csv(handle.read())
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+
+        report = provision_users(rows, workers=options['workers'], batch_size=options['batch_size'])
+
+        for error in report['errors']:
+            self.stdout.write(self.style.ERROR(f"  line {error['line']} ({error['username'] or '-'}): {error['error']}"))
+
+        generated = report['generated_passwords']
+        if generated and options['passwords_out']:
+            with open(options['passwords_out'], 'w', newline='') as handle:
+                writer = csv.DictWriter(handle, fieldnames=['username', 'password'])
+                writer.writeheader()
+                writer.writerows(generated)
+            self.stdout.write(f"Wrote {len(generated)} generated passwords to {options['passwords_out']}")
+        elif generated:
+            self.stdout.write('Generated passwords:')
+            for row in generated:
+                self.stdout.write(f"  {row['username']},{row['password']}")
+
+        self.stdout.write(
+            f"Created {report['created']} users in {report['seconds']:.2f}s "
+            f"({report['users_per_second'] or 0:.1f}/s, hashing {report['hash_seconds']:.2f}s)"
+        )
+        if report['failed']:
+            self.stdout.write(self.style.WARNING(f"{report['failed']} rows failed"))
+        else:
+            self.stdout.write(self.style.SUCCESS('All rows provisioned'))
@@ -0,0 +1,142 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from assets.models import Base, BaseShard, Transfer
+from assets.reconciliation import reconcile
+from assets.sharding import (
+    REFERENCE_MODELS, SHARD_KEYS, clear_shard_map, shard_for_base,
+    sharding_enabled, transfer_shards
+)
+
+
+class Command(BaseCommand):
+    help = 'Move bases between shards, either one base explicitly or balanced by row count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base', metavar='CODE', help='Base to move (with --to)')
+        parser.add_argument('--to', metavar='ALIAS', help='Target shard alias')
+        parser.add_argument('--auto', action='store_true', help='Spread bases evenly over all shards by row count')
+        parser.add_argument('--sync-reference', action='store_true', help='Copy bases, equipment types and users to every shard')
+        parser.add_argument('--settle', type=float, default=None, help='Seconds to wait for stale shard maps (default: SHARD_MAP_TTL)')
+        parser.add_argument('--dry-run', action='store_true', help='Only print the plan')
+
+    def handle(self, *args, **options):
+        if not sharding_enabled():
+            raise CommandError('Sharding is not enabled (set SHARD_DATABASE_URLS)')
+
+        if options['sync_reference']:
+            self.sync_reference()
+
+        if options['base']:
+            if options['to'] not in settings.SHARDS:
+                raise CommandError(f'--to must be one of: {", ".join(settings.SHARDS)}')
+            try:
+                base = Base.objects.using('default').get(code=options['base'])
+            except Base.DoesNotExist:
+                raise CommandError(f'Unknown base code: {options["base"]}')
+            plan = {base.id: options['to']}
+        elif options['auto']:
+            plan = self.balanced_plan()
+        else:
+            if not options['sync_reference']:
+                raise CommandError('Pass --base CODE --to ALIAS, --auto or --sync-reference')
+            return
+
+        moves = {base_id: alias for base_id, alias in plan.items() if shard_for_base(base_id) != alias}
+        codes = dict(Base.objects.using('default').values_list('id', 'code'))
+        for base_id, alias in moves.items():
+            self.stdout.write(f'  {codes.get(base_id, base_id)}: {shard_for_base(base_id)} -> {alias}')
+        if not moves:
+            self.stdout.write(self.style.SUCCESS('Shards are already balanced'))
+            return
+        if options['dry_run']:
+            return
+
+        settle = settings.SHARD_MAP_TTL if options['settle'] is None else options['settle']
+        for base_id, alias in moves.items():
+            self.move_base(base_id, alias, settle)
+            self.stdout.write(self.style.SUCCESS(f'Moved {codes.get(base_id, base_id)} to {alias}'))
+
+    def sync_reference(self):
+        for model in REFERENCE_MODELS:
+            rows = list(model.objects.using('default').all())
+            fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+            for alias in settings.SHARDS[1:]:
+                model.objects.using(alias).bulk_create(
+                    rows, batch_size=1000, update_conflicts=True,
+                    update_fields=fields, unique_fields=['id']
+                )
+            self.stdout.write(f'Synced {len(rows)} {model._meta.verbose_name_plural}')
+
+    def balanced_plan(self):
+        """Assign bases to shards largest first, each to the least loaded shard"""
+        load = {}
+        for alias in settings.SHARDS:
+            for model, key in SHARD_KEYS.items():
+                for base_id, rows in model.objects.using(alias).order_by().values_list(f'{key}_id').annotate(rows=Count('pk')):
+                    load[base_id] = load.get(base_id, 0) + rows
+        for base_id in Base.objects.using('default').values_list('id', flat=True):
+            load.setdefault(base_id, 0)
+
+        totals = {alias: 0 for alias in settings.SHARDS}
+        plan = {}
+        for base_id, rows in sorted(load.items(), key=lambda item: -item[1]):
+            # Ties go to the base's current shard to avoid needless moves
+            current = shard_for_base(base_id)
+            alias = min(settings.SHARDS, key=lambda alias: (totals[alias], alias != current))
+            plan[base_id] = alias
+            totals[alias] += rows
+        return plan
+
+    def base_rows(self, model, alias, base_id):
+        if model is Transfer:
+            return Transfer.objects.using(alias).filter(Q(from_base_id=base_id) | Q(to_base_id=base_id))
+        return model.objects.using(alias).filter(**{f'{SHARD_KEYS[model]}_id': base_id})
+
+    def copy_rows(self, base_id, source, target, since=None):
+        for model in SHARD_KEYS:
+            rows = self.base_rows(model, source, base_id)
+            if since is not None:
+                rows = rows.filter(updated_at__gte=since)
+            fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+            batch = []
+            for row in rows.iterator(chunk_size=1000):
+                batch.append(row)
+                if len(batch) == 1000:
+                    model.objects.using(target).bulk_create(batch, update_conflicts=True, update_fields=fields, unique_fields=['id'])
+                    batch = []
+            if batch:
+                model.objects.using(target).bulk_create(batch, update_conflicts=True, update_fields=fields, unique_fields=['id'])
+
+    def move_base(self, base_id, target, settle):
+        """
+        Copy a base's rows to ``target``, switch the shard map, sweep rows
+        written through stale maps, then delete what the source no longer owns.
+        """
+        source = shard_for_base(base_id)
+        started = timezone.now()
+        self.copy_rows(base_id, source, target)
+
+        BaseShard.objects.using('default').update_or_create(base_id=base_id, defaults={'alias': target})
+        clear_shard_map()
+
+        # Other processes may keep writing to the source until their map expires
+        time.sleep(settle)
+        self.copy_rows(base_id, source, target, since=started)
+
+        with transaction.atomic(using=source):
+            for model in SHARD_KEYS:
+                if model is not Transfer:
+                    self.base_rows(model, source, base_id).delete()
+            stale = [
+                transfer.pk for transfer in self.base_rows(Transfer, source, base_id)
+                if source not in transfer_shards(transfer)
+            ]
+            Transfer.objects.using(source).filter(pk__in=stale).delete()
+
+        # Writes racing the move can leave inventory behind the ledger
+        reconcile([base_id], repair=True)
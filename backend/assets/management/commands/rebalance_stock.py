@@ -0,0 +1,43 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from assets import rebalancing
+
+
+class Command(BaseCommand):
+    help = 'Propose (and optionally create) transfers that bring every base to its stock target at the lowest cost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--equipment-type', type=int, action='append', dest='equipment_type_ids', help='Only this equipment type id (repeatable)')
+        parser.add_argument('--base', type=int, action='append', dest='base_ids', help='Only move stock between these base ids (repeatable)')
+        parser.add_argument('--create', action='store_true', help='Save the proposals as pending transfers')
+        parser.add_argument('--user', help='Username recorded as created_by with --create')
+        parser.add_argument('--limit', type=int, default=30, help='Proposals printed')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user named {options['user']}")
+
+        started = time.perf_counter()
+        plan = rebalancing.recommend(options['equipment_type_ids'], options['base_ids'])
+        elapsed = time.perf_counter() - started
+
+        for proposal in plan['transfers'][:options['limit']]:
+            self.stdout.write(
+                f"  {proposal['equipment_name'] or proposal['equipment_type']:<24} {proposal['quantity']:>10} "
+                f"{proposal['from_base_name']} -> {proposal['to_base_name']} (@ {proposal['unit_cost']})"
+            )
+        if len(plan['transfers']) > options['limit']:
+            self.stdout.write(f"  ... {len(plan['transfers']) - options['limit']} more")
+        self.stdout.write(
+            f"{len(plan['transfers'])} transfers cover {plan['covered']} of {plan['shortfall']} short "
+            f"at cost {plan['cost']} ({elapsed:.2f}s)"
+        )
+
+        if options['create'] and plan['transfers']:
+            transfers = rebalancing.create_transfers(plan['transfers'], user)
+            self.stdout.write(self.style.SUCCESS(f'Created {len(transfers)} pending transfers'))
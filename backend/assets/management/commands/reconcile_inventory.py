@@ -0,0 +1,55 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from assets.models import Base, EquipmentType
+from assets.reconciliation import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute inventory from the transaction history, report drift and optionally repair it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Write the expected quantities back to Inventory')
+        parser.add_argument('--base', action='append', dest='bases', metavar='CODE', help='Only reconcile this base (repeatable)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processes used for the aggregation')
+        parser.add_argument('--limit', type=int, default=50, help='Maximum drifted rows to print')
+
+    def handle(self, *args, **options):
+        base_ids = None
+        if options['bases']:
+            bases = dict(Base.objects.filter(code__in=options['bases']).values_list('code', 'id'))
+            missing = set(options['bases']) - set(bases)
+            if missing:
+                raise CommandError(f'Unknown base code(s): {", ".join(sorted(missing))}')
+            base_ids = list(bases.values())
+
+        started = time.perf_counter()
+        report = reconcile(base_ids, workers=options['workers'], repair=options['repair'])
+        elapsed = time.perf_counter() - started
+
+        base_names = dict(Base.objects.values_list('id', 'code'))
+        equipment_names = dict(EquipmentType.objects.values_list('id', 'name'))
+
+        for row in report['drift'][:options['limit']]:
+            self.stdout.write(
+                f"  {base_names.get(row['base_id'], row['base_id'])} / "
+                f"{equipment_names.get(row['equipment_type_id'], row['equipment_type_id'])}: "
+                f"inventory={row['actual']} expected={row['expected']} difference={row['difference']}"
+            )
+        if report['drift_count'] > options['limit']:
+            self.stdout.write(f"  ... {report['drift_count'] - options['limit']} more")
+
+        self.stdout.write(f"Checked {report['checked']} inventory positions in {elapsed:.2f}s")
+        if report['negative_count']:
+            self.stdout.write(self.style.WARNING(f"{report['negative_count']} positions have a negative expected balance"))
+
+        if not report['drift_count']:
+            self.stdout.write(self.style.SUCCESS('Inventory matches the transaction history'))
+        elif report['repaired']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Repaired {report['drift_count']} positions "
+                f"({report['repaired']['updated']} updated, {report['repaired']['created']} created)"
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(f"{report['drift_count']} positions drifted (run with --repair to fix)"))
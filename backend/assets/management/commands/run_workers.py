@@ -0,0 +1,73 @@
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from assets.jobs import fail_abandoned, work, worker_name
+
+
+def _process_main(index, stop, poll_interval, burst):
+    # The parent coordinates shutdown; finish the current job instead of dying on Ctrl-C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    work(worker_name(f'-p{index}'), stop, poll_interval, burst)
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the job table with N worker threads or processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-c', '--concurrency', type=int, default=2, help='Number of workers')
+        parser.add_argument('--processes', action='store_true', help='Run workers as processes instead of threads')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls when the queue is empty')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        burst = options['burst']
+
+        if options['processes']:
+            context = multiprocessing.get_context('fork')
+            stop = context.Event()
+            # Forked children must not share the parent's open DB connections
+            connections.close_all()
+            # Not daemonic: jobs may start process pools of their own
+            workers = [
+                context.Process(target=_process_main, args=(index, stop, poll_interval, burst))
+                for index in range(concurrency)
+            ]
+        else:
+            stop = threading.Event()
+            workers = [
+                threading.Thread(
+                    target=work, args=(worker_name(f'-t{index}'), stop, poll_interval, burst), daemon=True
+                )
+                for index in range(concurrency)
+            ]
+
+        def shutdown(signum, frame):
+            self.stdout.write('Stopping workers after their current job...')
+            stop.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        mode = 'processes' if options['processes'] else 'threads'
+        self.stdout.write(self.style.SUCCESS(f'Started {concurrency} job worker {mode}'))
+        for worker in workers:
+            worker.start()
+
+        while any(worker.is_alive() for worker in workers):
+            failed = fail_abandoned()
+            if failed:
+                self.stdout.write(self.style.WARNING(f'Failed {failed} abandoned job(s)'))
+            for worker in workers:
+                worker.join(timeout=min(settings.JOB_STALE_SECONDS, 60) / len(workers))
+                if stop.is_set() or burst:
+                    worker.join()
+
+        connections.close_all()
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
@@ -1,20 +1,51 @@
-import json
+import random
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured, RequestDataTooBig
+from django.http import UnreadablePostError
 from django.utils.deprecation import MiddlewareMixin
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from military_ams.db_routers import replica_configured, use_replica
 from .models import APILog
 
 
 class APILoggingMiddleware(MiddlewareMixin):
-    """Middleware to log all API requests and responses"""
+    """
+    Log every API request to APILog. Bodies are captured by policy, so the
+    cost per request does not grow with the payload:
+    
+    - none for safe methods unless API_LOG_SAFE_METHOD_BODIES is set
+    - only for a sample of requests, at the rate of the longest matching
+      prefix in API_LOG_BODY_SAMPLE_RATES (else API_LOG_BODY_SAMPLE_RATE)
+    - at most API_LOG_BODY_MAX_BYTES of each, cut before any decoding
+    - never from streaming responses, whose content is left unread
+    - never from multipart requests, so uploads stay streamed
+    
+    Bodies are stored zlib-compressed (CompressedTextField).
+    """
+    
+    def capture_bodies(self, request):
+        if request.method in SAFE_METHODS and not settings.API_LOG_SAFE_METHOD_BODIES:
+            return False
+        rates = settings.API_LOG_BODY_SAMPLE_RATES
+        prefix = max((prefix for prefix in rates if request.path.startswith(prefix)), key=len, default=None)
+        rate = settings.API_LOG_BODY_SAMPLE_RATE if prefix is None else rates[prefix]
+        return rate >= 1 or random.random() < rate
     
     def process_request(self, request):
-        # Store request body for logging
-        if request.method in ['POST', 'PUT', 'PATCH']:
+        request._log_bodies = request.path.startswith('/api/') and self.capture_bodies(request)
+        if request._log_bodies and not request.content_type.startswith('multipart/'):
+            # Buffer the body now; the view reads it from the buffer afterwards
             try:
-                request._body_copy = request.body.decode('utf-8')
-            except:
-                request._body_copy = ''
-        else:
-            request._body_copy = ''
+                request.body
+            except (RequestDataTooBig, UnreadablePostError):
+                request._log_bodies = False
         return None
     
     def process_response(self, request, response):
@@ -31,14 +62,13 @@ class APILoggingMiddleware(MiddlewareMixin):
                 else:
                     ip_address = request.META.get('REMOTE_ADDR')
                 
-                # Get response body (limit size)
-                try:
-                    if hasattr(response, 'content'):
-                        response_body = response.content.decode('utf-8')[:5000]
-                    else:
-                        response_body = ''
-                except:
-                    response_body = ''
+                request_body = response_body = b''
+                if getattr(request, '_log_bodies', False):
+                    limit = settings.API_LOG_BODY_MAX_BYTES
+                    if not request.content_type.startswith('multipart/'):
+                        request_body = request.body[:limit]
+                    if not response.streaming:
+                        response_body = response.content[:limit]
                 
                 # Create log entry
                 APILog.objects.create(
@@ -46,7 +76,7 @@ class APILoggingMiddleware(MiddlewareMixin):
                     endpoint=request.path,
                     method=request.method,
                     status_code=response.status_code,
-                    request_body=getattr(request, '_body_copy', '')[:5000],
+                    request_body=request_body,
                     response_body=response_body,
                     ip_address=ip_address
                 )
@@ -55,3 +85,69 @@ class APILoggingMiddleware(MiddlewareMixin):
                 print(f"API Logging Error: {e}")
         
         return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve safe-method requests from the read replica.
+    
+    - GET/HEAD/OPTIONS read from the replica, everything else uses the primary
+    - After a write the client is pinned to the primary for REPLICA_PIN_SECONDS
+      so it always reads its own writes
+    
+    Clients are identified by the JWT user id (validated without a DB query),
+    the session user or, for anonymous requests, the client IP. Pins live in
+    the default cache, which must be shared between workers: a process-local
+    backend is refused at startup while a replica is configured.
+    """
+    
+    jwt_authentication = JWTAuthentication()
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if replica_configured() and isinstance(caches['default'], (LocMemCache, DummyCache)):
+            raise ImproperlyConfigured(
+                'ReplicaRoutingMiddleware needs a cache shared between workers (CACHE_BACKEND), '
+                'or a client writing through one worker reads stale replica data through another'
+            )
+    
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+        
+        pin_key = self.pin_key(request)
+        read_from_replica = request.method in SAFE_METHODS and not cache.get(pin_key)
+        
+        with use_replica(read_from_replica):
+            response = self.get_response(request)
+        
+        if request.method not in SAFE_METHODS:
+            cache.set(pin_key, True, settings.REPLICA_PIN_SECONDS)
+        
+        return response
+    
+    def pin_key(self, request):
+        user_id = None
+        
+        header = self.jwt_authentication.get_header(request)
+        if header is not None:
+            raw_token = self.jwt_authentication.get_raw_token(header)
+            if raw_token is not None:
+                try:
+                    token = self.jwt_authentication.get_validated_token(raw_token)
+                    user_id = token.get(jwt_settings.USER_ID_CLAIM)
+                except (InvalidToken, TokenError):
+                    pass
+        
+        if user_id is None and hasattr(request, 'session'):
+            user_id = request.session.get(SESSION_KEY)
+        
+        if user_id is not None:
+            return f'replica-pin:user:{user_id}'
+        
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if x_forwarded_for:
+            ip_address = x_forwarded_for.split(',')[0]
+        else:
+            ip_address = request.META.get('REMOTE_ADDR')
+        return f'replica-pin:ip:{ip_address}'
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:51
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0005_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevocationFilter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bits', models.BinaryField()),
+                ('hash_count', models.PositiveSmallIntegerField()),
+                ('capacity', models.PositiveIntegerField()),
+                ('item_count', models.PositiveIntegerField()),
+                ('built_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jti', models.CharField(max_length=255, unique=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('revoked_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('recorded_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
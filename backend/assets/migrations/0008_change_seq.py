@@ -0,0 +1,91 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:12
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def number_existing_rows(apps, schema_editor):
+    """Give existing rows distinct change sequence numbers so a first sync returns them"""
+    using = schema_editor.connection.alias
+    offset = 0
+    for name in ['Inventory', 'Purchase', 'Transfer', 'Assignment', 'Expenditure']:
+        model = apps.get_model('assets', name)
+        rows = model.objects.using(using)
+        rows.update(change_seq=F('id') + offset)
+        offset += rows.aggregate(last=Max('id'))['last'] or 0
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0007_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='expenditure',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='inventory',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='transfer',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['change_seq'], name='assignment_change_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['updated_at'], name='assignment_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenditure',
+            index=models.Index(fields=['change_seq'], name='expenditure_change_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenditure',
+            index=models.Index(fields=['updated_at'], name='expenditure_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['change_seq'], name='inventory_change_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['updated_at'], name='inventory_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['change_seq'], name='purchase_change_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['updated_at'], name='purchase_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['change_seq'], name='transfer_change_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['updated_at'], name='transfer_updated_at_idx'),
+        ),
+        migrations.RunPython(number_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:19
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0008_change_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipmenttype',
+            name='minimum_stock',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minimum', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('lowest_quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('opened_at', models.DateTimeField(auto_now_add=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('resolved_quantity', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('base', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_alerts', to='assets.base')),
+                ('equipment_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_alerts', to='assets.equipmenttype')),
+            ],
+            options={
+                'ordering': ['-opened_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockThreshold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minimum', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)])),
+                ('resolve_at', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, validators=[django.core.validators.MinValueValidator(0)])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('base', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_thresholds', to='assets.base')),
+                ('equipment_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_thresholds', to='assets.equipmenttype')),
+            ],
+            options={
+                'ordering': ['base', 'equipment_type'],
+                'unique_together': {('base', 'equipment_type')},
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockalert',
+            constraint=models.UniqueConstraint(condition=models.Q(('resolved_at__isnull', True)), fields=('base', 'equipment_type'), name='one_open_stock_alert'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:20
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0009_stock_alerts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockthreshold',
+            name='target',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.CreateModel(
+            name='TransferCost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cost', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('from_base', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfer_costs_out', to='assets.base')),
+                ('to_base', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfer_costs_in', to='assets.base')),
+            ],
+            options={
+                'ordering': ['from_base', 'to_base'],
+                'unique_together': {('from_base', 'to_base')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0010_rebalancing'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='apilog',
+            index=models.Index(fields=['timestamp'], name='apilog_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apilog',
+            index=models.Index(fields=['user', 'timestamp'], name='apilog_user_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apilog',
+            index=models.Index(fields=['endpoint', 'timestamp'], name='apilog_endpoint_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0011_apilog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['assignment_date'], name='assignment_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenditure',
+            index=models.Index(fields=['expenditure_date'], name='expenditure_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['purchase_date'], name='purchase_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['transfer_date'], name='transfer_date_idx'),
+        ),
+    ]
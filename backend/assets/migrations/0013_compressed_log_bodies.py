@@ -0,0 +1,49 @@
+"""
+APILog bodies become zlib-compressed binary columns (CompressedTextField).
+
+Existing bodies are kept as they are and read back unchanged. PostgreSQL
+converts the column with convert_to(), since the default text::bytea
+cast would treat backslashes in JSON as escapes.
+"""
+import assets.models
+from django.db import migrations
+
+BODY_FIELDS = ['request_body', 'response_body']
+
+
+def compress_columns(apps, schema_editor):
+    APILog = apps.get_model('assets', 'APILog')
+    for name in BODY_FIELDS:
+        old_field = APILog._meta.get_field(name)
+        new_field = assets.models.CompressedTextField(blank=True)
+        new_field.set_attributes_from_name(name)
+        new_field.model = APILog
+        if schema_editor.connection.vendor == 'postgresql':
+            table = schema_editor.quote_name(APILog._meta.db_table)
+            column = schema_editor.quote_name(old_field.column)
+            schema_editor.execute(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE bytea USING convert_to({column}, 'UTF8')"
+            )
+        else:
+            schema_editor.alter_field(APILog, old_field, new_field)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0012_date_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(compress_columns)],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='apilog',
+                    name=name,
+                    field=assets.models.CompressedTextField(blank=True),
+                )
+                for name in BODY_FIELDS
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0014_org_hierarchy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipmenttype',
+            name='is_serialized',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='SerializedAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('serial_number', models.CharField(max_length=64)),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'Available'), (2, 'Assigned'), (3, 'In Transit'), (4, 'Maintenance'), (5, 'Retired')], default=1)),
+                ('assignee', models.CharField(blank=True, max_length=100)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('base', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='serialized_assets', to='assets.base')),
+                ('equipment_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='serialized_assets', to='assets.equipmenttype')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['base', 'status', 'equipment_type'], name='serialized_asset_base_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='serializedasset',
+            constraint=models.UniqueConstraint(fields=('serial_number', 'equipment_type'), name='serialized_asset_serial_uniq'),
+        ),
+    ]
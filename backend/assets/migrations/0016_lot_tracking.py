@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:01
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0015_serialized_assets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipmenttype',
+            name='lot_policy',
+            field=models.CharField(blank=True, choices=[('', 'Not lot-tracked'), ('fifo', 'First in, first out'), ('fefo', 'First expired, first out')], default='', max_length=4),
+        ),
+        migrations.CreateModel(
+            name='StockLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lot_number', models.CharField(max_length=100)),
+                ('received_at', models.DateTimeField()),
+                ('expires_at', models.DateField(blank=True, null=True)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)])),
+                ('remaining', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)])),
+                ('recalled', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('base', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stock_lots', to='assets.base')),
+                ('equipment_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_lots', to='assets.equipmenttype')),
+                ('purchase', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lots', to='assets.purchase')),
+            ],
+            options={
+                'ordering': ['expires_at', 'received_at', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LotAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('assignment', 'Assignment'), ('expenditure', 'Expenditure'), ('transfer', 'Transfer')], max_length=20)),
+                ('transaction_id', models.BigIntegerField()),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('returned', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('base', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='lot_allocations', to='assets.base')),
+                ('lot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='assets.stocklot')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stocklot',
+            index=models.Index(condition=models.Q(('remaining__gt', 0)), fields=['base', 'equipment_type', 'expires_at', 'received_at'], name='stock_lot_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocklot',
+            index=models.Index(condition=models.Q(('remaining__gt', 0)), fields=['expires_at', 'base', 'equipment_type'], name='stock_lot_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocklot',
+            index=models.Index(fields=['lot_number', 'equipment_type'], name='stock_lot_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lotallocation',
+            index=models.Index(fields=['kind', 'transaction_id'], name='lot_allocation_txn_idx'),
+        ),
+    ]
@@ -0,0 +1,116 @@
+"""
+Quantities become fixed-point integers (QuantityField), step 1 of 2.
+
+Every quantity column gets a bigint ``<name>_hundredths`` twin, filled in
+batches of BATCH_SIZE rows, each in its own transaction, so no table is
+locked for long and the running code keeps writing the old columns. On
+PostgreSQL a trigger keeps the twins in step with those writes, and a
+NOT VALID check validated once the backfill is done lets 0018 set NOT
+NULL without scanning the table. 0018 points the fields at the twins
+and makes the triggers two-way, so the previous release and this one
+can serve side by side; the whole series runs from the usual deploy
+``migrate``.
+"""
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 10000
+
+# model -> [(field, nullable, default)]
+QUANTITY_FIELDS = {
+    'equipmenttype': [('minimum_stock', True, None)],
+    'inventory': [('quantity', False, 0)],
+    'purchase': [('quantity', False, None)],
+    'transfer': [('quantity', False, None)],
+    'assignment': [('assigned_quantity', False, None), ('returned_quantity', False, 0)],
+    'expenditure': [('quantity', False, None)],
+    'stocklot': [('quantity', False, None), ('remaining', False, None)],
+    'lotallocation': [('quantity', False, None), ('returned', False, 0)],
+    'stockthreshold': [('minimum', False, None), ('resolve_at', True, None), ('target', True, None)],
+    'stockalert': [
+        ('minimum', False, None), ('quantity', False, None),
+        ('lowest_quantity', False, None), ('resolved_quantity', True, None),
+    ],
+}
+
+
+def _hundredths(column):
+    return f'CAST(ROUND({column} * 100) AS BIGINT)'
+
+
+def _twin(nullable, default):
+    # Same default as the final field, so 0018's NOT NULL needs no backfill
+    if default is None:
+        return models.BigIntegerField(null=True, blank=nullable)
+    return models.BigIntegerField(null=True, blank=nullable, default=default)
+
+
+def start_dual_writes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    quote = schema_editor.quote_name
+    for model_name, fields in QUANTITY_FIELDS.items():
+        table = apps.get_model('assets', model_name)._meta.db_table
+        assignments = ' '.join(
+            f'NEW.{quote(name + "_hundredths")} := {_hundredths("NEW." + quote(name))};' for name, _, _ in fields
+        )
+        schema_editor.execute(
+            f'CREATE OR REPLACE FUNCTION {table}_hundredths() RETURNS trigger AS $$ '
+            f'BEGIN {assignments} RETURN NEW; END $$ LANGUAGE plpgsql'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER {table}_hundredths BEFORE INSERT OR UPDATE ON {quote(table)} '
+            f'FOR EACH ROW EXECUTE FUNCTION {table}_hundredths()'
+        )
+
+
+def backfill(apps, schema_editor):
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    for model_name, fields in QUANTITY_FIELDS.items():
+        model = apps.get_model('assets', model_name)
+        table = quote(model._meta.db_table)
+        sets = ', '.join(f'{quote(name + "_hundredths")} = {_hundredths(quote(name))}' for name, _, _ in fields)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT MIN(id), MAX(id) FROM {table}')
+            first, last = cursor.fetchone()
+        if first is None:
+            continue
+        for start in range(first, last + 1, BATCH_SIZE):
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(f'UPDATE {table} SET {sets} WHERE id >= %s AND id < %s', [start, start + BATCH_SIZE])
+
+    if connection.vendor != 'postgresql':
+        return
+    for model_name, fields in QUANTITY_FIELDS.items():
+        table = apps.get_model('assets', model_name)._meta.db_table
+        for name, nullable, _ in fields:
+            if nullable:
+                continue
+            constraint = quote(f'{table}_{name}_hundredths_nn')
+            schema_editor.execute(
+                f'ALTER TABLE {quote(table)} ADD CONSTRAINT {constraint} '
+                f'CHECK ({quote(name + "_hundredths")} IS NOT NULL) NOT VALID'
+            )
+            schema_editor.execute(f'ALTER TABLE {quote(table)} VALIDATE CONSTRAINT {constraint}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('assets', '0016_lot_tracking'),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name=model_name,
+                name=f'{name}_hundredths',
+                field=_twin(nullable, default),
+            )
+            for model_name, fields in QUANTITY_FIELDS.items()
+            for name, nullable, default in fields
+        ],
+        migrations.RunPython(start_dual_writes, migrations.RunPython.noop),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,186 @@
+"""
+Quantities become fixed-point integers (QuantityField), step 2 of 2.
+
+Runs in one transaction after 0017 has filled the ``<name>_hundredths``
+twins, and is safe to apply while the previous release is still serving:
+
+- Each quantity field now maps to its twin (``db_column``). The old
+  NUMERIC column leaves the model state but not the database.
+- On PostgreSQL 0017's triggers become two-way. A write to either
+  column sets the other, so the previous release keeps reading and
+  writing NUMERIC quantities while this one uses hundredths. NOT NULL
+  on the twins is proven by 0017's validated checks, which are dropped
+  afterwards, so nothing here scans a table.
+- Other databases have no triggers and no rolling deploys: their twins
+  are recomputed and the old columns dropped here.
+
+The StockLot indexes on ``remaining`` are dropped here and rebuilt on
+the twin by 0019. Once no process of the previous release is left, a
+later release drops the NUMERIC columns and the triggers.
+"""
+import django.core.validators
+from django.db import migrations
+
+import assets.models
+
+# model -> {field: final field}
+QUANTITY_FIELDS = {
+    'equipmenttype': {
+        'minimum_stock': assets.models.QuantityField(
+            db_column='minimum_stock_hundredths', null=True, blank=True,
+            validators=[django.core.validators.MinValueValidator(0)],
+        ),
+    },
+    'inventory': {
+        'quantity': assets.models.QuantityField(
+            db_column='quantity_hundredths', default=0, validators=[django.core.validators.MinValueValidator(0)]
+        ),
+    },
+    'purchase': {
+        'quantity': assets.models.QuantityField(
+            db_column='quantity_hundredths', validators=[django.core.validators.MinValueValidator(0.01)]
+        ),
+    },
+    'transfer': {
+        'quantity': assets.models.QuantityField(
+            db_column='quantity_hundredths', validators=[django.core.validators.MinValueValidator(0.01)]
+        ),
+    },
+    'assignment': {
+        'assigned_quantity': assets.models.QuantityField(
+            db_column='assigned_quantity_hundredths', validators=[django.core.validators.MinValueValidator(0.01)]
+        ),
+        'returned_quantity': assets.models.QuantityField(
+            db_column='returned_quantity_hundredths', default=0,
+            validators=[django.core.validators.MinValueValidator(0)],
+        ),
+    },
+    'expenditure': {
+        'quantity': assets.models.QuantityField(
+            db_column='quantity_hundredths', validators=[django.core.validators.MinValueValidator(0.01)]
+        ),
+    },
+    'stocklot': {
+        'quantity': assets.models.QuantityField(
+            db_column='quantity_hundredths', validators=[django.core.validators.MinValueValidator(0)]
+        ),
+        'remaining': assets.models.QuantityField(
+            db_column='remaining_hundredths', validators=[django.core.validators.MinValueValidator(0)]
+        ),
+    },
+    'lotallocation': {
+        'quantity': assets.models.QuantityField(db_column='quantity_hundredths'),
+        'returned': assets.models.QuantityField(db_column='returned_hundredths', default=0),
+    },
+    'stockthreshold': {
+        'minimum': assets.models.QuantityField(
+            db_column='minimum_hundredths', validators=[django.core.validators.MinValueValidator(0)]
+        ),
+        'resolve_at': assets.models.QuantityField(
+            db_column='resolve_at_hundredths', null=True, blank=True,
+            validators=[django.core.validators.MinValueValidator(0)],
+        ),
+        'target': assets.models.QuantityField(
+            db_column='target_hundredths', null=True, blank=True,
+            validators=[django.core.validators.MinValueValidator(0)],
+        ),
+    },
+    'stockalert': {
+        'minimum': assets.models.QuantityField(db_column='minimum_hundredths'),
+        'quantity': assets.models.QuantityField(db_column='quantity_hundredths'),
+        'lowest_quantity': assets.models.QuantityField(db_column='lowest_quantity_hundredths'),
+        'resolved_quantity': assets.models.QuantityField(db_column='resolved_quantity_hundredths', null=True, blank=True),
+    },
+}
+
+
+def _hundredths(column):
+    return f'CAST(ROUND({column} * 100) AS BIGINT)'
+
+
+def _nullable(field):
+    # The final field as the twin still is: NOT NULL comes after the switch
+    _, _, args, kwargs = field.deconstruct()
+    return assets.models.QuantityField(*args, **{**kwargs, 'null': True})
+
+
+class RemoveFieldUnlessPostgres(migrations.RemoveField):
+    """RemoveField that keeps the column on PostgreSQL for the previous release"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def sync_both_ways(apps, schema_editor):
+    quote = schema_editor.quote_name
+    for model_name, fields in QUANTITY_FIELDS.items():
+        table = apps.get_model('assets', model_name)._meta.db_table
+        if schema_editor.connection.vendor != 'postgresql':
+            sets = ', '.join(f'{quote(field.db_column)} = {_hundredths(quote(name))}' for name, field in fields.items())
+            schema_editor.execute(f'UPDATE {quote(table)} SET {sets}')
+            continue
+        # Inserts fill whichever column the writer left NULL; updates copy
+        # whichever column the writer changed
+        on_insert, on_update = [], []
+        for name, field in fields.items():
+            old, new = f'NEW.{quote(name)}', f'NEW.{quote(field.db_column)}'
+            on_insert.append(
+                f'IF {new} IS NULL THEN {new} := {_hundredths(old)}; '
+                f'ELSIF {old} IS NULL THEN {old} := {new} / 100.0; END IF;'
+            )
+            on_update.append(
+                f'IF {old} IS DISTINCT FROM OLD.{quote(name)} THEN {new} := {_hundredths(old)}; '
+                f'ELSIF {new} IS DISTINCT FROM OLD.{quote(field.db_column)} THEN {old} := {new} / 100.0; END IF;'
+            )
+        schema_editor.execute(
+            f'CREATE OR REPLACE FUNCTION {table}_hundredths() RETURNS trigger AS $$ BEGIN '
+            f"IF TG_OP = 'INSERT' THEN {' '.join(on_insert)} ELSE {' '.join(on_update)} END IF; "
+            f'RETURN NEW; END $$ LANGUAGE plpgsql'
+        )
+
+
+def drop_not_null_checks(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    quote = schema_editor.quote_name
+    for model_name, fields in QUANTITY_FIELDS.items():
+        table = apps.get_model('assets', model_name)._meta.db_table
+        for name, field in fields.items():
+            if not field.null:
+                schema_editor.execute(
+                    f'ALTER TABLE {quote(table)} DROP CONSTRAINT IF EXISTS {quote(f"{table}_{name}_hundredths_nn")}'
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0017_quantity_hundredths'),
+    ]
+
+    operations = [
+        migrations.RunPython(sync_both_ways, migrations.RunPython.noop),
+        # Their conditions read stocklot.remaining
+        migrations.RemoveIndex(model_name='stocklot', name='stock_lot_open_idx'),
+        migrations.RemoveIndex(model_name='stocklot', name='stock_lot_expiry_idx'),
+        *[
+            operation
+            for model_name, fields in QUANTITY_FIELDS.items()
+            for name, field in fields.items()
+            for operation in [
+                RemoveFieldUnlessPostgres(model_name=model_name, name=name),
+                # The twin keeps its column and takes the field's name
+                migrations.SeparateDatabaseAndState(state_operations=[
+                    migrations.RenameField(model_name=model_name, old_name=field.db_column, new_name=name),
+                    migrations.AlterField(model_name=model_name, name=name, field=_nullable(field)),
+                ]),
+                *([] if field.null else [migrations.AlterField(model_name=model_name, name=name, field=field)]),
+            ]
+        ],
+        migrations.RunPython(drop_not_null_checks, migrations.RunPython.noop),
+    ]
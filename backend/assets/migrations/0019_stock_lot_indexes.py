@@ -0,0 +1,51 @@
+"""
+Rebuilds the StockLot partial indexes 0018 dropped, on the
+``remaining_hundredths`` column.
+
+On PostgreSQL they are built with CREATE INDEX CONCURRENTLY, outside a
+transaction, so StockLot stays writable while the table is scanned.
+Other databases build them as usual.
+"""
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    """AddIndexConcurrently on PostgreSQL, a plain AddIndex elsewhere"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('assets', '0018_fixed_point_quantities'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='stocklot',
+            index=models.Index(
+                condition=models.Q(('remaining__gt', 0)),
+                fields=['base', 'equipment_type', 'expires_at', 'received_at'], name='stock_lot_open_idx'
+            ),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='stocklot',
+            index=models.Index(
+                condition=models.Q(('remaining__gt', 0)),
+                fields=['expires_at', 'base', 'equipment_type'], name='stock_lot_expiry_idx'
+            ),
+        ),
+    ]
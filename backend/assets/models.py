@@ -1,6 +1,77 @@
-from django.db import models
+import zlib
+from decimal import ROUND_HALF_UP, Decimal, DecimalException
+
+from django import forms
+from django.db import IntegrityError, models, router, transaction
+from django.db.models.expressions import register_combinable_fields
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+
+
+class QuantityField(models.Field):
+    """
+    Quantity stored as a 64-bit integer count of hundredths and read back
+    as a two-place Decimal, so SUMs and comparisons run on integers while
+    forms and serializers still see ``max_digits=10, decimal_places=2``.
+    
+    Python values combined with these columns in SQL (``F('quantity') +
+    delta``) must be scaled too: wrap them with quantity_value(). Mixing
+    a QuantityField with a plain Decimal in an expression raises
+    FieldError instead of silently adding unscaled numbers.
+    
+    The columns are named ``<field>_hundredths``: migrations 0017 and 0018
+    added them next to the old NUMERIC columns, which PostgreSQL keeps in
+    step for processes of the previous release until a later release
+    drops them.
+    """
+    description = 'Quantity (hundredths, stored as an integer)'
+    SCALE = 100
+    max_digits = 10
+    decimal_places = 2
+    
+    def get_internal_type(self):
+        return 'BigIntegerField'
+    
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal) and value.as_tuple().exponent == -self.decimal_places:
+            return value
+        try:
+            value = Decimal(value) if isinstance(value, (int, Decimal)) else Decimal(str(value))
+            return value.quantize(Decimal(1).scaleb(-self.decimal_places), rounding=ROUND_HALF_UP)
+        except (DecimalException, ValueError, TypeError):
+            raise ValidationError(f'"{value}" is not a valid quantity.', code='invalid')
+    
+    def get_prep_value(self, value):
+        value = self.to_python(super().get_prep_value(value))
+        return None if value is None else int(value.scaleb(self.decimal_places))
+    
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        # SUM() over bigint is numeric on PostgreSQL; AVG() is a float on SQLite
+        value = Decimal(value) if isinstance(value, (int, Decimal)) else Decimal(str(value))
+        return value.scaleb(-self.decimal_places)
+    
+    def formfield(self, **kwargs):
+        return super().formfield(**{
+            'form_class': forms.DecimalField,
+            'max_digits': self.max_digits,
+            'decimal_places': self.decimal_places,
+            **kwargs,
+        })
+
+
+# Sums and differences of quantities are quantities
+for connector in ('+', '-'):
+    register_combinable_fields(QuantityField, connector, QuantityField, QuantityField)
+
+
+def quantity_value(value):
+    """``value`` as a SQL expression scaled like a QuantityField column"""
+    return models.Value(value, output_field=QuantityField())
 
 
 class BaseModel(models.Model):
@@ -13,11 +84,147 @@ class BaseModel(models.Model):
         abstract = True
 
 
+class ChangeTrackedModel(models.Model):
+    """
+    Stamps every save with the next change sequence number of the row's
+    database, for delta sync (see assets/sync.py).
+    
+    The number is taken in the same transaction as the write, so the
+    counter's row lock orders commits: once a reader sees a sequence
+    number, every lower one on that database is already visible.
+    Writes that bypass save() (update(), bulk_create()) must set
+    ``change_seq`` from next_change_seq() themselves.
+    """
+    change_seq = models.BigIntegerField(default=0, editable=False)
+    
+    class Meta:
+        abstract = True
+        indexes = [
+            models.Index(fields=['change_seq'], name='%(class)s_change_seq_idx'),
+            models.Index(fields=['updated_at'], name='%(class)s_updated_at_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'change_seq'}
+        with transaction.atomic(using=using):
+            self.change_seq = next_change_seq(using)
+            super().save(*args, **kwargs)
+
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    QuerySet for tables partitioned by base (see assets/sharding.py).
+    
+    create() lets the router pick the database from the instance's base
+    unless a database was chosen explicitly with using()/db_manager().
+    """
+    
+    def create(self, **kwargs):
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+
+class OrgNode(models.Model):
+    """
+    Theater, region or command above the bases (see assets/hierarchy.py).
+    
+    Each node sits under a node of a higher level. save() keeps
+    OrgNodeClosure in step on the default database, which holds the tree;
+    shards only get mirrored nodes so their bases' foreign keys resolve.
+    """
+    LEVEL_CHOICES = [
+        ('theater', 'Theater'),
+        ('region', 'Region'),
+        ('command', 'Command'),
+    ]
+    LEVELS = [level for level, _ in LEVEL_CHOICES]
+    
+    name = models.CharField(max_length=200)
+    code = models.CharField(max_length=50, unique=True)
+    level = models.CharField(max_length=20, choices=LEVEL_CHOICES)
+    parent = models.ForeignKey('self', on_delete=models.PROTECT, null=True, blank=True, related_name='children')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['name']
+        
+    def __str__(self):
+        return f"{self.name} ({self.get_level_display()})"
+    
+    def hierarchy_error(self):
+        """Why this node cannot have its parent and level, or None"""
+        rank = self.LEVELS.index(self.level)
+        if self.parent is not None and self.LEVELS.index(self.parent.level) >= rank:
+            return f"A {self.get_level_display().lower()} cannot sit under a {self.parent.get_level_display().lower()}"
+        # Levels strictly decrease downwards, which also rules out cycles
+        if self.pk is not None and self.children.filter(level__in=self.LEVELS[:rank + 1]).exists():
+            return f"A {self.get_level_display().lower()} cannot hold its current child nodes"
+        return None
+    
+    def clean(self):
+        error = self.hierarchy_error()
+        if error:
+            raise ValidationError({'parent': error})
+    
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            previous = OrgNode.objects.using(using).filter(pk=self.pk).values_list('parent_id', flat=True)
+            exists = self.pk is not None and previous.exists()
+            moved = exists and previous.get() != self.parent_id
+            super().save(*args, **kwargs)
+            if using != 'default':
+                return
+            if not exists:
+                self._link_subtree([(self.pk, 0)])
+            elif moved:
+                subtree = list(OrgNodeClosure.objects.filter(ancestor_id=self.pk).values_list('descendant_id', 'depth'))
+                descendant_ids = [descendant_id for descendant_id, _ in subtree]
+                OrgNodeClosure.objects.filter(descendant_id__in=descendant_ids).exclude(ancestor_id__in=descendant_ids).delete()
+                self._link_subtree(subtree, self_links=False)
+    
+    def _link_subtree(self, subtree, self_links=True):
+        """Link ``subtree`` ((node id, depth below self) pairs) to self's ancestors"""
+        ancestors = [(self.pk, 0)] if self_links else []
+        if self.parent_id is not None:
+            ancestors += [
+                (ancestor_id, depth + 1) for ancestor_id, depth in
+                OrgNodeClosure.objects.filter(descendant_id=self.parent_id).values_list('ancestor_id', 'depth')
+            ]
+        OrgNodeClosure.objects.bulk_create([
+            OrgNodeClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=above + below)
+            for ancestor_id, above in ancestors
+            for descendant_id, below in subtree
+        ])
+
+
+class OrgNodeClosure(models.Model):
+    """Every (ancestor, descendant) pair of OrgNodes, each node paired with itself at depth 0"""
+    ancestor = models.ForeignKey(OrgNode, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(OrgNode, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+    
+    class Meta:
+        # Doubles as the index for "everything beneath a node"; the
+        # descendant foreign key's index serves "every node above one"
+        unique_together = ['ancestor', 'descendant']
+        
+    def __str__(self):
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
+
+
 class Base(BaseModel):
     """Military base information"""
     name = models.CharField(max_length=200, unique=True)
     location = models.CharField(max_length=300)
     code = models.CharField(max_length=50, unique=True)
+    # Usually a command; rollups include every base beneath a node
+    org_node = models.ForeignKey(OrgNode, on_delete=models.SET_NULL, null=True, blank=True, related_name='bases')
     
     class Meta:
         ordering = ['name']
@@ -31,6 +238,19 @@ class EquipmentType(BaseModel):
     name = models.CharField(max_length=200, unique=True)
     description = models.TextField(blank=True)
     unit = models.CharField(max_length=50, default='units')  # e.g., units, kg, liters
+    # Default low-stock level for every base (see StockThreshold)
+    minimum_stock = QuantityField(
+        db_column='minimum_stock_hundredths', null=True, blank=True, validators=[MinValueValidator(0)]
+    )
+    # Tracked item by item (SerializedAsset); Inventory then follows the items
+    is_serialized = models.BooleanField(default=False)
+    # Stock kept per purchase lot (StockLot) and drawn in this order
+    LOT_POLICY_CHOICES = [
+        ('', 'Not lot-tracked'),
+        ('fifo', 'First in, first out'),
+        ('fefo', 'First expired, first out'),
+    ]
+    lot_policy = models.CharField(max_length=4, choices=LOT_POLICY_CHOICES, blank=True, default='')
     
     class Meta:
         ordering = ['name']
@@ -39,15 +259,17 @@ class EquipmentType(BaseModel):
         return self.name
 
 
-class Inventory(models.Model):
+class Inventory(ChangeTrackedModel):
     """Current inventory levels at each base"""
     base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='inventory')
     equipment_type = models.ForeignKey(EquipmentType, on_delete=models.CASCADE, related_name='inventory')
-    quantity = models.DecimalField(max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(0)])
+    quantity = QuantityField(db_column='quantity_hundredths', default=0, validators=[MinValueValidator(0)])
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
-    class Meta:
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta(ChangeTrackedModel.Meta):
         unique_together = ['base', 'equipment_type']
         ordering = ['base', 'equipment_type']
         verbose_name_plural = 'Inventories'
@@ -56,23 +278,29 @@ class Inventory(models.Model):
         return f"{self.base.name} - {self.equipment_type.name}: {self.quantity}"
 
 
-class Purchase(BaseModel):
+class Purchase(ChangeTrackedModel, BaseModel):
     """Asset purchase records"""
     base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='purchases')
     equipment_type = models.ForeignKey(EquipmentType, on_delete=models.CASCADE, related_name='purchases')
-    quantity = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
+    quantity = QuantityField(db_column='quantity_hundredths', validators=[MinValueValidator(0.01)])
     supplier = models.CharField(max_length=300)
     purchase_date = models.DateTimeField()
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='purchases_created')
     
-    class Meta:
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta(ChangeTrackedModel.Meta):
         ordering = ['-purchase_date']
+        # Default ordering and date drilldowns (admin date_hierarchy)
+        indexes = ChangeTrackedModel.Meta.indexes + [
+            models.Index(fields=['purchase_date'], name='purchase_date_idx'),
+        ]
         
     def __str__(self):
         return f"Purchase: {self.equipment_type.name} - {self.quantity} @ {self.base.name}"
 
 
-class Transfer(BaseModel):
+class Transfer(ChangeTrackedModel, BaseModel):
     """Asset transfers between bases"""
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -84,32 +312,44 @@ class Transfer(BaseModel):
     from_base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='transfers_out')
     to_base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='transfers_in')
     equipment_type = models.ForeignKey(EquipmentType, on_delete=models.CASCADE, related_name='transfers')
-    quantity = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
+    quantity = QuantityField(db_column='quantity_hundredths', validators=[MinValueValidator(0.01)])
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     transfer_date = models.DateTimeField()
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='transfers_created')
     
-    class Meta:
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta(ChangeTrackedModel.Meta):
         ordering = ['-transfer_date']
+        # Default ordering and date drilldowns (admin date_hierarchy)
+        indexes = ChangeTrackedModel.Meta.indexes + [
+            models.Index(fields=['transfer_date'], name='transfer_date_idx'),
+        ]
         
     def __str__(self):
         return f"Transfer: {self.equipment_type.name} from {self.from_base.name} to {self.to_base.name}"
 
 
-class Assignment(BaseModel):
+class Assignment(ChangeTrackedModel, BaseModel):
     """Asset assignments to personnel"""
     base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='assignments')
     equipment_type = models.ForeignKey(EquipmentType, on_delete=models.CASCADE, related_name='assignments')
     personnel_name = models.CharField(max_length=200)
     personnel_id = models.CharField(max_length=100, blank=True)
-    assigned_quantity = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
-    returned_quantity = models.DecimalField(max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(0)])
+    assigned_quantity = QuantityField(db_column='assigned_quantity_hundredths', validators=[MinValueValidator(0.01)])
+    returned_quantity = QuantityField(db_column='returned_quantity_hundredths', default=0, validators=[MinValueValidator(0)])
     assignment_date = models.DateTimeField()
     return_date = models.DateTimeField(null=True, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='assignments_created')
     
-    class Meta:
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta(ChangeTrackedModel.Meta):
         ordering = ['-assignment_date']
+        # Default ordering and date drilldowns (admin date_hierarchy)
+        indexes = ChangeTrackedModel.Meta.indexes + [
+            models.Index(fields=['assignment_date'], name='assignment_date_idx'),
+        ]
         
     def __str__(self):
         return f"Assignment: {self.equipment_type.name} to {self.personnel_name}"
@@ -119,22 +359,226 @@ class Assignment(BaseModel):
         return self.assigned_quantity - self.returned_quantity
 
 
-class Expenditure(BaseModel):
+class Expenditure(ChangeTrackedModel, BaseModel):
     """Expended/consumed assets"""
     base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='expenditures')
     equipment_type = models.ForeignKey(EquipmentType, on_delete=models.CASCADE, related_name='expenditures')
-    quantity = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
+    quantity = QuantityField(db_column='quantity_hundredths', validators=[MinValueValidator(0.01)])
     reason = models.TextField()
     expenditure_date = models.DateTimeField()
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='expenditures_created')
     
-    class Meta:
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta(ChangeTrackedModel.Meta):
         ordering = ['-expenditure_date']
+        # Default ordering and date drilldowns (admin date_hierarchy)
+        indexes = ChangeTrackedModel.Meta.indexes + [
+            models.Index(fields=['expenditure_date'], name='expenditure_date_idx'),
+        ]
         
     def __str__(self):
         return f"Expenditure: {self.equipment_type.name} - {self.quantity} @ {self.base.name}"
 
 
+class SerializedAsset(models.Model):
+    """
+    One serial-numbered item of a serialized equipment type (see
+    assets/serialized.py).
+    
+    Kept narrow for tables of tens of millions of rows: a small integer
+    status, no soft delete (items are retired) and only the indexes the
+    API reads through. Items at a base in an on-hand status count towards
+    its Inventory.
+    """
+    AVAILABLE = 1
+    ASSIGNED = 2
+    IN_TRANSIT = 3
+    MAINTENANCE = 4
+    RETIRED = 5
+    STATUS_CHOICES = [
+        (AVAILABLE, 'Available'),
+        (ASSIGNED, 'Assigned'),
+        (IN_TRANSIT, 'In Transit'),
+        (MAINTENANCE, 'Maintenance'),
+        (RETIRED, 'Retired'),
+    ]
+    # API names of the statuses
+    STATUS_NAMES = {
+        AVAILABLE: 'available',
+        ASSIGNED: 'assigned',
+        IN_TRANSIT: 'in_transit',
+        MAINTENANCE: 'maintenance',
+        RETIRED: 'retired',
+    }
+    ON_HAND = [AVAILABLE, MAINTENANCE]
+    
+    serial_number = models.CharField(max_length=64)
+    equipment_type = models.ForeignKey(EquipmentType, on_delete=models.CASCADE, related_name='serialized_assets')
+    # Served by the (base, status, equipment_type) index
+    base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='serialized_assets', db_index=False)
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=AVAILABLE)
+    # Personnel id while assigned
+    assignee = models.CharField(max_length=100, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            # Also the index for lookups by serial number alone
+            models.UniqueConstraint(fields=['serial_number', 'equipment_type'], name='serialized_asset_serial_uniq'),
+        ]
+        indexes = [
+            # Per-base and per-status counts, and the items of one base
+            models.Index(fields=['base', 'status', 'equipment_type'], name='serialized_asset_base_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.serial_number} ({self.get_status_display()})"
+
+
+class StockLot(models.Model):
+    """
+    Stock of a lot-tracked equipment type received at a base by one
+    purchase or transfer (see assets/lots.py).
+    
+    ``remaining`` is what is left after FIFO/FEFO draws; the base's
+    Inventory stays the authoritative total. Recalled lots are never
+    drawn from.
+    """
+    base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='stock_lots', db_index=False)
+    equipment_type = models.ForeignKey(EquipmentType, on_delete=models.CASCADE, related_name='stock_lots')
+    # The purchase that brought the lot in; it lives on the lot's first
+    # shard, so lots transferred to another shard keep a dangling id
+    purchase = models.ForeignKey(
+        Purchase, on_delete=models.SET_NULL, null=True, blank=True, related_name='lots', db_constraint=False
+    )
+    lot_number = models.CharField(max_length=100)
+    received_at = models.DateTimeField()
+    expires_at = models.DateField(null=True, blank=True)
+    quantity = QuantityField(db_column='quantity_hundredths', validators=[MinValueValidator(0)])
+    remaining = QuantityField(db_column='remaining_hundredths', validators=[MinValueValidator(0)])
+    recalled = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['expires_at', 'received_at', 'id']
+        indexes = [
+            # FIFO/FEFO draws read the open lots of one base and equipment type
+            models.Index(
+                fields=['base', 'equipment_type', 'expires_at', 'received_at'],
+                condition=models.Q(remaining__gt=0), name='stock_lot_open_idx'
+            ),
+            # "What expires in the next N days" across every base
+            models.Index(
+                fields=['expires_at', 'base', 'equipment_type'],
+                condition=models.Q(remaining__gt=0), name='stock_lot_expiry_idx'
+            ),
+            # Recalls find every copy of a lot
+            models.Index(fields=['lot_number', 'equipment_type'], name='stock_lot_number_idx'),
+        ]
+        
+    def __str__(self):
+        return f"Lot {self.lot_number}: {self.remaining}/{self.quantity}"
+
+
+class LotAllocation(models.Model):
+    """Quantity an assignment, expenditure or outgoing transfer drew from a lot"""
+    KIND_CHOICES = [
+        ('assignment', 'Assignment'),
+        ('expenditure', 'Expenditure'),
+        ('transfer', 'Transfer'),
+    ]
+    
+    lot = models.ForeignKey(StockLot, on_delete=models.CASCADE, related_name='allocations')
+    # The lot's base, so allocations shard with their lots
+    base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='lot_allocations', db_index=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    transaction_id = models.BigIntegerField()
+    quantity = QuantityField(db_column='quantity_hundredths')
+    # Handed back to the lot by assignment returns
+    returned = QuantityField(db_column='returned_hundredths', default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['kind', 'transaction_id'], name='lot_allocation_txn_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.kind} #{self.transaction_id}: {self.quantity} from lot {self.lot_id}"
+
+
+class StockThreshold(models.Model):
+    """Low-stock level for one base, overriding the equipment type's minimum_stock"""
+    base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='stock_thresholds')
+    equipment_type = models.ForeignKey(EquipmentType, on_delete=models.CASCADE, related_name='stock_thresholds')
+    minimum = QuantityField(db_column='minimum_hundredths', validators=[MinValueValidator(0)])
+    # An open alert resolves once stock reaches this; default minimum * (1 + STOCK_ALERT_HYSTERESIS)
+    resolve_at = QuantityField(db_column='resolve_at_hundredths', null=True, blank=True, validators=[MinValueValidator(0)])
+    # Stock level rebalancing aims for (assets/rebalancing.py); default resolve_at
+    target = QuantityField(db_column='target_hundredths', null=True, blank=True, validators=[MinValueValidator(0)])
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['base', 'equipment_type']
+        ordering = ['base', 'equipment_type']
+        
+    def __str__(self):
+        return f"{self.base_id}/{self.equipment_type_id} < {self.minimum}"
+
+
+class TransferCost(models.Model):
+    """Per-unit cost of moving stock between two bases, used by rebalancing"""
+    from_base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='transfer_costs_out')
+    to_base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='transfer_costs_in')
+    cost = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['from_base', 'to_base']
+        ordering = ['from_base', 'to_base']
+        
+    def __str__(self):
+        return f"{self.from_base_id} -> {self.to_base_id}: {self.cost}"
+
+
+class StockAlert(models.Model):
+    """A period during which a base's stock of an equipment type was below its threshold"""
+    base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='stock_alerts')
+    equipment_type = models.ForeignKey(EquipmentType, on_delete=models.CASCADE, related_name='stock_alerts')
+    minimum = QuantityField(db_column='minimum_hundredths')
+    # Stock when the alert opened, and the lowest it reached while open
+    quantity = QuantityField(db_column='quantity_hundredths')
+    lowest_quantity = QuantityField(db_column='lowest_quantity_hundredths')
+    opened_at = models.DateTimeField(auto_now_add=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    resolved_quantity = QuantityField(db_column='resolved_quantity_hundredths', null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-opened_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['base', 'equipment_type'], condition=models.Q(resolved_at__isnull=True),
+                name='one_open_stock_alert'
+            ),
+        ]
+        
+    def __str__(self):
+        state = 'resolved' if self.resolved_at else 'open'
+        return f"{self.base_id}/{self.equipment_type_id}: {self.lowest_quantity} < {self.minimum} ({state})"
+
+
 class UserRole(models.Model):
     """User role assignments with base restrictions"""
     ROLE_CHOICES = [
@@ -146,6 +590,8 @@ class UserRole(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='role')
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
     assigned_base = models.ForeignKey(Base, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_users')
+    # Base commanders also see every base beneath this node
+    assigned_node = models.ForeignKey(OrgNode, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_users')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -172,19 +618,202 @@ class RoleCode(models.Model):
         return f"{self.get_role_display()} - {self.code}"
 
 
+class CompressedTextField(models.BinaryField):
+    """
+    Text stored zlib-compressed. Accepts str or (UTF-8) bytes and reads back
+    as str; bytes that are not valid UTF-8, e.g. a body cut mid-character,
+    are replaced. Rows written before compression read back unchanged.
+    """
+    
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        return zlib.compress(bytes(value)) if value else b''
+    
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, str):
+            return value
+        value = bytes(value)
+        try:
+            value = zlib.decompress(value) if value else b''
+        except zlib.error:
+            pass
+        return value.decode('utf-8', errors='replace')
+    
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return bytes(value).decode('utf-8', errors='replace')
+        return value
+    
+    def value_to_string(self, obj):
+        return self.to_python(self.value_from_object(obj)) or ''
+
+
 class APILog(models.Model):
     """API request/response logging for audit trail"""
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     endpoint = models.CharField(max_length=500)
     method = models.CharField(max_length=10)
     status_code = models.IntegerField()
-    request_body = models.TextField(blank=True)
-    response_body = models.TextField(blank=True)
+    # Captured by policy (assets/middleware.py), often empty
+    request_body = CompressedTextField(blank=True)
+    response_body = CompressedTextField(blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-timestamp']
+        # Time-window queries, alone or for one user or endpoint (/audit-logs/)
+        indexes = [
+            models.Index(fields=['timestamp'], name='apilog_timestamp_idx'),
+            models.Index(fields=['user', 'timestamp'], name='apilog_user_timestamp_idx'),
+            models.Index(fields=['endpoint', 'timestamp'], name='apilog_endpoint_timestamp_idx'),
+        ]
         
     def __str__(self):
         return f"{self.method} {self.endpoint} - {self.status_code}"
+
+
+class BaseShard(models.Model):
+    """Shard map: which database alias holds a base's transactions and inventory"""
+    base = models.OneToOneField(Base, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    alias = models.CharField(max_length=50)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['base']
+        
+    def __str__(self):
+        return f"{self.base_id} -> {self.alias}"
+
+
+class ShardSequence(models.Model):
+    """
+    Ticket table: primary keys that are unique across shards (on
+    default) and each database's change sequence (see next_change_seq)
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    next_value = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+def next_change_seq(using, count=1):
+    """
+    Reserve ``count`` consecutive change sequence numbers on database
+    ``using`` and return the first. Call it inside a transaction on
+    ``using`` that also makes the write, so the counter stays locked
+    until the write commits.
+    """
+    name = 'assets.change_seq'
+    with transaction.atomic(using=using):
+        sequence = ShardSequence.objects.using(using).select_for_update().filter(name=name).first()
+        if sequence is None:
+            start = 1 + max(
+                model.objects.using(using).aggregate(last=models.Max('change_seq'))['last'] or 0
+                for model in ChangeTrackedModel.__subclasses__()
+            )
+            try:
+                with transaction.atomic(using=using):
+                    sequence = ShardSequence.objects.using(using).create(name=name, next_value=start)
+            except IntegrityError:
+                sequence = ShardSequence.objects.using(using).select_for_update().get(name=name)
+        start = sequence.next_value
+        sequence.next_value = start + count
+        sequence.save(using=using, update_fields=['next_value'])
+    return start
+
+
+class Job(models.Model):
+    """Background job queued by the API and run by ``manage.py run_workers``"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=100)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    progress = models.PositiveSmallIntegerField(default=0)
+    progress_message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_claim_idx'),
+        ]
+        
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+    
+    def report_progress(self, percent, message=''):
+        """Record progress (0-100) and refresh the worker heartbeat"""
+        self.progress = max(0, min(100, int(percent)))
+        self.progress_message = message[:255]
+        self.heartbeat_at = timezone.now()
+        Job.objects.filter(pk=self.pk).update(
+            progress=self.progress,
+            progress_message=self.progress_message,
+            heartbeat_at=self.heartbeat_at
+        )
+
+
+class RevokedToken(models.Model):
+    """Revoked refresh token id, kept until the token would have expired anyway"""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(default=timezone.now)
+    # Insert time; processes pick up rows recorded since their last sync
+    recorded_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return self.jti
+
+
+class RevocationFilter(models.Model):
+    """Persisted Bloom filter snapshot of RevokedToken, rebuilt periodically"""
+    bits = models.BinaryField()
+    hash_count = models.PositiveSmallIntegerField()
+    capacity = models.PositiveIntegerField()
+    item_count = models.PositiveIntegerField()
+    # Covers RevokedToken rows recorded before this time
+    built_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.item_count} tokens at {self.built_at}"
+
+
+class ImportCheckpoint(models.Model):
+    """Progress of a CSV transaction import, committed with each batch"""
+    # "<kind>:<absolute path>"
+    source = models.CharField(max_length=500, unique=True)
+    kind = models.CharField(max_length=20)
+    # File size and a hash of its head; a different file must not resume
+    fingerprint = models.CharField(max_length=100)
+    # CSV records consumed so far (inserted or rejected)
+    rows_done = models.PositiveBigIntegerField(default=0)
+    inserted = models.PositiveBigIntegerField(default=0)
+    failed = models.PositiveBigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    # Bases touched by the import whose inventory still has to be rebuilt
+    pending_base_ids = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.source} ({self.rows_done} rows)"
@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from .hierarchy import scope_base_ids
 from .models import UserRole
 
 
@@ -36,7 +37,7 @@ class BaseAccessPermission(permissions.BasePermission):
     """
     Custom permission to restrict access based on user's assigned base.
     - Admins have access to all bases
-    - Base commanders only have access to their assigned base
+    - Base commanders only have access to their assigned bases
     - Logistics officers have access to all bases but with limited operations
     """
     
@@ -57,15 +58,15 @@ class BaseAccessPermission(permissions.BasePermission):
                 base = obj.base
             elif hasattr(obj, 'from_base'):
                 # For transfers, check both bases
-                if user_role.assigned_base not in [obj.from_base, obj.to_base]:
+                if not {obj.from_base_id, obj.to_base_id} & set(scope_base_ids(user_role) or []):
                     return False
                 return True
             elif obj.__class__.__name__ == 'Base':
                 base = obj
             
-            # Base commander can only access their assigned base
+            # Base commander can only access their assigned bases
             if user_role.role == 'base_commander':
-                return base == user_role.assigned_base
+                return base is not None and base.pk in scope_base_ids(user_role)
             
             # Logistics officer has access but with operation restrictions
             # (handled in views)
@@ -0,0 +1,252 @@
+"""
+Serializer-free list rendering from ``values()`` rows.
+
+On a large list page most of the time goes into building model
+instances and walking every DRF field's get_attribute() and
+to_representation(). A ``ValuesProjection`` reads the same data with
+``values()`` and turns each row into the dict the serializer would have
+produced, key for key and byte for byte once rendered.
+
+The mapping is derived from the serializer's own fields:
+
+- a ``source`` becomes a lookup (``base.name`` -> ``base__name``, a
+  primary-key related field -> ``base_id``)
+- each field's to_representation() is replaced by an equivalent
+  converter for the few field types list pages use
+- a related source whose foreign key is NULL is handled like DRF: the
+  key is left out unless the field has a default or allows null
+- fields the model cannot describe (properties) are declared in
+  ``computed`` as ``name: (lookups, function)``
+
+A field the projection cannot reproduce makes ``compile()`` return None,
+and the caller falls back to the serializer. assets/tests.py checks the
+output against the serializers; ``manage.py benchmark_serializers``
+also checks and times both on a populated database.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import fields as drf_fields
+from rest_framework import relations
+from rest_framework.serializers import BaseSerializer
+from rest_framework.settings import api_settings
+
+from .serializers import (
+    AssignmentSerializer, ExpenditureSerializer, InventorySerializer,
+    PurchaseSerializer, TransferSerializer
+)
+
+
+def _identity(value):
+    return value
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() == drf_fields.ISO_8601:
+        return field.to_representation
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        return value.astimezone(field_timezone).strftime(output_format)
+    return convert
+
+
+def _decimal_converter(field, model_field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    # The database returns values at the column's scale, which is what quantize() would produce
+    if (
+        not coerce_to_string or field.localize or model_field is None
+        or getattr(model_field, 'decimal_places', None) != field.decimal_places
+    ):
+        return field.to_representation
+    return '{:f}'.format
+
+
+def _converter(field, model_field):
+    """A to_representation() equivalent for non-null values, or None if there is none"""
+    if isinstance(field, drf_fields.DateTimeField):
+        return _datetime_converter(field)
+    if isinstance(field, drf_fields.DecimalField):
+        return _decimal_converter(field, model_field)
+    if isinstance(field, drf_fields.ChoiceField):
+        return field.to_representation
+    if isinstance(field, (drf_fields.CharField, drf_fields.IntegerField)):
+        return field.to_representation
+    return None
+
+
+class ProjectionPlan:
+    """A compiled projection for one set of serializer fields"""
+
+    def __init__(self, model, columns, categorical=()):
+        # columns: [(name, lookups, convert, guard, on_missing)]
+        self.model = model
+        self.columns = columns
+        # Columns of repeated labels (related names, choices)
+        self.categorical = set(categorical)
+        self.lookups = list(dict.fromkeys(
+            lookup for _, lookups, _, guard, _ in columns for lookup in (*lookups, guard) if lookup
+        ))
+
+    def _lookups(self, ordering):
+        pk = self.model._meta.pk.attname
+        extra = [pk if field.lstrip('-') == 'pk' else field.lstrip('-') for field in ordering]
+        return list(dict.fromkeys(self.lookups + extra))
+
+    def values(self, queryset, ordering=()):
+        """``queryset`` as values() rows with every lookup the plan (and ``ordering``) reads"""
+        return queryset.values(*self._lookups(ordering))
+
+    def rows(self, rows):
+        columns = self.columns
+        output = []
+        append = output.append
+        for row in rows:
+            item = {}
+            for name, lookups, convert, guard, on_missing in columns:
+                if guard is not None and row[guard] is None:
+                    if on_missing is not drf_fields.SkipField:
+                        item[name] = on_missing
+                    continue
+                if len(lookups) == 1:
+                    value = row[lookups[0]]
+                    item[name] = None if value is None else convert(value)
+                else:
+                    value = convert(*(row[lookup] for lookup in lookups))
+                    item[name] = value
+            append(item)
+        return output
+
+
+class ColumnarPlan(ProjectionPlan):
+    """
+    Column-oriented output built from values_list() tuples.
+
+    Rows are transposed once and each column is converted as a whole, so
+    no per-row dict is ever built. Categorical columns are dictionary
+    encoded: ``data`` holds indexes into the column's ``dictionaries``
+    list. A key the row-oriented output would omit (a NULL relation) is
+    null here.
+    """
+
+    def values(self, queryset, ordering=()):
+        return queryset.values_list(*self._lookups(ordering))
+
+    def columnar(self, rows):
+        rows = list(rows)
+        position = {lookup: index for index, lookup in enumerate(self.lookups)}
+        transposed = list(zip(*rows)) if rows else [()] * len(self.lookups)
+
+        data = {}
+        dictionaries = {}
+        for name, lookups, convert, guard, on_missing in self.columns:
+            if len(lookups) == 1:
+                values = transposed[position[lookups[0]]]
+                if convert is not _identity:
+                    values = [None if value is None else convert(value) for value in values]
+            else:
+                values = [convert(*row) for row in zip(*(transposed[position[lookup]] for lookup in lookups))]
+            if guard is not None and on_missing not in (None, drf_fields.SkipField):
+                values = [on_missing if missing is None else value for value, missing in zip(values, transposed[position[guard]])]
+
+            if name in self.categorical:
+                codes = {}
+                data[name] = [None if value is None else codes.setdefault(value, len(codes)) for value in values]
+                dictionaries[name] = list(codes)
+            else:
+                data[name] = list(values)
+
+        return {
+            'columns': [name for name, *_ in self.columns],
+            'dictionaries': dictionaries,
+            'data': data,
+        }
+
+
+class ValuesProjection:
+    def __init__(self, serializer_class, computed=None):
+        """``computed`` maps field names to ``(lookups, function)``"""
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.computed = computed or {}
+
+    def _column(self, name, field):
+        if name in self.computed:
+            lookups, function = self.computed[name]
+            convert = _converter(field, None)
+            if convert is None:
+                return None
+            return (name, tuple(lookups), lambda *values: convert(function(*values)), None, None)
+
+        if field.source == '*' or field.write_only:
+            return None
+        model = self.model
+        guard = None
+        parts = field.source_attrs
+        for index, part in enumerate(parts):
+            try:
+                model_field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return None
+            if not model_field.is_relation:
+                if index != len(parts) - 1:
+                    return None
+                break
+            if not (model_field.many_to_one or model_field.one_to_one) or model_field.auto_created:
+                return None
+            if index == len(parts) - 1:
+                # The relation itself: only a primary key on this model is supported
+                if index != 0 or not isinstance(field, relations.PrimaryKeyRelatedField) or field.pk_field is not None:
+                    return None
+                return (name, (model_field.attname,), _identity, None, None)
+            if model_field.null:
+                if index != 0:
+                    return None
+                guard = model_field.attname
+            model = model_field.related_model
+
+        convert = _converter(field, model_field)
+        if convert is None:
+            return None
+
+        on_missing = None
+        if guard is not None:
+            # What DRF's get_attribute() does when the relation is NULL
+            if field.default is not drf_fields.empty:
+                on_missing = field.get_default()
+            elif field.allow_null:
+                on_missing = None
+            elif not field.required:
+                on_missing = drf_fields.SkipField
+            else:
+                return None
+        return (name, ('__'.join(parts),), convert, guard, on_missing)
+
+    def compile(self, serializer, plan_class=ProjectionPlan):
+        """A ``plan_class`` for ``serializer``'s readable fields, or None if one cannot be built"""
+        if not isinstance(serializer, self.serializer_class):
+            return None
+        columns = []
+        categorical = []
+        for field in serializer._readable_fields:
+            if isinstance(field, BaseSerializer):
+                return None
+            column = self._column(field.field_name, field)
+            if column is None:
+                return None
+            columns.append(column)
+            if isinstance(field, drf_fields.ChoiceField) or (len(field.source_attrs) > 1 and field.field_name not in self.computed):
+                categorical.append(field.field_name)
+        return plan_class(self.model, columns, categorical)
+
+
+INVENTORY = ValuesProjection(InventorySerializer)
+PURCHASES = ValuesProjection(PurchaseSerializer)
+TRANSFERS = ValuesProjection(TransferSerializer)
+ASSIGNMENTS = ValuesProjection(AssignmentSerializer, computed={
+    'outstanding_quantity': (('assigned_quantity', 'returned_quantity'), lambda assigned, returned: assigned - returned),
+})
+EXPENDITURES = ValuesProjection(ExpenditureSerializer)
@@ -0,0 +1,194 @@
+"""
+Bulk user provisioning from CSV.
+
+Columns: username, email, role, base (code), plus optional first_name,
+last_name and password. Rows without a password get a generated one,
+returned once in the report; a job's stored report keeps them only until
+its creator first reads it (JobViewSet.retrieve).
+
+All rows are validated up front, with one query each for bases, active
+role codes and already-taken usernames and emails, so that no row can
+fail the bulk insert for the others. PBKDF2 hashing dominates the
+cost, so passwords are hashed across a process pool. Users and
+UserRoles are then inserted with bulk_create in batches inside one
+transaction.
+"""
+import csv
+import io
+import os
+import secrets
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connections, transaction
+from django.db.models.functions import Lower
+
+from .models import Base, RoleCode, UserRole
+from .sharding import mirror_reference_rows
+
+
+COLUMNS = ['username', 'email', 'role', 'base', 'first_name', 'last_name', 'password']
+
+# Rows per pool task; small enough to keep every process busy
+HASH_CHUNK_SIZE = 16
+
+ROLES = dict(UserRole.ROLE_CHOICES)
+
+MAX_LENGTHS = {name: User._meta.get_field(name).max_length for name in ['email', 'first_name', 'last_name']}
+
+
+def read_csv(text):
+    """Rows of a CSV document as dicts with lower-case keys and stripped values"""
+    reader = csv.DictReader(io.StringIO(text))
+    if reader.fieldnames is None:
+        return []
+    missing = {'username', 'role'} - {name.strip().lower() for name in reader.fieldnames}
+    if missing:
+        raise ValueError(f'Missing column(s): {", ".join(sorted(missing))}')
+    return [
+        {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+        for row in reader
+    ]
+
+
+def hash_passwords(passwords, workers=None):
+    """make_password for every password, across ``workers`` processes"""
+    workers = min(workers or os.cpu_count() or 1, -(-len(passwords) // HASH_CHUNK_SIZE))
+    if workers <= 1:
+        return [make_password(password) for password in passwords]
+
+    # Forked children must not share the parent's open DB connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(make_password, passwords, chunksize=HASH_CHUNK_SIZE))
+
+
+def without_passwords(report):
+    """``report`` with the generated passwords removed, keeping whose they were"""
+    return {
+        **report,
+        'generated_passwords': [{'username': entry['username']} for entry in report.get('generated_passwords', [])],
+    }
+
+
+def _row_error(row, bases, active_roles, taken, taken_emails):
+    username = row.get('username', '')
+    if not username:
+        return 'username is required'
+    try:
+        UnicodeUsernameValidator()(username)
+    except ValidationError as error:
+        return error.messages[0]
+    if len(username) > 150:
+        return 'username is longer than 150 characters'
+    if username in taken:
+        return f'username {username!r} already exists'
+
+    role = row.get('role', '')
+    if role not in ROLES:
+        return f'role must be one of: {", ".join(ROLES)}'
+    if role not in active_roles:
+        return 'No active role code found for this role'
+
+    if row.get('base') and row['base'] not in bases:
+        return f'unknown base code {row["base"]!r}'
+    if role == 'base_commander' and not row.get('base'):
+        return 'base is required for base commanders'
+
+    for name, max_length in MAX_LENGTHS.items():
+        if len(row.get(name, '')) > max_length:
+            return f'{name} is longer than {max_length} characters'
+    if row.get('email'):
+        try:
+            validate_email(row['email'])
+        except ValidationError:
+            return f'invalid email {row["email"]!r}'
+        if row['email'].lower() in taken_emails:
+            return f'email {row["email"]!r} already exists'
+    if row.get('password') and len(row['password']) < 8:
+        return 'password must be at least 8 characters'
+    return None
+
+
+def provision_users(rows, workers=None, batch_size=500):
+    """
+    Validate and create users for ``rows`` (dicts keyed by COLUMNS).
+
+    Invalid rows are skipped and reported with their CSV line number;
+    valid rows are created together. Returns a report with counts,
+    timings, per-row errors and any generated passwords.
+    """
+    started = time.perf_counter()
+    bases = dict(Base.objects.filter(is_deleted=False).values_list('code', 'id'))
+    active_roles = set(RoleCode.objects.filter(is_active=True).values_list('role', flat=True))
+    taken = set(User.objects.filter(
+        username__in=[row.get('username', '') for row in rows]
+    ).values_list('username', flat=True))
+    taken_emails = set(User.objects.annotate(email_lower=Lower('email')).filter(
+        email_lower__in=[row['email'].lower() for row in rows if row.get('email')]
+    ).values_list('email_lower', flat=True))
+
+    errors = []
+    valid = []
+    for line, row in enumerate(rows, start=2):
+        error = _row_error(row, bases, active_roles, taken, taken_emails)
+        if error:
+            errors.append({'line': line, 'username': row.get('username', ''), 'error': error})
+            continue
+        taken.add(row['username'])
+        if row.get('email'):
+            taken_emails.add(row['email'].lower())
+        valid.append((line, row))
+
+    generated = {}
+    passwords = []
+    for line, row in valid:
+        password = row.get('password')
+        if not password:
+            password = generated[row['username']] = secrets.token_urlsafe(12)
+        passwords.append(password)
+
+    hash_started = time.perf_counter()
+    hashes = hash_passwords(passwords, workers)
+    hash_seconds = time.perf_counter() - hash_started
+
+    users = [
+        User(
+            username=row['username'],
+            email=row.get('email', ''),
+            first_name=row.get('first_name', ''),
+            last_name=row.get('last_name', ''),
+            password=password_hash
+        )
+        for (line, row), password_hash in zip(valid, hashes)
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=batch_size)
+        if users and users[0].pk is None:
+            # Backends that cannot return ids from bulk inserts
+            ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'id'))
+            for user in users:
+                user.pk = ids[user.username]
+        UserRole.objects.bulk_create([
+            UserRole(user_id=user.pk, role=row['role'], assigned_base_id=bases.get(row.get('base')))
+            for user, (line, row) in zip(users, valid)
+        ], batch_size=batch_size)
+    mirror_reference_rows(User, users, batch_size=batch_size)
+
+    seconds = time.perf_counter() - started
+    return {
+        'created': len(users),
+        'failed': len(errors),
+        'errors': errors,
+        'generated_passwords': [
+            {'username': username, 'password': password} for username, password in generated.items()
+        ],
+        'seconds': round(seconds, 3),
+        'hash_seconds': round(hash_seconds, 3),
+        'users_per_second': round(len(users) / seconds, 1) if seconds else None,
+    }
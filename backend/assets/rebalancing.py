@@ -0,0 +1,356 @@
+"""
+Stock rebalancing recommendations.
+
+Each equipment type is solved as its own transportation problem:
+
+- Every (base, equipment type) pair with a target takes part, except
+  serialized types, whose stock only moves with their items. The target
+  is ``StockThreshold.target``, else the level its low-stock alert
+  resolves at (assets/alerts.py). ``EquipmentType.minimum_stock``
+  defaults only apply to bases that already stock the type.
+- A base's position is its inventory plus open (pending or in transit)
+  transfers in, minus open transfers out. Recommendations that were
+  already created are therefore not repeated. Bases above their target
+  can ship the excess and bases below it need the difference.
+- Moving a unit between two bases costs its ``TransferCost`` row (either
+  direction), else REBALANCE_DEFAULT_COST. When that setting is empty,
+  bases without a row are not connected.
+
+Saving a plan (``save()``) holds a lock row from recommending until the
+transfers are written, so concurrent runs do not each save the full plan.
+
+``solve()`` returns the flow that covers as much of the shortfall as the
+excess allows at the lowest total cost. It uses successive shortest
+paths over the dense supplier x receiver cost matrix, with the
+Bellman-Ford relaxations done as NumPy array operations. Quantities and
+costs are integer hundredths, so results are exact.
+"""
+from contextlib import ExitStack
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import reference
+from .events import publish_transfer
+from .models import Inventory, ShardSequence, StockThreshold, Transfer, TransferCost, next_change_seq
+from .sharding import assign_ids, owned_by, shard_aliases, transfer_shards
+
+
+INF = np.int64(1) << 60
+
+OPEN_STATUSES = ['pending', 'in_transit']
+
+# ShardSequence row on default locked while a plan is saved
+LOCK_NAME = 'assets.rebalance'
+
+
+def _cents(value):
+    return int((Decimal(value) * 100).to_integral_value())
+
+
+def solve(supply, demand, cost):
+    """
+    Min-cost flow from suppliers to receivers.
+
+    ``supply`` (S,) and ``demand`` (D,) are int64 amounts and ``cost`` an
+    (S, D) int64 matrix with INF where there is no route. Returns the
+    (S, D) flow, which moves min(total supply, total reachable demand).
+    """
+    S, D = cost.shape
+    flow = np.zeros((S, D), dtype=np.int64)
+    remaining_supply, remaining_demand = supply.copy(), demand.copy()
+    columns = np.arange(D)
+
+    # Cheapest direct edge into each receiver from a supplier with stock left,
+    # recomputed only for the columns whose supplier runs out
+    active = np.nonzero(remaining_supply > 0)[0]
+    if not len(active) or not D:
+        return flow
+    direct_pred = active[cost[active].argmin(axis=0)]
+    direct_dist = cost[direct_pred, columns]
+    exhausted = np.zeros(S, dtype=bool)
+
+    while True:
+        redo = np.nonzero(exhausted[direct_pred])[0]
+        if len(redo):
+            active = np.nonzero(remaining_supply > 0)[0]
+            if not len(active):
+                break
+            block = cost[active][:, redo]
+            best = block.argmin(axis=0)
+            direct_pred[redo] = active[best]
+            direct_dist[redo] = block[best, np.arange(len(redo))]
+            exhausted[:] = False
+
+        # Shortest paths from the suppliers with stock left; a supplier
+        # already shipping to a receiver can also be reached from that
+        # receiver at minus the edge's cost (rerouting its shipment)
+        dist_d, pred_d = direct_dist.copy(), direct_pred.copy()
+        dist_s = np.where(remaining_supply > 0, 0, INF)
+        pred_s = np.full(S, -1)
+        flow_s, flow_d = np.nonzero(flow)
+        flow_cost = cost[flow_s, flow_d]
+        updated = np.ones(D, dtype=bool)
+        while len(flow_s):
+            relaxed = updated[flow_d]
+            candidate = dist_d[flow_d[relaxed]] - flow_cost[relaxed]
+            via_s, via_d = flow_s[relaxed], flow_d[relaxed]
+            better = candidate < dist_s[via_s]
+            if not better.any():
+                break
+            via_s, via_d, candidate = via_s[better], via_d[better], candidate[better]
+            order = np.lexsort((candidate, via_s))
+            via_s, via_d, candidate = via_s[order], via_d[order], candidate[order]
+            first = np.ones(len(via_s), dtype=bool)
+            first[1:] = via_s[1:] != via_s[:-1]
+            via_s, via_d, candidate = via_s[first], via_d[first], candidate[first]
+            dist_s[via_s] = candidate
+            pred_s[via_s] = via_d
+
+            rows = cost[via_s]
+            reach = np.where(rows < INF, candidate[:, None] + rows, INF)
+            best = reach.argmin(axis=0)
+            best_dist = reach[best, columns]
+            updated = best_dist < dist_d
+            if not updated.any():
+                break
+            dist_d[updated] = best_dist[updated]
+            pred_d[updated] = via_s[best[updated]]
+
+        receivers = np.nonzero((remaining_demand > 0) & (dist_d < INF))[0]
+        if not len(receivers):
+            break
+
+        # Augment to the nearest receivers in turn. Augmenting never makes
+        # a path shorter, so while every earlier receiver was filled, the
+        # next one is still the nearest if its recorded path is intact (its
+        # supplier has stock left, every rerouted shipment still has flow).
+        pred_d, pred_s = pred_d.tolist(), pred_s.tolist()
+        for sink in receivers[np.argsort(dist_d[receivers], kind='stable')].tolist():
+            path = []
+            amount = remaining_demand[sink]
+            receiver = sink
+            while True:
+                supplier = pred_d[receiver]
+                path.append((supplier, receiver, 1))
+                if pred_s[supplier] == -1:
+                    amount = min(amount, remaining_supply[supplier])
+                    break
+                receiver = pred_s[supplier]
+                path.append((supplier, receiver, -1))
+                amount = min(amount, flow[supplier, receiver])
+            if amount <= 0:
+                break
+            for i, j, sign in path:
+                flow[i, j] += sign * amount
+            remaining_supply[supplier] -= amount
+            remaining_demand[sink] -= amount
+            if remaining_supply[supplier] == 0:
+                exhausted[supplier] = True
+            if remaining_demand[sink]:
+                # Still open but its path is broken
+                break
+    return flow
+
+
+def cost_matrix(base_ids):
+    """(B, B) int64 per-unit costs in hundredths between ``base_ids``, INF without a route"""
+    index = {base_id: i for i, base_id in enumerate(base_ids)}
+    default = settings.REBALANCE_DEFAULT_COST
+    matrix = np.full((len(base_ids), len(base_ids)), INF if default is None else _cents(default), dtype=np.int64)
+    routes = [
+        (index[from_base], index[to_base], _cents(cost))
+        for from_base, to_base, cost in TransferCost.objects.values_list('from_base_id', 'to_base_id', 'cost')
+        if from_base in index and to_base in index
+    ]
+    if routes:
+        i, j, costs = (np.array(column, dtype=np.int64) for column in zip(*routes))
+        # A route priced in one direction only applies both ways
+        matrix[j, i] = costs
+        matrix[i, j] = costs
+    np.fill_diagonal(matrix, INF)
+    return matrix
+
+
+def _pair_keys(base_ids, equipment_type_ids):
+    return np.asarray(base_ids, dtype=np.int64) << 32 | np.asarray(equipment_type_ids, dtype=np.int64)
+
+
+def _sum_by_key(keys, values):
+    unique, inverse = np.unique(keys, return_inverse=True)
+    totals = np.zeros(len(unique), dtype=np.int64)
+    np.add.at(totals, inverse, values)
+    return unique, totals
+
+
+def positions(equipment_type_ids=None):
+    """``(keys, position, target)`` arrays in hundredths for every pair with a target"""
+    stock, moving = [], []
+    for alias in shard_aliases():
+        inventory = owned_by(Inventory.objects.all(), alias)
+        transfers = owned_by(Transfer.objects.all(), alias).filter(is_deleted=False, status__in=OPEN_STATUSES)
+        if equipment_type_ids is not None:
+            inventory = inventory.filter(equipment_type_id__in=equipment_type_ids)
+            transfers = transfers.filter(equipment_type_id__in=equipment_type_ids)
+        stock.extend(inventory.values_list('base_id', 'equipment_type_id', 'quantity'))
+        moving.extend(transfers.order_by().values_list(
+            'from_base_id', 'to_base_id', 'equipment_type_id'
+        ).annotate(total=Sum('quantity')))
+
+    thresholds = reference.stock_thresholds()
+    explicit = {
+        (base_id, equipment_type_id): target
+        for base_id, equipment_type_id, target in StockThreshold.objects.filter(
+            target__isnull=False
+        ).values_list('base_id', 'equipment_type_id', 'target')
+    }
+    targets = {pair: explicit.get(pair, levels[1]) for pair, levels in thresholds['pairs'].items()}
+    for base_id, equipment_type_id, _ in stock:
+        if (base_id, equipment_type_id) not in targets and equipment_type_id in thresholds['defaults']:
+            targets[base_id, equipment_type_id] = thresholds['defaults'][equipment_type_id][1]
+    if equipment_type_ids is not None:
+        wanted = set(equipment_type_ids)
+        targets = {pair: target for pair, target in targets.items() if pair[1] in wanted}
+    # Serialized types only move with their items (assets/serialized.py)
+    serialized = {key for key, row in reference.equipment_types().items() if row['is_serialized']}
+    targets = {pair: target for pair, target in targets.items() if pair[1] not in serialized}
+    if not targets:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    pairs = list(targets)
+    keys = _pair_keys([pair[0] for pair in pairs], [pair[1] for pair in pairs])
+    order = np.argsort(keys)
+    keys = keys[order]
+    target = np.array([_cents(targets[pair]) for pair in pairs], dtype=np.int64)[order]
+
+    # Stock plus open transfers in, minus open transfers out
+    deltas = [(base_id, equipment_type_id, _cents(quantity)) for base_id, equipment_type_id, quantity in stock]
+    for from_base, to_base, equipment_type_id, total in moving:
+        deltas.append((from_base, equipment_type_id, -_cents(total)))
+        deltas.append((to_base, equipment_type_id, _cents(total)))
+    position = np.zeros(len(keys), dtype=np.int64)
+    if deltas:
+        base_ids, equipment_type_ids, amounts = zip(*deltas)
+        delta_keys, totals = _sum_by_key(_pair_keys(base_ids, equipment_type_ids), np.array(amounts, dtype=np.int64))
+        at = np.searchsorted(keys, delta_keys).clip(max=len(keys) - 1)
+        found = keys[at] == delta_keys
+        position[at[found]] = totals[found]
+    return keys, position, target
+
+
+def recommend(equipment_type_ids=None, base_ids=None):
+    """
+    Proposed transfers that bring bases to their targets at the lowest
+    total cost, with per-run totals. ``base_ids`` limits the bases that
+    may ship or receive.
+    """
+    bases = reference.bases()
+    equipment_types = reference.equipment_types()
+    keys, position, target = positions(equipment_type_ids)
+
+    pair_bases = keys >> 32
+    keep = np.isin(pair_bases, np.fromiter(bases, dtype=np.int64, count=len(bases)))
+    if base_ids is not None:
+        keep &= np.isin(pair_bases, np.asarray(list(base_ids), dtype=np.int64))
+    keys, excess = keys[keep], position[keep] - target[keep]
+
+    base_order = sorted(bases)
+    base_index = np.searchsorted(np.array(base_order, dtype=np.int64), keys >> 32)
+    costs = cost_matrix(base_order)
+
+    transfers = []
+    shortfall = moved = total_cost = 0
+    pair_types = keys & 0xFFFFFFFF
+    # keys are sorted by base first; group by equipment type instead
+    order = np.lexsort((keys >> 32, pair_types))
+    keys, excess, base_index, pair_types = keys[order], excess[order], base_index[order], pair_types[order]
+    bounds = np.nonzero(np.r_[True, pair_types[1:] != pair_types[:-1], True])[0] if len(keys) else []
+
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        group = excess[start:end]
+        suppliers = np.nonzero(group > 0)[0]
+        receivers = np.nonzero(group < 0)[0]
+        shortfall -= int(group[receivers].sum())
+        if not len(suppliers) or not len(receivers):
+            continue
+        from_index = base_index[start:end][suppliers]
+        to_index = base_index[start:end][receivers]
+        block = costs[np.ix_(from_index, to_index)]
+        flow = solve(group[suppliers], -group[receivers], block)
+
+        equipment_type_id = int(pair_types[start])
+        for i, j in zip(*np.nonzero(flow)):
+            amount, unit_cost = int(flow[i, j]), int(block[i, j])
+            moved += amount
+            total_cost += amount * unit_cost
+            from_base, to_base = base_order[from_index[i]], base_order[to_index[j]]
+            transfers.append({
+                'from_base': from_base,
+                'from_base_name': bases[from_base]['name'],
+                'to_base': to_base,
+                'to_base_name': bases[to_base]['name'],
+                'equipment_type': equipment_type_id,
+                'equipment_name': equipment_types.get(equipment_type_id, {}).get('name'),
+                'quantity': Decimal(amount) / 100,
+                'unit_cost': Decimal(unit_cost) / 100,
+            })
+
+    return {
+        'shortfall': Decimal(shortfall) / 100,
+        'covered': Decimal(moved) / 100,
+        'cost': Decimal(total_cost) / 10000,
+        'transfers': transfers,
+    }
+
+
+def create_transfers(proposals, user):
+    """Save proposals from recommend() as pending transfers in one transaction per shard"""
+    now = timezone.now()
+    transfers = assign_ids([
+        Transfer(
+            from_base_id=proposal['from_base'], to_base_id=proposal['to_base'],
+            equipment_type_id=proposal['equipment_type'], quantity=proposal['quantity'],
+            status='pending', transfer_date=now, created_by=user
+        )
+        for proposal in proposals
+    ])
+    writes = {}
+    for transfer in transfers:
+        for n, alias in enumerate(transfer_shards(transfer)):
+            copy = transfer if n == 0 else Transfer(**{
+                field.attname: getattr(transfer, field.attname) for field in Transfer._meta.concrete_fields
+            })
+            writes.setdefault(alias or 'default', []).append(copy)
+
+    with ExitStack() as stack:
+        for alias in writes:
+            stack.enter_context(transaction.atomic(using=alias))
+        for alias, objs in writes.items():
+            first = next_change_seq(alias, len(objs))
+            for change_seq, obj in enumerate(objs, first):
+                obj.change_seq = change_seq
+            Transfer.objects.using(alias).bulk_create(objs)
+        for transfer in transfers:
+            publish_transfer(transfer)
+    return transfers
+
+
+def save(equipment_type_ids=None, base_ids=None, user=None):
+    """
+    recommend() and create_transfers() for it, one run at a time: the next
+    run's positions include the transfers this one created. Returns the
+    plan with each proposal's transfer ``id``.
+    """
+    with transaction.atomic(using='default'):
+        ShardSequence.objects.using('default').get_or_create(name=LOCK_NAME, defaults={'next_value': 0})
+        ShardSequence.objects.using('default').select_for_update().get(name=LOCK_NAME)
+        plan = recommend(equipment_type_ids, base_ids)
+        transfers = create_transfers(plan['transfers'], user)
+    for proposal, transfer in zip(plan['transfers'], transfers):
+        proposal['id'] = transfer.pk
+    return plan
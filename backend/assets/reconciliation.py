@@ -0,0 +1,233 @@
+"""
+Inventory reconciliation against the transaction history.
+
+Expected balances are recomputed from every movement table in one
+grouped UNION ALL query per partition of bases:
+
+    purchases + completed transfers in - completed transfers out
+    - outstanding assignments - expenditures + on-hand serialized items
+
+Soft-deleted transactions are ignored, matching the dashboard totals.
+Large datasets are partitioned by base (and by shard when sharding is
+enabled) and computed across a process pool; the diff happens in the
+calling process. The optional repair recomputes the drifted pairs again
+with their Inventory rows locked (see repair_drift()), so writes that
+commit while reconciling are neither lost nor counted twice.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import F, Sum, Value, CharField
+from django.utils import timezone
+
+from . import alerts
+from .models import (
+    Assignment, Base, Expenditure, Inventory, Purchase, SerializedAsset, Transfer, next_change_seq, quantity_value
+)
+from .sharding import assign_ids, shard_for_base, shard_partitions
+
+
+# Bases per partition when running across a process pool
+PARTITION_SIZE = 50
+
+# (model, movement tag, base field, summed expression, sign)
+MOVEMENTS = [
+    (Purchase, 'purchases', 'base', F('quantity'), 1),
+    (Transfer, 'transfers_in', 'to_base', F('quantity'), 1),
+    (Transfer, 'transfers_out', 'from_base', F('quantity'), -1),
+    (Assignment, 'assignments', 'base', F('assigned_quantity') - F('returned_quantity'), -1),
+    (Expenditure, 'expenditures', 'base', F('quantity'), -1),
+    (SerializedAsset, 'serialized', 'base', quantity_value(1), 1),
+]
+
+SIGNS = {movement: sign for _, movement, _, _, sign in MOVEMENTS}
+
+
+def _movement_queryset(model, movement, base_field, quantity, base_ids, alias=None):
+    """Grouped (movement, base_id, equipment_type_id, total) rows for one table"""
+    filters = {'is_deleted': False} if model is not SerializedAsset else {'status__in': SerializedAsset.ON_HAND}
+    if base_ids is not None:
+        filters[f'{base_field}_id__in'] = base_ids
+    if model is Transfer:
+        filters['status'] = 'completed'
+
+    return model.objects.using(alias).filter(**filters).order_by().annotate(
+        movement=Value(movement, output_field=CharField()),
+        key_base=F(f'{base_field}_id'),
+        key_equipment_type=F('equipment_type_id'),
+    ).values('movement', 'key_base', 'key_equipment_type').annotate(total=Sum(quantity))
+
+
+def expected_balances(base_ids=None, alias=None):
+    """
+    Compute expected quantities from the transaction history.
+
+    Returns a list of ``(base_id, equipment_type_id, quantity)`` tuples so
+    the result can be sent back from a pool worker.
+    """
+    querysets = [
+        _movement_queryset(model, movement, base_field, quantity, base_ids, alias)
+        for model, movement, base_field, quantity, _ in MOVEMENTS
+    ]
+    balances = {}
+    for row in querysets[0].union(*querysets[1:], all=True):
+        key = (row['key_base'], row['key_equipment_type'])
+        balances[key] = balances.get(key, Decimal('0')) + SIGNS[row['movement']] * (row['total'] or 0)
+    return [(base_id, equipment_type_id, quantity) for (base_id, equipment_type_id), quantity in balances.items()]
+
+
+def _init_worker():
+    """Pool initializer: set up Django and drop connections inherited from the parent"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def _expected_balances(partition):
+    return expected_balances(*partition)
+
+
+def _partitions(base_ids, size=None):
+    """(base_ids, alias) chunks that never span two shards"""
+    size = size or PARTITION_SIZE
+    return [
+        (shard_bases[i:i + size], alias)
+        for alias, shard_bases in shard_partitions(base_ids)
+        for i in range(0, len(shard_bases), size)
+    ]
+
+
+def compute_expected(base_ids=None, workers=1):
+    """
+    Expected balances keyed by ``(base_id, equipment_type_id)``.
+
+    With ``workers > 1`` and more than one partition of bases the
+    aggregation runs across a process pool, one partition per task.
+    """
+    if base_ids is None:
+        base_ids = list(Base.objects.order_by('id').values_list('id', flat=True))
+    partitions = _partitions(list(base_ids))
+
+    if workers > 1 and len(partitions) > 1:
+        # Forked children must not share the parent's open DB connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=min(workers, len(partitions)), initializer=_init_worker) as pool:
+            results = list(pool.map(_expected_balances, partitions))
+    else:
+        results = [_expected_balances(partition) for partition in partitions]
+
+    return {
+        (base_id, equipment_type_id): quantity
+        for rows in results
+        for base_id, equipment_type_id, quantity in rows
+    }
+
+
+def reconcile(base_ids=None, workers=1, repair=False):
+    """
+    Diff expected balances against ``Inventory`` and optionally repair it.
+
+    Returns a report dict with the number of rows checked, the drifted
+    rows and, when repairing, how many rows were updated and created.
+    """
+    if base_ids is not None:
+        base_ids = list(base_ids)
+    expected = compute_expected(base_ids, workers=workers)
+
+    if base_ids is None:
+        base_ids = list(Base.objects.order_by('id').values_list('id', flat=True))
+    actual = {
+        (base_id, equipment_type_id): (inventory_id, quantity)
+        for alias, shard_bases in shard_partitions(base_ids)
+        for inventory_id, base_id, equipment_type_id, quantity
+        in Inventory.objects.using(alias).order_by().filter(base_id__in=shard_bases).values_list(
+            'id', 'base_id', 'equipment_type_id', 'quantity'
+        )
+    }
+
+    drift = []
+    for key in expected.keys() | actual.keys():
+        expected_quantity = expected.get(key, Decimal('0'))
+        inventory_id, actual_quantity = actual.get(key, (None, None))
+        if actual_quantity is None and expected_quantity == 0:
+            continue
+        if actual_quantity != expected_quantity:
+            drift.append({
+                'inventory_id': inventory_id,
+                'base_id': key[0],
+                'equipment_type_id': key[1],
+                'expected': expected_quantity,
+                'actual': actual_quantity,
+                'difference': expected_quantity - (actual_quantity or 0),
+            })
+    drift.sort(key=lambda row: (row['base_id'], row['equipment_type_id']))
+
+    report = {
+        'checked': len(expected.keys() | actual.keys()),
+        'drift_count': len(drift),
+        'negative_count': sum(1 for quantity in expected.values() if quantity < 0),
+        'drift': drift,
+        'repaired': None,
+    }
+    if repair and drift:
+        report['repaired'] = repair_drift(drift)
+    return report
+
+
+def repair_drift(drift, batch_size=500):
+    """
+    Set drifted rows to their expected quantities, one transaction per shard.
+
+    ``drift`` only says which pairs to look at: movements and adjustments
+    may have committed since it was computed. Each shard's transaction
+    takes the change sequence counter (which every inventory write takes
+    first), locks the pairs' Inventory rows, creating missing ones at
+    zero, and recomputes their expected balances under that lock before
+    writing them.
+    """
+    now = timezone.now()
+    shards = {}
+    for row in drift:
+        shards.setdefault(shard_for_base(row['base_id']), set()).add((row['base_id'], row['equipment_type_id']))
+    
+    updated = created = 0
+    repaired = []
+    for alias, keys in shards.items():
+        inventory = Inventory.objects.using(alias)
+        base_ids = sorted({base_id for base_id, _ in keys})
+        with transaction.atomic(using=alias):
+            first = next_change_seq(alias, len(keys))
+            change_seqs = dict(zip(sorted(keys), range(first, first + len(keys))))
+            existing = set(inventory.filter(base_id__in=base_ids).values_list('base_id', 'equipment_type_id'))
+            missing = [key for key in sorted(keys) if key not in existing]
+            # Pairs created concurrently keep their row
+            inventory.bulk_create(assign_ids([
+                Inventory(base_id=key[0], equipment_type_id=key[1], quantity=0, change_seq=change_seqs[key])
+                for key in missing
+            ]), batch_size=batch_size, ignore_conflicts=True)
+            locked = {
+                (obj.base_id, obj.equipment_type_id): obj
+                for obj in inventory.select_for_update().filter(
+                    base_id__in=base_ids, equipment_type_id__in={equipment_type_id for _, equipment_type_id in keys}
+                ).order_by('id')
+            }
+            expected = {
+                (base_id, equipment_type_id): quantity
+                for base_id, equipment_type_id, quantity in expected_balances(base_ids, alias)
+            }
+            to_update = []
+            for key in sorted(keys):
+                obj, quantity = locked[key], expected.get(key, Decimal('0'))
+                if obj.quantity != quantity:
+                    obj.quantity, obj.updated_at, obj.change_seq = quantity, now, change_seqs[key]
+                    to_update.append(obj)
+                repaired.append((key[0], key[1], quantity))
+            inventory.bulk_update(to_update, ['quantity', 'updated_at', 'change_seq'], batch_size=batch_size)
+        updated += sum(1 for obj in to_update if (obj.base_id, obj.equipment_type_id) in existing)
+        created += len(missing)
+    alerts.evaluate_many(repaired)
+    return {'updated': updated, 'created': created}
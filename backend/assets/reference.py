@@ -0,0 +1,118 @@
+"""
+Process-local cache of small reference tables: bases, equipment types,
+active role codes and low-stock thresholds.
+
+Every lookup used to be a query. The tables are tiny and rarely change,
+so each process keeps a copy for REFERENCE_CACHE_TTL seconds. Saves and
+deletes in the same process drop the copy at once, and other processes
+pick up the change when their TTL expires. Under a preloading gunicorn
+master the copy is loaded before forking and shared by every worker
+(see military_ams/warmup.py).
+"""
+import threading
+import time
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+
+from .models import Base, EquipmentType, RoleCode, StockThreshold
+
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def _load(name, loader):
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(name)
+        if entry is None or now - entry[0] > settings.REFERENCE_CACHE_TTL:
+            entry = _cache[name] = (now, loader())
+        return entry[1]
+
+
+def bases():
+    """Active bases keyed by id"""
+    return _load('bases', lambda: {
+        row['id']: row
+        for row in Base.objects.filter(is_deleted=False).values('id', 'name', 'code', 'location')
+    })
+
+
+def equipment_types():
+    """Active equipment types keyed by id"""
+    return _load('equipment_types', lambda: {
+        row['id']: row
+        for row in EquipmentType.objects.filter(is_deleted=False).values('id', 'name', 'description', 'unit', 'is_serialized')
+    })
+
+
+def role_codes():
+    """Active role codes keyed by role"""
+    return _load('role_codes', lambda: dict(
+        RoleCode.objects.filter(is_active=True).values_list('role', 'code')
+    ))
+
+
+def _resolve_level(minimum, resolve_at):
+    if resolve_at is not None:
+        return max(resolve_at, minimum)
+    return (minimum * (1 + Decimal(str(settings.STOCK_ALERT_HYSTERESIS)))).quantize(Decimal('0.01'))
+
+
+def _load_thresholds():
+    return {
+        'pairs': {
+            (row['base_id'], row['equipment_type_id']): (row['minimum'], _resolve_level(row['minimum'], row['resolve_at']))
+            for row in StockThreshold.objects.values('base_id', 'equipment_type_id', 'minimum', 'resolve_at')
+        },
+        'defaults': {
+            equipment_type_id: (minimum, _resolve_level(minimum, None))
+            for equipment_type_id, minimum in EquipmentType.objects.filter(
+                is_deleted=False, minimum_stock__isnull=False
+            ).values_list('id', 'minimum_stock')
+        },
+    }
+
+
+def stock_thresholds():
+    """
+    ``{'pairs': {(base_id, equipment_type_id): levels}, 'defaults':
+    {equipment_type_id: levels}}`` where levels is ``(minimum, resolve_at)``
+    """
+    return _load('stock_thresholds', _load_thresholds)
+
+
+def warm():
+    """Load every reference table"""
+    bases()
+    equipment_types()
+    role_codes()
+    stock_thresholds()
+
+
+def clear(*names):
+    """Drop the named tables (default: all) from this process's cache"""
+    with _lock:
+        for name in names or list(_cache):
+            _cache.pop(name, None)
+
+
+_MODEL_CACHES = {
+    Base: ['bases'],
+    EquipmentType: ['equipment_types', 'stock_thresholds'],
+    RoleCode: ['role_codes'],
+    StockThreshold: ['stock_thresholds'],
+}
+
+
+def _invalidate(sender, **kwargs):
+    clear(*_MODEL_CACHES[sender])
+
+
+def connect_signals():
+    for model in _MODEL_CACHES:
+        post_save.connect(_invalidate, sender=model, dispatch_uid=f'reference_save_{model.__name__}')
+        post_delete.connect(_invalidate, sender=model, dispatch_uid=f'reference_delete_{model.__name__}')
@@ -0,0 +1,111 @@
+"""
+orjson and MessagePack renderers and parsers.
+
+DRF's JSONRenderer runs ``json.dumps`` with a Python ``default`` hook for
+every Decimal, datetime and lazy string. ``ORJSONRenderer`` serializes in
+C and only calls back into Python for those types. The callback is
+DRF's own encoder, so the bytes are the same as JSONRenderer's:
+
+- Decimals become floats and datetimes ISO strings with millisecond
+  precision.
+- Values the serializers already formatted (DATETIME_FORMAT,
+  COERCE_DECIMAL_TO_STRING) pass through untouched.
+
+``MessagePackRenderer`` (``application/msgpack`` or ``?format=msgpack``)
+emits the same values as MessagePack for clients that want a smaller,
+faster-to-parse body.
+
+``ColumnarRenderer`` (``?format=columnar``) only selects the
+column-oriented list output built by ValuesListMixin; the body is
+ordinary JSON.
+
+Both libraries are optional. settings.py only installs the classes
+whose library is importable, and ORJSONRenderer falls back to
+JSONRenderer without orjson.
+"""
+from decimal import Decimal
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # Types neither library handles natively, converted exactly as JSONRenderer would
+    if type(obj) is Decimal:
+        return float(obj)
+    return _encoder.default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """Drop-in JSONRenderer backed by orjson"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=_default, option=options)
+
+        # Same escaping as JSONRenderer: these are valid JSON but not valid JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class ColumnarRenderer(ORJSONRenderer):
+    """JSON for list pages in column-oriented form (see projections.ColumnarPlan)"""
+    format = 'columnar'
+
+
+class ORJSONParser(JSONParser):
+    """JSONParser backed by orjson"""
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except (msgpack.UnpackException, ValueError, TypeError) as exc:
+            raise ParseError(f'MessagePack parse error - {str(exc) or type(exc).__name__}')
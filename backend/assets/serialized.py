@@ -0,0 +1,113 @@
+"""
+Serial-numbered items (``SerializedAsset``) and their movements.
+
+register() bulk-inserts new items and move() relocates or re-tags any
+number of them with one UPDATE per shard; items moving to a base on
+another shard are copied there and deleted from the old one. Both first
+read the affected items' (base, equipment type, status), turn the change
+into per-pair deltas and apply them with adjust_inventory() inside the
+same transaction as the item writes, so the Inventory of a serialized
+equipment type follows its items without ever recounting them.
+
+Items count towards their base's Inventory while in an on-hand status
+(``SerializedAsset.ON_HAND``). Serial numbers are unique per equipment
+type: the constraint covers one shard, so the API checks every shard with
+registered() before registering.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .inventory import adjust_inventory
+from .models import SerializedAsset
+from .sharding import assign_ids, shard_aliases, shard_for_base
+
+
+BATCH_SIZE = 1000
+
+
+def _apply(deltas):
+    for (base_id, equipment_type_id), delta in deltas.items():
+        if delta:
+            adjust_inventory(base_id, equipment_type_id, delta)
+
+
+def registered(equipment_type_id, serial_numbers, limit=10):
+    """Up to ``limit`` of ``serial_numbers`` already in use for the type on any shard"""
+    found = []
+    for alias in shard_aliases():
+        found.extend(SerializedAsset.objects.using(alias).filter(
+            equipment_type_id=equipment_type_id, serial_number__in=serial_numbers
+        ).values_list('serial_number', flat=True)[:limit - len(found)])
+        if len(found) >= limit:
+            break
+    return found
+
+
+def register(base_id, equipment_type_id, serial_numbers, status=SerializedAsset.AVAILABLE):
+    """Create one item per serial number at ``base_id``; returns the items"""
+    items = assign_ids([
+        SerializedAsset(serial_number=serial_number, equipment_type_id=equipment_type_id, base_id=base_id, status=status)
+        for serial_number in serial_numbers
+    ])
+    manager = SerializedAsset.objects.db_manager(shard_for_base(base_id))
+    with transaction.atomic(using=manager.db):
+        manager.bulk_create(items, batch_size=BATCH_SIZE)
+        if status in SerializedAsset.ON_HAND:
+            adjust_inventory(base_id, equipment_type_id, len(items))
+    return items
+
+
+def move(filters, base_id=None, status=None, assignee=None):
+    """
+    Move the items matching ``filters`` to ``base_id`` and/or set their
+    status and assignee (None leaves a value as it is); returns how many
+    items changed.
+    """
+    changes = {'updated_at': timezone.now()}
+    if base_id is not None:
+        changes['base_id'] = base_id
+    if status is not None:
+        changes['status'] = status
+    if assignee is not None:
+        changes['assignee'] = assignee
+    destination = shard_for_base(base_id)
+
+    moved = 0
+    # The destination first, so items copied there are not visited twice
+    for alias in sorted(shard_aliases(), key=lambda alias: alias != destination):
+        manager = SerializedAsset.objects.db_manager(alias)
+        with transaction.atomic(using=manager.db):
+            before = list(manager.filter(**filters).select_for_update().values_list(
+                'id', 'base_id', 'equipment_type_id', 'status'
+            ))
+            if not before:
+                continue
+            ids = [item_id for item_id, _, _, _ in before]
+
+            if alias is None or destination in (None, alias):
+                manager.filter(id__in=ids).update(**changes)
+            else:
+                items = list(manager.filter(id__in=ids))
+                for item in items:
+                    for attname, value in changes.items():
+                        setattr(item, attname, value)
+                SerializedAsset.objects.using(destination).bulk_create(items, batch_size=BATCH_SIZE)
+                manager.filter(id__in=ids).delete()
+
+            deltas = Counter()
+            for _, old_base_id, equipment_type_id, old_status in before:
+                if old_status in SerializedAsset.ON_HAND:
+                    deltas[(old_base_id, equipment_type_id)] -= 1
+                if changes.get('status', old_status) in SerializedAsset.ON_HAND:
+                    deltas[(changes.get('base_id', old_base_id), equipment_type_id)] += 1
+            _apply(deltas)
+        moved += len(before)
+    return moved
+
+
+def counts(queryset):
+    """(base_id, equipment_type_id, status, count) rows for the items in ``queryset``"""
+    return queryset.order_by().values_list('base_id', 'equipment_type_id', 'status').annotate(count=Count('id'))
@@ -1,18 +1,162 @@
+import json
+import re
+
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, Q
 from .models import (
     Base, EquipmentType, Inventory, Purchase, Transfer,
-    Assignment, Expenditure, UserRole
+    Assignment, Expenditure, UserRole, Job, StockAlert, StockThreshold, TransferCost, APILog, OrgNode, SerializedAsset,
+    StockLot, LotAllocation, QuantityField, RoleCode
 )
+from . import lots
+from .events import publish_transfer
+from .inventory import adjust_inventory
+from .provisioning import without_passwords
+from .serialized import move, register, registered
+from .sharding import save_transfer_copies, shard_for_base, sharding_enabled
+
+
+class ModelSerializer(serializers.ModelSerializer):
+    """Base for this app's model serializers: QuantityField columns are decimals in the API"""
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        QuantityField: serializers.DecimalField,
+    }
+
+
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets and opt-in expansion for ModelSerializers.
+    
+    ``fields`` keeps only the named fields. ``expand`` replaces a relation's
+    id with the nested object rendered by Meta.expandable_fields. optimize()
+    then loads just the columns, joins and annotations the remaining fields
+    read:
+    
+    - field sources are followed through the model, so ``base.name`` means
+      select_related('base') and only('base__name')
+    - Meta.field_sources lists the lookups of fields the model cannot
+      describe (properties)
+    - Meta.field_annotations maps a field to a callable returning the
+      annotation that computes it (or None to compute it per object)
+    """
+    
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        expand = list(expand or [])
+        unknown = [name for name in expand if name not in expandable]
+        if unknown:
+            raise serializers.ValidationError({
+                'expand': f'Cannot expand {", ".join(unknown)}; expandable: {", ".join(expandable) or "none"}'
+            })
+        if fields is not None:
+            unknown = [name for name in fields if name not in self.fields]
+            if unknown:
+                raise serializers.ValidationError({'fields': f'Unknown field(s): {", ".join(unknown)}'})
+            keep = set(fields) | set(expand)
+            for name in list(self.fields):
+                if name not in keep:
+                    self.fields.pop(name)
+        for name in expand:
+            self.fields[name] = expandable[name](read_only=True)
+    
+    def _add_lookup(self, lookup, only, related):
+        """Record the columns and joins ``lookup`` reads; False if it is not a plain field path"""
+        model = self.Meta.model
+        parts = lookup.split('__')
+        for index, part in enumerate(parts):
+            try:
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return False
+            prefix = '__'.join(parts[:index + 1])
+            if field.is_relation:
+                if not (field.many_to_one or field.one_to_one) or field.auto_created:
+                    return False
+                if index < len(parts) - 1:
+                    related.add(prefix)
+                only.add(prefix)
+                model = field.related_model
+            else:
+                only.add(prefix)
+        return True
+    
+    def optimize(self, queryset, ordering=()):
+        """``queryset`` narrowed to what the selected fields (and ``ordering``) need"""
+        sources = getattr(self.Meta, 'field_sources', {})
+        annotation_factories = getattr(self.Meta, 'field_annotations', {})
+        expanded = {name for name, field in self.fields.items() if isinstance(field, serializers.BaseSerializer)}
+        only, related, annotations = set(), set(expanded), {}
+        complete = True
+        
+        lookups = []
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if name in annotation_factories:
+                annotation = annotation_factories[name]()
+                if annotation is None:
+                    complete = False
+                else:
+                    annotations[name] = annotation
+            elif name in sources:
+                lookups.extend(sources[name])
+            elif field.source == '*':
+                complete = False
+            else:
+                lookups.append(field.source.replace('.', '__'))
+        lookups.extend(field.lstrip('-') for field in ordering)
+        
+        for lookup in lookups:
+            if lookup.split('__')[0] in expanded:
+                # The nested serializer reads the whole related row
+                lookup = lookup.split('__')[0]
+            if not self._add_lookup(lookup, only, related):
+                complete = False
+        
+        if related:
+            queryset = queryset.select_related(*sorted(related))
+        if complete:
+            queryset = queryset.only(*sorted(only))
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+            if ordering and not queryset.query.order_by:
+                # Meta.ordering is ignored once an aggregate adds a GROUP BY
+                queryset = queryset.order_by(*ordering)
+        return queryset
+
+
+class BaseSummarySerializer(ModelSerializer):
+    class Meta:
+        model = Base
+        fields = ['id', 'name', 'code', 'location']
+
+
+class UserSummarySerializer(ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'first_name', 'last_name']
+
+
+def _positive_inventory_count():
+    # Inventory sits on each base's shard, so sharded setups count per base
+    if sharding_enabled():
+        return None
+    return Count('inventory', filter=Q(inventory__quantity__gt=0))
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ModelSerializer):
     role = serializers.SerializerMethodField()
     assigned_base = serializers.SerializerMethodField()
+    assigned_node = serializers.SerializerMethodField()
     
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'role', 'assigned_base']
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'role', 'assigned_base', 'assigned_node']
         
     def get_role(self, obj):
         try:
@@ -34,9 +178,21 @@ class UserSerializer(serializers.ModelSerializer):
         except UserRole.DoesNotExist:
             pass
         return None
+        
+    def get_assigned_node(self, obj):
+        try:
+            if obj.role.assigned_node:
+                return {
+                    'id': obj.role.assigned_node.id,
+                    'name': obj.role.assigned_node.name,
+                    'level': obj.role.assigned_node.level
+                }
+        except UserRole.DoesNotExist:
+            pass
+        return None
 
 
-class UserRegistrationSerializer(serializers.ModelSerializer):
+class UserRegistrationSerializer(ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
     role = serializers.ChoiceField(choices=UserRole.ROLE_CHOICES)
     role_code = serializers.CharField(write_only=True, required=True)
@@ -48,21 +204,20 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     
     def validate(self, data):
         """Validate role code matches the selected role"""
-        from .models import RoleCode
-        
         role = data.get('role')
         role_code = data.get('role_code')
         
-        try:
-            valid_code = RoleCode.objects.get(role=role, is_active=True)
-            if valid_code.code != role_code:
-                raise serializers.ValidationError({
-                    'role_code': f'Invalid role code for {dict(UserRole.ROLE_CHOICES)[role]}'
-                })
-        except RoleCode.DoesNotExist:
+        # Not reference.role_codes(): a deactivated or rotated code must stop
+        # working in every worker at once, not after REFERENCE_CACHE_TTL
+        valid_code = RoleCode.objects.filter(role=role, is_active=True).values_list('code', flat=True).first()
+        if valid_code is None:
             raise serializers.ValidationError({
                 'role_code': 'No active role code found for this role'
             })
+        if valid_code != role_code:
+            raise serializers.ValidationError({
+                'role_code': f'Invalid role code for {dict(UserRole.ROLE_CHOICES)[role]}'
+            })
         
         return data
         
@@ -86,26 +241,41 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 
-class BaseSerializer(serializers.ModelSerializer):
+class BaseSerializer(SparseFieldsMixin, ModelSerializer):
     inventory_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Base
-        fields = ['id', 'name', 'location', 'code', 'inventory_count', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'location', 'code', 'org_node', 'inventory_count', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
+        field_annotations = {'inventory_count': _positive_inventory_count}
         
     def get_inventory_count(self, obj):
+        # Annotated by optimize() on reads
+        count = getattr(obj, 'inventory_count', None)
+        if count is not None:
+            return count
         return obj.inventory.filter(quantity__gt=0).count()
 
 
-class EquipmentTypeSerializer(serializers.ModelSerializer):
+class EquipmentTypeSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = EquipmentType
-        fields = ['id', 'name', 'description', 'unit', 'created_at', 'updated_at']
+        fields = [
+            'id', 'name', 'description', 'unit', 'minimum_stock', 'is_serialized', 'lot_policy',
+            'created_at', 'updated_at'
+        ]
         read_only_fields = ['created_at', 'updated_at']
+        
+    def validate(self, data):
+        is_serialized = data.get('is_serialized', getattr(self.instance, 'is_serialized', False))
+        lot_policy = data.get('lot_policy', getattr(self.instance, 'lot_policy', ''))
+        if is_serialized and lot_policy:
+            raise serializers.ValidationError("A serialized equipment type cannot also be lot-tracked")
+        return data
 
 
-class InventorySerializer(serializers.ModelSerializer):
+class InventorySerializer(SparseFieldsMixin, ModelSerializer):
     base_name = serializers.CharField(source='base.name', read_only=True)
     base_code = serializers.CharField(source='base.code', read_only=True)
     equipment_name = serializers.CharField(source='equipment_type.name', read_only=True)
@@ -119,39 +289,69 @@ class InventorySerializer(serializers.ModelSerializer):
             'quantity', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+        expandable_fields = {'base': BaseSummarySerializer, 'equipment_type': EquipmentTypeSerializer}
 
 
-class PurchaseSerializer(serializers.ModelSerializer):
+class QuantityTrackedMixin:
+    """Rejects serialized equipment types, whose Inventory only moves with their items"""
+    
+    def validate_equipment_type(self, equipment_type):
+        if equipment_type.is_serialized:
+            raise serializers.ValidationError(
+                f'{equipment_type.name} is tracked by serial number; use /serialized-assets/ instead'
+            )
+        return equipment_type
+
+
+class PurchaseSerializer(QuantityTrackedMixin, SparseFieldsMixin, ModelSerializer):
     base_name = serializers.CharField(source='base.name', read_only=True)
     equipment_name = serializers.CharField(source='equipment_type.name', read_only=True)
     created_by_name = serializers.CharField(source='created_by.username', read_only=True)
+    # The lot a purchase of a lot-tracked type opens (default lot number "P<id>")
+    lot_number = serializers.CharField(max_length=100, required=False, allow_blank=True, write_only=True)
+    expires_at = serializers.DateField(required=False, allow_null=True, write_only=True)
     
     class Meta:
         model = Purchase
         fields = [
             'id', 'base', 'base_name', 'equipment_type', 'equipment_name',
-            'quantity', 'supplier', 'purchase_date',
+            'quantity', 'supplier', 'purchase_date', 'lot_number', 'expires_at',
             'created_by', 'created_by_name', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_by', 'created_at', 'updated_at']
+        expandable_fields = {
+            'base': BaseSummarySerializer,
+            'equipment_type': EquipmentTypeSerializer,
+            'created_by': UserSummarySerializer,
+        }
+        
+    def validate(self, data):
+        equipment_type = data.get('equipment_type', getattr(self.instance, 'equipment_type', None))
+        if (data.get('lot_number') or data.get('expires_at')) and not equipment_type.lot_policy:
+            raise serializers.ValidationError(f'{equipment_type.name} is not lot-tracked')
+        return data
         
     def create(self, validated_data):
+        lot_number = validated_data.pop('lot_number', '')
+        expires_at = validated_data.pop('expires_at', None)
         validated_data['created_by'] = self.context['request'].user
         purchase = super().create(validated_data)
         
         # Update inventory
-        inventory, created = Inventory.objects.get_or_create(
-            base=purchase.base,
-            equipment_type=purchase.equipment_type,
-            defaults={'quantity': 0}
-        )
-        inventory.quantity += purchase.quantity
-        inventory.save()
+        adjust_inventory(purchase.base_id, purchase.equipment_type_id, purchase.quantity)
+        if purchase.equipment_type.lot_policy:
+            lots.receive(purchase, lot_number, expires_at)
         
         return purchase
+        
+    def update(self, instance, validated_data):
+        # The lot is fixed when the purchase is recorded
+        validated_data.pop('lot_number', None)
+        validated_data.pop('expires_at', None)
+        return super().update(instance, validated_data)
 
 
-class TransferSerializer(serializers.ModelSerializer):
+class TransferSerializer(QuantityTrackedMixin, SparseFieldsMixin, ModelSerializer):
     from_base_name = serializers.CharField(source='from_base.name', read_only=True)
     to_base_name = serializers.CharField(source='to_base.name', read_only=True)
     equipment_name = serializers.CharField(source='equipment_type.name', read_only=True)
@@ -165,6 +365,12 @@ class TransferSerializer(serializers.ModelSerializer):
             'created_by', 'created_by_name', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_by', 'created_at', 'updated_at']
+        expandable_fields = {
+            'from_base': BaseSummarySerializer,
+            'to_base': BaseSummarySerializer,
+            'equipment_type': EquipmentTypeSerializer,
+            'created_by': UserSummarySerializer,
+        }
         
     def validate(self, data):
         if data['from_base'] == data['to_base']:
@@ -174,24 +380,15 @@ class TransferSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         transfer = super().create(validated_data)
+        save_transfer_copies(transfer)
+        publish_transfer(transfer)
         
         if transfer.status == 'completed':
             # Update inventory at both bases
-            from_inventory, _ = Inventory.objects.get_or_create(
-                base=transfer.from_base,
-                equipment_type=transfer.equipment_type,
-                defaults={'quantity': 0}
-            )
-            from_inventory.quantity -= transfer.quantity
-            from_inventory.save()
-            
-            to_inventory, _ = Inventory.objects.get_or_create(
-                base=transfer.to_base,
-                equipment_type=transfer.equipment_type,
-                defaults={'quantity': 0}
-            )
-            to_inventory.quantity += transfer.quantity
-            to_inventory.save()
+            adjust_inventory(transfer.from_base_id, transfer.equipment_type_id, -transfer.quantity)
+            adjust_inventory(transfer.to_base_id, transfer.equipment_type_id, transfer.quantity)
+            if transfer.equipment_type.lot_policy:
+                lots.transfer(transfer, transfer.equipment_type.lot_policy)
         
         return transfer
         
@@ -201,26 +398,19 @@ class TransferSerializer(serializers.ModelSerializer):
         
         # If status changed to completed, update inventory
         if old_status != 'completed' and new_status == 'completed':
-            from_inventory, _ = Inventory.objects.get_or_create(
-                base=instance.from_base,
-                equipment_type=instance.equipment_type,
-                defaults={'quantity': 0}
-            )
-            from_inventory.quantity -= instance.quantity
-            from_inventory.save()
-            
-            to_inventory, _ = Inventory.objects.get_or_create(
-                base=instance.to_base,
-                equipment_type=instance.equipment_type,
-                defaults={'quantity': 0}
-            )
-            to_inventory.quantity += instance.quantity
-            to_inventory.save()
+            adjust_inventory(instance.from_base_id, instance.equipment_type_id, -instance.quantity)
+            adjust_inventory(instance.to_base_id, instance.equipment_type_id, instance.quantity)
+            if instance.equipment_type.lot_policy:
+                lots.transfer(instance, instance.equipment_type.lot_policy)
         
-        return super().update(instance, validated_data)
+        transfer = super().update(instance, validated_data)
+        save_transfer_copies(transfer)
+        if transfer.status != old_status:
+            publish_transfer(transfer, old_status)
+        return transfer
 
 
-class AssignmentSerializer(serializers.ModelSerializer):
+class AssignmentSerializer(QuantityTrackedMixin, SparseFieldsMixin, ModelSerializer):
     base_name = serializers.CharField(source='base.name', read_only=True)
     equipment_name = serializers.CharField(source='equipment_type.name', read_only=True)
     created_by_name = serializers.CharField(source='created_by.username', read_only=True)
@@ -235,19 +425,24 @@ class AssignmentSerializer(serializers.ModelSerializer):
             'created_by', 'created_by_name', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_by', 'outstanding_quantity', 'created_at', 'updated_at']
+        expandable_fields = {
+            'base': BaseSummarySerializer,
+            'equipment_type': EquipmentTypeSerializer,
+            'created_by': UserSummarySerializer,
+        }
+        field_sources = {'outstanding_quantity': ['assigned_quantity', 'returned_quantity']}
         
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         assignment = super().create(validated_data)
         
         # Update inventory
-        inventory, _ = Inventory.objects.get_or_create(
-            base=assignment.base,
-            equipment_type=assignment.equipment_type,
-            defaults={'quantity': 0}
-        )
-        inventory.quantity -= assignment.assigned_quantity
-        inventory.save()
+        adjust_inventory(assignment.base_id, assignment.equipment_type_id, -assignment.assigned_quantity)
+        if assignment.equipment_type.lot_policy:
+            lots.allocate(
+                'assignment', assignment.pk, assignment.base_id, assignment.equipment_type_id,
+                assignment.assigned_quantity, assignment.equipment_type.lot_policy
+            )
         
         return assignment
         
@@ -258,18 +453,14 @@ class AssignmentSerializer(serializers.ModelSerializer):
         # If returned quantity increased, add back to inventory
         if new_returned > old_returned:
             returned_diff = new_returned - old_returned
-            inventory, _ = Inventory.objects.get_or_create(
-                base=instance.base,
-                equipment_type=instance.equipment_type,
-                defaults={'quantity': 0}
-            )
-            inventory.quantity += returned_diff
-            inventory.save()
+            adjust_inventory(instance.base_id, instance.equipment_type_id, returned_diff)
+            if instance.equipment_type.lot_policy:
+                lots.restore('assignment', instance.pk, instance.base_id, instance.equipment_type_id, returned_diff)
         
         return super().update(instance, validated_data)
 
 
-class ExpenditureSerializer(serializers.ModelSerializer):
+class ExpenditureSerializer(QuantityTrackedMixin, SparseFieldsMixin, ModelSerializer):
     base_name = serializers.CharField(source='base.name', read_only=True)
     equipment_name = serializers.CharField(source='equipment_type.name', read_only=True)
     created_by_name = serializers.CharField(source='created_by.username', read_only=True)
@@ -282,18 +473,356 @@ class ExpenditureSerializer(serializers.ModelSerializer):
             'created_by', 'created_by_name', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_by', 'created_at', 'updated_at']
+        expandable_fields = {
+            'base': BaseSummarySerializer,
+            'equipment_type': EquipmentTypeSerializer,
+            'created_by': UserSummarySerializer,
+        }
         
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         expenditure = super().create(validated_data)
         
         # Update inventory
-        inventory, _ = Inventory.objects.get_or_create(
-            base=expenditure.base,
-            equipment_type=expenditure.equipment_type,
-            defaults={'quantity': 0}
-        )
-        inventory.quantity -= expenditure.quantity
-        inventory.save()
+        adjust_inventory(expenditure.base_id, expenditure.equipment_type_id, -expenditure.quantity)
+        if expenditure.equipment_type.lot_policy:
+            lots.allocate(
+                'expenditure', expenditure.pk, expenditure.base_id, expenditure.equipment_type_id,
+                expenditure.quantity, expenditure.equipment_type.lot_policy
+            )
         
         return expenditure
+
+
+class StockThresholdSerializer(ModelSerializer):
+    base_name = serializers.CharField(source='base.name', read_only=True)
+    equipment_name = serializers.CharField(source='equipment_type.name', read_only=True)
+    
+    class Meta:
+        model = StockThreshold
+        fields = [
+            'id', 'base', 'base_name', 'equipment_type', 'equipment_name',
+            'minimum', 'resolve_at', 'target', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['created_at', 'updated_at']
+        
+    def validate(self, data):
+        minimum = data.get('minimum', getattr(self.instance, 'minimum', None))
+        resolve_at = data.get('resolve_at', getattr(self.instance, 'resolve_at', None))
+        target = data.get('target', getattr(self.instance, 'target', None))
+        if resolve_at is not None and minimum is not None and resolve_at < minimum:
+            raise serializers.ValidationError("resolve_at cannot be below minimum")
+        if target is not None and minimum is not None and target < minimum:
+            raise serializers.ValidationError("target cannot be below minimum")
+        return data
+
+
+class OrgNodeSerializer(ModelSerializer):
+    parent_name = serializers.CharField(source='parent.name', read_only=True)
+    
+    class Meta:
+        model = OrgNode
+        fields = ['id', 'name', 'code', 'level', 'parent', 'parent_name', 'created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at']
+        
+    def validate(self, data):
+        node = OrgNode(
+            pk=getattr(self.instance, 'pk', None),
+            level=data.get('level', getattr(self.instance, 'level', None)),
+            parent=data.get('parent', getattr(self.instance, 'parent', None)),
+        )
+        error = node.hierarchy_error()
+        if error:
+            raise serializers.ValidationError({'parent': error})
+        return data
+
+
+class TransferCostSerializer(ModelSerializer):
+    from_base_name = serializers.CharField(source='from_base.name', read_only=True)
+    to_base_name = serializers.CharField(source='to_base.name', read_only=True)
+    
+    class Meta:
+        model = TransferCost
+        fields = ['id', 'from_base', 'from_base_name', 'to_base', 'to_base_name', 'cost', 'created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at']
+        
+    def validate(self, data):
+        from_base = data.get('from_base', getattr(self.instance, 'from_base', None))
+        to_base = data.get('to_base', getattr(self.instance, 'to_base', None))
+        if from_base is not None and from_base == to_base:
+            raise serializers.ValidationError("from_base and to_base must differ")
+        return data
+
+
+class RebalanceProposalSerializer(serializers.Serializer):
+    """A transfer proposed by rebalancing.recommend(); ``id`` once it is saved"""
+    id = serializers.IntegerField(required=False)
+    from_base = serializers.IntegerField()
+    from_base_name = serializers.CharField()
+    to_base = serializers.IntegerField()
+    to_base_name = serializers.CharField()
+    equipment_type = serializers.IntegerField()
+    equipment_name = serializers.CharField(allow_null=True)
+    quantity = serializers.DecimalField(max_digits=10, decimal_places=2)
+    unit_cost = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class RebalancePlanSerializer(serializers.Serializer):
+    """Output of rebalancing.recommend(); totals may exceed any single row's digits"""
+    shortfall = serializers.DecimalField(max_digits=None, decimal_places=2)
+    covered = serializers.DecimalField(max_digits=None, decimal_places=2)
+    cost = serializers.DecimalField(max_digits=None, decimal_places=2)
+    transfers = RebalanceProposalSerializer(many=True)
+
+
+class StockAlertSerializer(ModelSerializer):
+    base_name = serializers.CharField(source='base.name', read_only=True)
+    equipment_name = serializers.CharField(source='equipment_type.name', read_only=True)
+    is_open = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = StockAlert
+        fields = [
+            'id', 'base', 'base_name', 'equipment_type', 'equipment_name', 'minimum', 'quantity',
+            'lowest_quantity', 'is_open', 'opened_at', 'resolved_at', 'resolved_quantity'
+        ]
+        read_only_fields = fields
+        
+    def get_is_open(self, obj):
+        return obj.resolved_at is None
+
+
+class JobSerializer(SparseFieldsMixin, ModelSerializer):
+    created_by_name = serializers.CharField(source='created_by.username', read_only=True)
+    
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'kind', 'status', 'progress', 'progress_message', 'attempts', 'max_attempts',
+            'result', 'error', 'run_at', 'created_by', 'created_by_name',
+            'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+        expandable_fields = {'created_by': UserSummarySerializer}
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Passwords generated by provisioning go to the job's creator once (JobViewSet.retrieve)
+        result = data.get('result')
+        if isinstance(result, dict) and 'generated_passwords' in result and not self.context.get('reveal_passwords'):
+            data['result'] = without_passwords(result)
+        return data
+
+
+# Audit log bodies of these routes (logins, signups, tokens, provisioning CSVs) are never shown
+REDACTED_ROUTES = ['/api/v1/auth/']
+# JSON keys whose values are replaced in shown bodies; any key containing "password" is too
+REDACTED_KEYS = {'access', 'refresh', 'token'}
+REDACTED = '[redacted]'
+# "key": "value" pairs in bodies that are not valid JSON (e.g. cut at API_LOG_BODY_MAX_BYTES)
+REDACTED_PAIR = re.compile(r'("(?:[^"]*password[^"]*|access|refresh|token)"\s*:\s*)"[^"]*"?', re.IGNORECASE)
+
+
+def _redact(value):
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if 'password' in key.lower() or key.lower() in REDACTED_KEYS else _redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_redact(item) for item in value]
+    return value
+
+
+def redact_body(endpoint, body):
+    """An audit log body as shown through the API: secrets replaced, auth routes withheld"""
+    if not body:
+        return body
+    if any(endpoint.startswith(route) for route in REDACTED_ROUTES):
+        return REDACTED
+    try:
+        return json.dumps(_redact(json.loads(body)))
+    except ValueError:
+        return REDACTED_PAIR.sub(rf'\1"{REDACTED}"', body)
+
+
+class APILogSerializer(SparseFieldsMixin, ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True, default=None)
+    
+    class Meta:
+        model = APILog
+        fields = ['id', 'user', 'username', 'method', 'endpoint', 'status_code', 'ip_address', 'timestamp']
+        read_only_fields = fields
+
+
+class APILogDetailSerializer(APILogSerializer):
+    """One log entry with its captured bodies, redacted (see redact_body())"""
+    request_body = serializers.SerializerMethodField()
+    response_body = serializers.SerializerMethodField()
+    
+    class Meta(APILogSerializer.Meta):
+        fields = APILogSerializer.Meta.fields + ['request_body', 'response_body']
+        read_only_fields = fields
+        field_sources = {
+            'request_body': ['endpoint', 'request_body'],
+            'response_body': ['endpoint', 'response_body'],
+        }
+    
+    def get_request_body(self, log):
+        return redact_body(log.endpoint, log.request_body)
+    
+    def get_response_body(self, log):
+        return redact_body(log.endpoint, log.response_body)
+
+
+class StockLotSerializer(ModelSerializer):
+    base_name = serializers.CharField(source='base.name', read_only=True)
+    equipment_name = serializers.CharField(source='equipment_type.name', read_only=True)
+    
+    class Meta:
+        model = StockLot
+        fields = [
+            'id', 'lot_number', 'base', 'base_name', 'equipment_type', 'equipment_name', 'purchase',
+            'received_at', 'expires_at', 'quantity', 'remaining', 'recalled', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class LotAllocationSerializer(ModelSerializer):
+    class Meta:
+        model = LotAllocation
+        fields = ['id', 'lot', 'base', 'kind', 'transaction_id', 'quantity', 'returned', 'created_at']
+        read_only_fields = fields
+
+
+class LotRecallSerializer(serializers.Serializer):
+    """Every copy of a lot of one equipment type, at every base"""
+    equipment_type = serializers.PrimaryKeyRelatedField(queryset=EquipmentType.objects.all())
+    lot_number = serializers.CharField(max_length=100)
+    recalled = serializers.BooleanField(default=True)
+
+
+class SerializedStatusField(serializers.ChoiceField):
+    """SerializedAsset status by name (``available``, ``in_transit``, ...)"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(choices=list(SerializedAsset.STATUS_NAMES.values()), **kwargs)
+        
+    def to_internal_value(self, data):
+        name = super().to_internal_value(data)
+        return next(code for code, code_name in SerializedAsset.STATUS_NAMES.items() if code_name == name)
+        
+    def to_representation(self, value):
+        return SerializedAsset.STATUS_NAMES.get(value, value)
+
+
+def _serialized_type(equipment_type):
+    if not equipment_type.is_serialized:
+        raise serializers.ValidationError(f'{equipment_type.name} is not tracked by serial number')
+    return equipment_type
+
+
+def _batch(values, name):
+    if len(values) > settings.SERIALIZED_BATCH_MAX:
+        raise serializers.ValidationError(f'At most {settings.SERIALIZED_BATCH_MAX} {name} per request')
+    if len(set(values)) != len(values):
+        raise serializers.ValidationError(f'Duplicate {name}')
+    return values
+
+
+class SerializedAssetSerializer(ModelSerializer):
+    base_name = serializers.CharField(source='base.name', read_only=True)
+    equipment_name = serializers.CharField(source='equipment_type.name', read_only=True)
+    status = SerializedStatusField(required=False)
+    
+    class Meta:
+        model = SerializedAsset
+        fields = [
+            'id', 'serial_number', 'equipment_type', 'equipment_name',
+            'base', 'base_name', 'status', 'assignee', 'updated_at'
+        ]
+        read_only_fields = ['updated_at']
+        
+    def validate_equipment_type(self, equipment_type):
+        return _serialized_type(equipment_type)
+        
+    def validate(self, data):
+        if self.instance is not None:
+            for field in ['serial_number', 'equipment_type']:
+                if field in data and data[field] != getattr(self.instance, field):
+                    raise serializers.ValidationError({
+                        field: 'Cannot change; retire the item and register a new one'
+                    })
+        elif registered(data['equipment_type'].pk, [data['serial_number']]):
+            raise serializers.ValidationError({'serial_number': 'Already registered'})
+        return data
+        
+    def create(self, validated_data):
+        return register(
+            validated_data['base'].pk, validated_data['equipment_type'].pk, [validated_data['serial_number']],
+            status=validated_data.get('status', SerializedAsset.AVAILABLE)
+        )[0]
+        
+    def update(self, instance, validated_data):
+        base = validated_data.get('base')
+        move(
+            {'id': instance.pk}, base_id=base.pk if base else None,
+            status=validated_data.get('status'), assignee=validated_data.get('assignee')
+        )
+        return SerializedAsset.objects.using(shard_for_base(base or instance.base_id)).get(pk=instance.pk)
+
+
+class SerializedRegisterSerializer(serializers.Serializer):
+    """New items of one equipment type arriving at a base"""
+    base = serializers.PrimaryKeyRelatedField(queryset=Base.objects.filter(is_deleted=False))
+    equipment_type = serializers.PrimaryKeyRelatedField(queryset=EquipmentType.objects.filter(is_deleted=False))
+    serial_numbers = serializers.ListField(child=serializers.CharField(max_length=64), allow_empty=False)
+    status = SerializedStatusField(default=SerializedAsset.AVAILABLE)
+    
+    def validate_equipment_type(self, equipment_type):
+        return _serialized_type(equipment_type)
+        
+    def validate_serial_numbers(self, serial_numbers):
+        return _batch(serial_numbers, 'serial numbers')
+        
+    def validate(self, data):
+        existing = registered(data['equipment_type'].pk, data['serial_numbers'])
+        if existing:
+            raise serializers.ValidationError({'serial_numbers': f'Already registered: {", ".join(existing)}'})
+        return data
+
+
+class SerializedMoveSerializer(serializers.Serializer):
+    """
+    Items picked by ``ids`` or by ``serial_numbers`` (optionally of one
+    ``equipment_type``), and what to change: ``base``, ``status``, ``assignee``
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    serial_numbers = serializers.ListField(child=serializers.CharField(max_length=64), required=False, allow_empty=False)
+    equipment_type = serializers.PrimaryKeyRelatedField(queryset=EquipmentType.objects.all(), required=False)
+    base = serializers.PrimaryKeyRelatedField(queryset=Base.objects.filter(is_deleted=False), required=False)
+    status = SerializedStatusField(required=False)
+    assignee = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    
+    def validate_ids(self, ids):
+        return _batch(ids, 'ids')
+        
+    def validate_serial_numbers(self, serial_numbers):
+        return _batch(serial_numbers, 'serial numbers')
+        
+    def validate(self, data):
+        if ('ids' in data) == ('serial_numbers' in data):
+            raise serializers.ValidationError('Give either ids or serial_numbers')
+        if not {'base', 'status', 'assignee'} & set(data):
+            raise serializers.ValidationError('Nothing to change: give base, status or assignee')
+        return data
+        
+    def item_filters(self):
+        """Lookups selecting the items to move"""
+        data = self.validated_data
+        if 'ids' in data:
+            return {'id__in': data['ids']}
+        filters = {'serial_number__in': data['serial_numbers']}
+        if 'equipment_type' in data:
+            filters['equipment_type'] = data['equipment_type']
+        return filters
@@ -0,0 +1,195 @@
+"""
+Time-bucketed movement series for dashboard charts.
+
+All five movement kinds are truncated and summed by the database and
+combined with UNION ALL, so a chart costs one round trip (per shard)
+regardless of how many transactions sit behind it.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import CharField, F, IntegerField, Sum, Value
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from . import reference
+from .models import Assignment, Expenditure, Purchase, Transfer
+from .sharding import shard_partitions
+
+
+INTERVALS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# Default window (in buckets) when no start_date is given
+DEFAULT_POINTS = {
+    'day': 90,
+    'week': 26,
+    'month': 12,
+}
+
+MAX_POINTS = 366
+
+MOVEMENTS = ['purchases', 'transfers_in', 'transfers_out', 'assignments', 'expenditures']
+
+GROUP_BY_CHOICES = ['base', 'equipment_type']
+
+
+def bucket_start(day, interval):
+    """Return the first date of the bucket containing ``day``"""
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    if interval == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day, interval):
+    """Return the first date of the bucket following ``day``"""
+    if interval == 'week':
+        return day + timedelta(days=7)
+    if interval == 'month':
+        if day.month == 12:
+            return day.replace(year=day.year + 1, month=1)
+        return day.replace(month=day.month + 1)
+    return day + timedelta(days=1)
+
+
+def previous_bucket(day, interval):
+    """Return the first date of the bucket preceding ``day``"""
+    if interval == 'week':
+        return day - timedelta(days=7)
+    if interval == 'month':
+        if day.month == 1:
+            return day.replace(year=day.year - 1, month=12)
+        return day.replace(month=day.month - 1)
+    return day - timedelta(days=1)
+
+
+def build_buckets(start, end, interval, max_points=MAX_POINTS):
+    """
+    List the bucket start dates covering [start, end].
+
+    If the range needs more than ``max_points`` buckets only the most
+    recent ones are kept. Returns ``(buckets, truncated)``.
+    """
+    buckets = []
+    current = bucket_start(end, interval)
+    first = bucket_start(start, interval)
+    while current >= first and len(buckets) < max_points:
+        buckets.append(current)
+        current = previous_bucket(current, interval)
+    buckets.reverse()
+    return buckets, current >= first
+
+
+def _movement_queryset(model, movement, date_field, base_field, quantity,
+                       alias, interval, group_by, bases, equipment_type_id, start, end):
+    """Grouped (movement, bucket, group_key, total) rows for one movement kind"""
+    filters = {
+        'is_deleted': False,
+        f'{base_field}__in': bases,
+        f'{date_field}__gte': start,
+        f'{date_field}__lt': end,
+    }
+    if model is Transfer:
+        filters['status'] = 'completed'
+    if equipment_type_id:
+        filters['equipment_type_id'] = equipment_type_id
+
+    if group_by == 'base':
+        group_key = F(f'{base_field}_id')
+    elif group_by == 'equipment_type':
+        group_key = F('equipment_type_id')
+    else:
+        group_key = Value(0, output_field=IntegerField())
+
+    return model.objects.using(alias).filter(**filters).order_by().annotate(
+        movement=Value(movement, output_field=CharField()),
+        bucket=INTERVALS[interval](date_field),
+        group_key=group_key,
+    ).values('movement', 'bucket', 'group_key').annotate(total=Sum(quantity))
+
+
+def _movement_rows(bases, interval, group_by, equipment_type_id, start, end):
+    """Grouped rows for all movement kinds, one UNION ALL query per shard"""
+    for alias, shard_bases in shard_partitions(bases):
+        args = (alias, interval, group_by, shard_bases, equipment_type_id, start, end)
+        querysets = [
+            _movement_queryset(Purchase, 'purchases', 'purchase_date', 'base', 'quantity', *args),
+            _movement_queryset(Transfer, 'transfers_in', 'transfer_date', 'to_base', 'quantity', *args),
+            _movement_queryset(Transfer, 'transfers_out', 'transfer_date', 'from_base', 'quantity', *args),
+            _movement_queryset(
+                Assignment, 'assignments', 'assignment_date', 'base',
+                F('assigned_quantity') - F('returned_quantity'), *args
+            ),
+            _movement_queryset(Expenditure, 'expenditures', 'expenditure_date', 'base', 'quantity', *args),
+        ]
+        yield from querysets[0].union(*querysets[1:], all=True)
+
+
+def movement_series(bases, interval='day', group_by=None, equipment_type_id=None,
+                    start_date=None, end_date=None, max_points=MAX_POINTS):
+    """
+    Compute per-bucket movement totals for the given bases.
+
+    Returns a columnar payload: one ``buckets`` array of ISO dates and, for
+    every group, one array per movement kind aligned with it.
+    """
+    end_date = end_date or timezone.localdate()
+    if start_date is None:
+        start_date = end_date
+        for _ in range(DEFAULT_POINTS[interval] - 1):
+            start_date = previous_bucket(bucket_start(start_date, interval), interval)
+
+    buckets, truncated = build_buckets(start_date, end_date, interval, max_points)
+    if not buckets:
+        return {
+            'interval': interval,
+            'group_by': group_by,
+            'truncated': False,
+            'buckets': [],
+            'series': [],
+        }
+
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(buckets[0], time.min), tz)
+    end = timezone.make_aware(datetime.combine(next_bucket(buckets[-1], interval), time.min), tz)
+
+    index = {bucket: position for position, bucket in enumerate(buckets)}
+    series = {}
+    for row in _movement_rows(bases, interval, group_by, equipment_type_id, start, end):
+        bucket = row['bucket']
+        if isinstance(bucket, datetime):
+            bucket = timezone.localtime(bucket, tz).date() if timezone.is_aware(bucket) else bucket.date()
+        position = index.get(bucket)
+        if position is None:
+            continue
+        columns = series.get(row['group_key'])
+        if columns is None:
+            columns = series[row['group_key']] = {movement: [0.0] * len(buckets) for movement in MOVEMENTS}
+        columns[row['movement']][position] += float(row['total'] or 0)
+
+    if group_by == 'base':
+        names = {key: row['name'] for key, row in reference.bases().items() if key in series}
+    elif group_by == 'equipment_type':
+        names = {key: row['name'] for key, row in reference.equipment_types().items() if key in series}
+    else:
+        names = {}
+        series.setdefault(0, {movement: [0.0] * len(buckets) for movement in MOVEMENTS})
+
+    return {
+        'interval': interval,
+        'group_by': group_by,
+        'truncated': truncated,
+        'buckets': [bucket.isoformat() for bucket in buckets],
+        'series': [
+            {
+                'group_id': key if group_by else None,
+                'group_name': names.get(key) if group_by else None,
+                **columns,
+            }
+            for key, columns in sorted(series.items(), key=lambda item: names.get(item[0]) or '')
+        ],
+    }
@@ -0,0 +1,444 @@
+"""
+Opt-in sharding of the transaction and inventory tables by base.
+
+Enabled by SHARD_DATABASE_URLS (see settings.py). ``default`` is always
+the first shard and stays authoritative for every other table; bases,
+equipment types and users are mirrored to the other shards so foreign
+keys resolve locally.
+
+- The shard map (``BaseShard``) pins each base to an alias; unmapped
+  bases fall back to ``SHARDS[base_id % len(SHARDS)]``.
+- Inventory, purchases, assignments, expenditures, serialized items and
+  stock lots live on their base's shard. A transfer lives on its
+  ``from_base`` shard and, when ``to_base`` is elsewhere, a copy with the
+  same id is written to that shard too, so every base-scoped query stays
+  on one shard. Each side's inventory is adjusted on its own shard. Items
+  moving to a base on another shard are copied there and deleted from
+  the old one. There is no cross-shard atomicity: a failure between
+  the writes leaves drift that ``reconcile_inventory`` reports.
+- Primary keys of sharded tables come from ``ShardSequence`` on
+  ``default`` so they are unique across shards.
+- Cross-base reads fan out with ``FanoutQuerySet``; each shard only
+  contributes the rows it owns, so mirrored transfers are not repeated.
+
+With sharding disabled every helper here is a no-op and routing falls
+through to the next router.
+"""
+import heapq
+import threading
+import time
+from functools import cmp_to_key
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.contrib.auth.models import User
+
+from .models import (
+    Base, BaseShard, EquipmentType, Inventory, OrgNode, Purchase, Transfer,
+    Assignment, Expenditure, SerializedAsset, ShardSequence, StockLot, LotAllocation
+)
+
+
+# Sharded model -> field holding the owning base
+SHARD_KEYS = {
+    Inventory: 'base',
+    Purchase: 'base',
+    Transfer: 'from_base',
+    Assignment: 'base',
+    Expenditure: 'base',
+    SerializedAsset: 'base',
+    StockLot: 'base',
+    LotAllocation: 'base',
+}
+
+# Tables copied from default to every other shard (OrgNode so that
+# Base.org_node resolves; the closure table stays on default)
+REFERENCE_MODELS = [OrgNode, Base, EquipmentType, User]
+
+# Primary keys reserved from ShardSequence per round trip
+ID_BLOCK_SIZE = 100
+
+_map_lock = threading.Lock()
+_shard_map = {'loaded_at': None, 'map': {}}
+
+_id_lock = threading.Lock()
+_id_blocks = {}
+
+
+def sharding_enabled():
+    return bool(getattr(settings, 'SHARDS', None))
+
+
+def shard_aliases():
+    """Database aliases holding sharded tables ([None] when disabled)"""
+    return list(settings.SHARDS) if sharding_enabled() else [None]
+
+
+def shard_map():
+    """Explicit base_id -> alias assignments, cached for SHARD_MAP_TTL seconds"""
+    now = time.monotonic()
+    with _map_lock:
+        loaded_at = _shard_map['loaded_at']
+        if loaded_at is None or now - loaded_at > settings.SHARD_MAP_TTL:
+            _shard_map['map'] = dict(BaseShard.objects.using('default').values_list('base_id', 'alias'))
+            _shard_map['loaded_at'] = now
+        return _shard_map['map']
+
+
+def clear_shard_map():
+    with _map_lock:
+        _shard_map['loaded_at'] = None
+
+
+def shard_for_base(base_id):
+    """Alias holding the given base's rows (None when sharding is disabled)"""
+    if not sharding_enabled() or base_id is None:
+        return None
+    if isinstance(base_id, models.Model):
+        base_id = base_id.pk
+    alias = shard_map().get(base_id)
+    if alias in settings.SHARDS:
+        return alias
+    return settings.SHARDS[base_id % len(settings.SHARDS)]
+
+
+def shard_for_instance(instance):
+    """Owning shard of a sharded model instance"""
+    return shard_for_base(getattr(instance, f'{SHARD_KEYS[type(instance)]}_id'))
+
+
+def transfer_shards(transfer):
+    """Every shard that must hold a copy of the transfer"""
+    aliases = [shard_for_base(transfer.from_base_id), shard_for_base(transfer.to_base_id)]
+    return list(dict.fromkeys(aliases))
+
+
+def bases_on_shard(alias, base_ids=None):
+    """Ids of the given bases (default: all bases) that live on ``alias``"""
+    if base_ids is None:
+        base_ids = Base.objects.using('default').values_list('id', flat=True)
+    return [base_id for base_id in base_ids if shard_for_base(base_id) == alias]
+
+
+def shard_partitions(bases):
+    """
+    Split a set of bases by shard: ``[(alias, base_ids), ...]``.
+
+    With sharding disabled the input (a queryset or id list) is returned
+    unchanged as ``[(None, bases)]``.
+    """
+    if not sharding_enabled():
+        return [(None, bases)]
+    if isinstance(bases, models.QuerySet):
+        bases = bases.using('default').values_list('id', flat=True)
+    partitions = {}
+    for base_id in bases:
+        partitions.setdefault(shard_for_base(base_id), []).append(base_id)
+    return [(alias, partitions[alias]) for alias in settings.SHARDS if alias in partitions]
+
+
+def allocate_ids(model, count=1):
+    """Reserve ``count`` primary keys for a sharded model"""
+    name = model._meta.label_lower
+    ids = []
+    with _id_lock:
+        block = _id_blocks.setdefault(name, [0, 0])
+        while len(ids) < count:
+            if block[0] >= block[1]:
+                size = max(ID_BLOCK_SIZE, count - len(ids))
+                block[0], block[1] = _reserve_block(model, name, size)
+            take = min(count - len(ids), block[1] - block[0])
+            ids.extend(range(block[0], block[0] + take))
+            block[0] += take
+    return ids
+
+
+def _reserve_block(model, name, size):
+    with transaction.atomic(using='default'):
+        sequence = ShardSequence.objects.using('default').select_for_update().filter(name=name).first()
+        if sequence is None:
+            start = 1 + max(
+                model.objects.using(alias).aggregate(max_id=Max('pk'))['max_id'] or 0
+                for alias in settings.SHARDS
+            )
+            try:
+                with transaction.atomic(using='default'):
+                    sequence = ShardSequence.objects.using('default').create(name=name, next_value=start)
+            except IntegrityError:
+                sequence = ShardSequence.objects.using('default').select_for_update().get(name=name)
+        start = sequence.next_value
+        sequence.next_value = start + size
+        sequence.save(using='default', update_fields=['next_value'])
+    return start, start + size
+
+
+def assign_ids(objs):
+    """Give unsaved sharded instances global primary keys before bulk_create()"""
+    if not sharding_enabled():
+        return objs
+    pending = [obj for obj in objs if obj.pk is None]
+    if pending:
+        for obj, pk in zip(pending, allocate_ids(type(pending[0]), len(pending))):
+            obj.pk = pk
+    return objs
+
+
+def save_transfer_copies(transfer):
+    """
+    Write the transfer to every shard involved other than the one it was
+    saved on, and drop copies left on shards that are no longer involved
+    """
+    if not sharding_enabled():
+        return
+    involved = transfer_shards(transfer)
+    for alias in settings.SHARDS:
+        if alias == transfer._state.db:
+            continue
+        if alias in involved:
+            copy = Transfer(**{field.attname: getattr(transfer, field.attname) for field in Transfer._meta.concrete_fields})
+            copy.save(using=alias)
+        else:
+            Transfer.objects.using(alias).filter(pk=transfer.pk).delete()
+
+
+class ShardRouter:
+    """Route sharded models to their base's shard when the base is known"""
+
+    def _db_for(self, model, hints):
+        if not sharding_enabled() or model not in SHARD_KEYS:
+            return None
+        instance = hints.get('instance')
+        if isinstance(instance, Base):
+            return shard_for_base(instance.pk)
+        if type(instance) in SHARD_KEYS:
+            return instance._state.db or shard_for_instance(instance)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not sharding_enabled():
+            return None
+        if {obj1._state.db, obj2._state.db} <= set(settings.SHARDS) | {'default', 'replica'}:
+            if type(obj1) in REFERENCE_MODELS or type(obj2) in REFERENCE_MODELS:
+                return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+def _allocate_pk(sender, instance, raw=False, **kwargs):
+    if sharding_enabled() and not raw and instance.pk is None:
+        instance.pk = allocate_ids(sender)[0]
+
+
+def _mirror_reference(sender, instance, raw=False, using=None, **kwargs):
+    if not sharding_enabled() or raw or using != 'default':
+        return
+    values = {field.attname: getattr(instance, field.attname) for field in sender._meta.concrete_fields}
+    for alias in settings.SHARDS:
+        if alias != 'default':
+            sender(**values).save(using=alias)
+
+
+def _delete_reference(sender, instance, using=None, **kwargs):
+    if not sharding_enabled() or using != 'default':
+        return
+    for alias in settings.SHARDS:
+        if alias != 'default':
+            sender.objects.using(alias).filter(pk=instance.pk).delete()
+
+
+def mirror_reference_rows(model, objs, batch_size=500):
+    """Copy reference rows saved with bulk_create (which sends no signals) to every shard"""
+    if not sharding_enabled() or not objs:
+        return
+    fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+    for alias in settings.SHARDS:
+        if alias != 'default':
+            copies = [model(**{field.attname: getattr(obj, field.attname) for field in model._meta.concrete_fields}) for obj in objs]
+            model.objects.using(alias).bulk_create(
+                copies, batch_size=batch_size, update_conflicts=True, update_fields=fields, unique_fields=['id']
+            )
+
+
+def connect_signals():
+    for model in SHARD_KEYS:
+        pre_save.connect(_allocate_pk, sender=model, dispatch_uid=f'shard-pk-{model._meta.label_lower}')
+    for model in REFERENCE_MODELS:
+        post_save.connect(_mirror_reference, sender=model, dispatch_uid=f'shard-mirror-{model._meta.label_lower}')
+        post_delete.connect(_delete_reference, sender=model, dispatch_uid=f'shard-delete-{model._meta.label_lower}')
+
+
+def owned_by(queryset, alias):
+    """Restrict a sharded queryset to the rows ``alias`` owns"""
+    if alias is None:
+        return queryset
+    key = SHARD_KEYS[queryset.model]
+    return queryset.using(alias).filter(**{f'{key}_id__in': bases_on_shard(alias)})
+
+
+def route_queryset(queryset, base_ids=None):
+    """
+    Route a sharded queryset: one shard when every base it is scoped to
+    lives there, otherwise a FanoutQuerySet over all shards. Unchanged
+    when sharding is disabled.
+    """
+    if not sharding_enabled():
+        return queryset
+    aliases = {shard_for_base(base_id) for base_id in base_ids or ()}
+    if len(aliases) == 1:
+        return queryset.using(aliases.pop())
+    return FanoutQuerySet([owned_by(queryset, alias) for alias in settings.SHARDS])
+
+
+def _attribute(obj, path):
+    if isinstance(obj, dict):
+        # values() rows are keyed by the lookup itself
+        return obj.get(path)
+    for attr in path.split('__'):
+        obj = getattr(obj, attr, None)
+        if obj is None:
+            return None
+    return obj
+
+
+class FanoutQuerySet:
+    """
+    A read-only queryset spread over several shards.
+
+    Chained calls are applied to every shard; slicing fetches the first
+    ``stop`` rows from each shard and merges them in ``order_by`` order,
+    which is all DRF filtering and page-number pagination need.
+    """
+
+    def __init__(self, querysets):
+        self._querysets = querysets
+        self.model = querysets[0].model
+
+    def _chain(self, method, *args, **kwargs):
+        return FanoutQuerySet([getattr(queryset, method)(*args, **kwargs) for queryset in self._querysets])
+
+    def all(self):
+        return self._chain('all')
+
+    def filter(self, *args, **kwargs):
+        return self._chain('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain('exclude', *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._chain('order_by', *fields)
+
+    def select_related(self, *fields):
+        return self._chain('select_related', *fields)
+
+    def prefetch_related(self, *lookups):
+        return self._chain('prefetch_related', *lookups)
+
+    def only(self, *fields):
+        return self._chain('only', *fields)
+
+    def defer(self, *fields):
+        return self._chain('defer', *fields)
+
+    def annotate(self, *args, **kwargs):
+        return self._chain('annotate', *args, **kwargs)
+
+    def values(self, *fields, **expressions):
+        return self._chain('values', *fields, **expressions)
+
+    def values_list(self, *fields, **kwargs):
+        return self._chain('values_list', *fields, **kwargs)
+
+    def distinct(self, *fields):
+        return self._chain('distinct', *fields)
+
+    def none(self):
+        return self._chain('none')
+
+    @property
+    def ordered(self):
+        return self._querysets[0].ordered
+
+    @property
+    def db(self):
+        return None
+
+    def count(self):
+        return sum(queryset.count() for queryset in self._querysets)
+
+    def exists(self):
+        return any(queryset.exists() for queryset in self._querysets)
+
+    def get(self, *args, **kwargs):
+        found = [obj for queryset in self._querysets for obj in queryset.filter(*args, **kwargs)[:2]]
+        if not found:
+            raise self.model.DoesNotExist(f'{self.model._meta.object_name} matching query does not exist.')
+        if len(found) > 1:
+            raise self.model.MultipleObjectsReturned(f'get() returned more than one {self.model._meta.object_name}')
+        return found[0]
+
+    def _ordering(self):
+        query = self._querysets[0].query
+        ordering = query.order_by or (query.get_meta().ordering if query.default_ordering else [])
+        return [field for field in ordering if isinstance(field, str) and field != '?']
+
+    def _sort_key(self):
+        ordering = self._ordering()
+        # values_list() rows are tuples in the order of the selected lookups
+        positions = {name: index for index, name in enumerate(self._querysets[0].query.values_select)}
+
+        def value(obj, path):
+            if isinstance(obj, tuple):
+                return obj[positions[path]]
+            return _attribute(obj, path)
+
+        def compare(a, b):
+            for field in ordering:
+                descending = field.startswith('-')
+                path = field.lstrip('-')
+                if path == 'pk':
+                    path = self.model._meta.pk.attname
+                left, right = value(a, path), value(b, path)
+                if left == right:
+                    continue
+                # NULLs sort last ascending, first descending (PostgreSQL semantics)
+                if left is None:
+                    result = 1
+                elif right is None:
+                    result = -1
+                else:
+                    result = -1 if left < right else 1
+                return -result if descending else result
+            return 0
+
+        return cmp_to_key(compare)
+
+    def _merged(self, stop=None):
+        parts = [list(queryset if stop is None else queryset[:stop]) for queryset in self._querysets]
+        if self._ordering():
+            return list(heapq.merge(*parts, key=self._sort_key()))
+        return [obj for part in parts for obj in part]
+
+    def __iter__(self):
+        return iter(self._merged())
+
+    def __len__(self):
+        return len(self._merged())
+
+    def __bool__(self):
+        return self.exists()
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return self._merged(k.stop)[k]
+        return self._merged(k + 1)[k]
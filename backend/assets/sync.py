@@ -0,0 +1,114 @@
+"""
+Delta sync: everything a client has not seen yet, in bounded batches.
+
+Each database hands out an increasing change sequence number with every
+write to the synced tables (``ChangeTrackedModel``); the number is taken
+inside the writing transaction, so when a reader sees it every lower
+number on that database is visible too. A cursor is the last number
+returned per database (``default:1234``, or one entry per shard), and a
+batch is the next ``limit`` changes in sequence order across all five
+tables, so no change is missed or returned twice.
+
+- Rows come back in the same shape as the list endpoints.
+- Soft-deleted rows are returned by id under ``deleted``.
+- Scoping follows the list endpoints: base commanders only receive rows
+  of their bases.
+
+Moving a base to another shard copies its rows without renumbering
+them, so clients should drop their cursor and resync afterwards.
+"""
+import heapq
+
+from django.conf import settings
+from django.db.models import Q
+
+from . import projections
+from .hierarchy import user_scope
+from .models import Assignment, Expenditure, Inventory, Purchase, Transfer
+from .sharding import owned_by, shard_for_base, sharding_enabled
+
+
+# Response key -> (model, list projection)
+SYNCED = {
+    'inventory': (Inventory, projections.INVENTORY),
+    'purchases': (Purchase, projections.PURCHASES),
+    'transfers': (Transfer, projections.TRANSFERS),
+    'assignments': (Assignment, projections.ASSIGNMENTS),
+    'expenditures': (Expenditure, projections.EXPENDITURES),
+}
+
+
+def parse_cursor(value):
+    """``alias:seq`` pairs separated by commas -> {alias: seq}; raises ValueError"""
+    cursor = {}
+    for part in filter(None, (value or '').split(',')):
+        alias, _, seq = part.partition(':')
+        if alias not in settings.DATABASES or not seq.isdigit():
+            raise ValueError(f'Invalid cursor {part!r}')
+        cursor[alias] = int(seq)
+    return cursor
+
+
+def format_cursor(cursor):
+    return ','.join(f'{alias}:{seq}' for alias, seq in sorted(cursor.items()))
+
+
+def _sources(model, base_ids):
+    """{database alias: queryset} holding the rows of ``model`` in scope (None: every base)"""
+    queryset = model.objects.all()
+    if base_ids is not None:
+        if model is Transfer:
+            queryset = queryset.filter(Q(from_base_id__in=base_ids) | Q(to_base_id__in=base_ids))
+        else:
+            queryset = queryset.filter(base_id__in=base_ids)
+    if not sharding_enabled():
+        return {'default': queryset.using('default')}
+    aliases = {shard_for_base(base_id) for base_id in base_ids or ()}
+    if len(aliases) == 1:
+        alias = aliases.pop()
+        return {alias: queryset.using(alias)}
+    return {alias: owned_by(queryset, alias) for alias in settings.SHARDS}
+
+
+def changes_since(user, cursor, limit):
+    """The next ``limit`` changes after ``cursor`` visible to ``user``"""
+    base_ids = user_scope(user)
+    candidates = {}
+    plans = {}
+    for name, (model, projection) in SYNCED.items():
+        plan = plans[name] = projection.compile(projection.serializer_class())
+        deleted = ['is_deleted'] if hasattr(model, 'is_deleted') else []
+        for alias, queryset in _sources(model, base_ids).items():
+            rows = queryset.filter(change_seq__gt=cursor.get(alias, 0)).order_by('change_seq')
+            rows = rows.values(*dict.fromkeys([*plan.lookups, 'id', 'change_seq', *deleted]))[:limit + 1]
+            candidates.setdefault(alias, []).extend((row['change_seq'], name, row) for row in rows)
+
+    # Each database's changes in sequence order; any prefix of each is a consistent batch
+    streams = [sorted(changes, key=lambda change: change[0]) for changes in candidates.values()]
+    aliases = list(candidates)
+    merged = heapq.merge(*(
+        [(seq, index, name, row) for seq, name, row in stream] for index, stream in enumerate(streams)
+    ), key=lambda change: change[:2])
+
+    next_cursor = dict(cursor)
+    changed = {name: [] for name in SYNCED}
+    deleted = {name: [] for name in SYNCED}
+    taken = 0
+    for seq, index, name, row in merged:
+        if taken == limit:
+            break
+        next_cursor[aliases[index]] = seq
+        if row.get('is_deleted'):
+            deleted[name].append(row['id'])
+        else:
+            changed[name].append(row)
+        taken += 1
+
+    return {
+        'cursor': format_cursor(next_cursor),
+        'has_more': taken < sum(len(stream) for stream in streams),
+        'changes': {
+            name: {'changed': plans[name].rows(changed[name]), 'deleted': deleted[name]}
+            for name in SYNCED
+        },
+    }
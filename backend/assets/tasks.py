@@ -0,0 +1,193 @@
+"""
+Background job handlers (see jobs.py).
+
+Each handler receives the running ``Job`` plus its params and returns a
+JSON-serializable result.
+"""
+import random
+from datetime import datetime, timedelta
+
+from .jobs import register
+from .inventory import adjust_inventory
+from .models import Assignment, Base, EquipmentType, Expenditure, Inventory, Purchase, Transfer
+from .provisioning import provision_users, read_csv
+from .reconciliation import reconcile
+from .sharding import save_transfer_copies
+from .tokens import REBUILD_JOB, rebuild_filter
+
+
+SUPPLIERS = [
+    'Defense Supplies Inc.',
+    'Military Equipment Corp.',
+    'Global Arms Ltd.',
+    'Strategic Resources Co.',
+    'National Defense Suppliers',
+    'Allied Equipment Group'
+]
+
+PERSONNEL_NAMES = [
+    'Sgt. John Smith', 'Cpl. Sarah Johnson', 'Lt. Michael Brown',
+    'Pvt. Emily Davis', 'Sgt. David Wilson', 'Cpl. Jessica Martinez',
+    'Lt. Robert Anderson', 'Pvt. Amanda Taylor', 'Sgt. Christopher Lee',
+    'Cpl. Jennifer White', 'Lt. Matthew Harris', 'Pvt. Ashley Clark',
+    'Sgt. Daniel Lewis', 'Cpl. Melissa Walker', 'Lt. James Hall'
+]
+
+EXPENDITURE_REASONS = [
+    'Training Exercise',
+    'Combat Operations',
+    'Equipment Testing',
+    'Maintenance and Repair',
+    'Emergency Response',
+    'Field Operations',
+    'Tactical Drills',
+    'Equipment Damage',
+    'Lost in Field',
+    'Routine Consumption'
+]
+
+
+def _transaction_totals():
+    return {
+        'purchases': Purchase.objects.filter(is_deleted=False).count(),
+        'transfers': Transfer.objects.filter(is_deleted=False).count(),
+        'assignments': Assignment.objects.filter(is_deleted=False).count(),
+        'expenditures': Expenditure.objects.filter(is_deleted=False).count(),
+        'inventory_items': Inventory.objects.count()
+    }
+
+
+def _create_purchases(count, user, bases, equipment_types, max_quantity=500, suppliers=SUPPLIERS):
+    for i in range(count):
+        base = random.choice(bases)
+        equipment_type = random.choice(equipment_types)
+        quantity = random.randint(10, max_quantity)
+
+        Purchase.objects.create(
+            base=base,
+            equipment_type=equipment_type,
+            quantity=quantity,
+            supplier=random.choice(suppliers),
+            purchase_date=datetime.now().date() - timedelta(days=random.randint(1, 90)),
+            created_by=user
+        )
+        adjust_inventory(base.id, equipment_type.id, quantity)
+
+
+def _create_transfers(count, user, bases, equipment_types, max_quantity=100,
+                      statuses=('pending', 'in_transit', 'completed')):
+    for i in range(count):
+        from_base = random.choice(bases)
+        to_base = random.choice([b for b in bases if b != from_base])
+
+        transfer = Transfer.objects.create(
+            from_base=from_base,
+            to_base=to_base,
+            equipment_type=random.choice(equipment_types),
+            quantity=random.randint(5, max_quantity),
+            status=random.choice(statuses),
+            transfer_date=datetime.now().date() - timedelta(days=random.randint(1, 60)),
+            created_by=user
+        )
+        save_transfer_copies(transfer)
+
+
+@register('seed_transactions', max_attempts=1)
+def seed_transactions(job):
+    """Seed demo purchases, transfers, assignments and expenditures"""
+    user = job.created_by
+    bases = list(Base.objects.filter(is_deleted=False))
+    equipment_types = list(EquipmentType.objects.filter(is_deleted=False))
+    if len(bases) < 2 or not equipment_types:
+        raise ValueError('Please ensure bases and equipment types exist first!')
+
+    # Create Purchases (30 records over the last 90 days)
+    job.report_progress(0, 'Creating purchases')
+    _create_purchases(30, user, bases, equipment_types)
+
+    # Create Transfers (20 records)
+    job.report_progress(35, 'Creating transfers')
+    _create_transfers(20, user, bases, equipment_types)
+
+    # Create Assignments (25 records)
+    job.report_progress(60, 'Creating assignments')
+    for i in range(25):
+        assignment_date = datetime.now().date() - timedelta(days=random.randint(1, 120))
+
+        assigned_qty = random.randint(1, 20)
+        returned_qty = random.randint(0, assigned_qty) if random.random() > 0.3 else 0
+
+        return_date = None
+        if returned_qty > 0:
+            return_date = assignment_date + timedelta(days=random.randint(7, 60))
+
+        Assignment.objects.create(
+            base=random.choice(bases),
+            equipment_type=random.choice(equipment_types),
+            personnel_name=random.choice(PERSONNEL_NAMES),
+            personnel_id=f'MIL-{random.randint(10000, 99999)}',
+            assigned_quantity=assigned_qty,
+            returned_quantity=returned_qty,
+            assignment_date=assignment_date,
+            return_date=return_date,
+            created_by=user
+        )
+
+    # Create Expenditures (15 records)
+    job.report_progress(85, 'Creating expenditures')
+    for i in range(15):
+        Expenditure.objects.create(
+            base=random.choice(bases),
+            equipment_type=random.choice(equipment_types),
+            quantity=random.randint(1, 50),
+            reason=random.choice(EXPENDITURE_REASONS),
+            expenditure_date=datetime.now().date() - timedelta(days=random.randint(1, 90)),
+            created_by=user
+        )
+
+    return {
+        'created': {'purchases': 30, 'transfers': 20, 'assignments': 25, 'expenditures': 15},
+        'totals': _transaction_totals()
+    }
+
+
+@register('seed_sample_transactions', max_attempts=1)
+def seed_sample_transactions(job):
+    """Seed the smaller purchase and transfer set used by the all-in-one setup"""
+    user = job.created_by
+    bases = list(Base.objects.filter(is_deleted=False))
+    equipment_types = list(EquipmentType.objects.filter(is_deleted=False))
+    if len(bases) < 2 or not equipment_types:
+        raise ValueError('Please ensure bases and equipment types exist first!')
+
+    job.report_progress(0, 'Creating purchases')
+    _create_purchases(15, user, bases, equipment_types, max_quantity=200, suppliers=SUPPLIERS[:4])
+
+    job.report_progress(60, 'Creating transfers')
+    _create_transfers(10, user, bases, equipment_types, max_quantity=50, statuses=('pending', 'completed'))
+
+    return {
+        'created': {'purchases': 15, 'transfers': 10, 'assignments': 0, 'expenditures': 0},
+        'totals': _transaction_totals()
+    }
+
+
+@register('reconcile_inventory')
+def reconcile_inventory(job, base_ids=None, repair=False):
+    """Diff inventory against the transaction history, optionally repairing it"""
+    job.report_progress(0, 'Reconciling inventory')
+    return reconcile(base_ids, repair=repair)
+
+
+@register(REBUILD_JOB)
+def rebuild_revocation_filter(job):
+    """Prune expired token revocations and persist a fresh Bloom filter"""
+    return rebuild_filter()
+
+
+@register('provision_users', private_params=True)
+def provision_users_csv(job, csv_text):
+    """Create users from an uploaded CSV (see provisioning.py); the CSV may hold passwords"""
+    rows = read_csv(csv_text)
+    job.report_progress(0, f'Provisioning {len(rows)} users')
+    return provision_users(rows)
@@ -0,0 +1,593 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import events, jobs, lots, projections, rebalancing, reference, tokens
+from .batching import BatchWriter
+from .inventory import adjust_inventory
+from .models import (
+    APILog, Assignment, Base, EquipmentType, Expenditure, Inventory, Job, Purchase, RevokedToken, StockAlert,
+    StockLot, StockThreshold, Transfer, UserRole,
+)
+from .reconciliation import reconcile, repair_drift
+from .renderers import ORJSONRenderer
+from .tokens import RefreshToken
+
+
+PROJECTIONS = {
+    'inventory': projections.INVENTORY,
+    'purchases': projections.PURCHASES,
+    'transfers': projections.TRANSFERS,
+    'assignments': projections.ASSIGNMENTS,
+    'expenditures': projections.EXPENDITURES,
+}
+
+
+def decode(page):
+    """Rebuild row dicts from a columnar page"""
+    data, dictionaries = page['data'], page['dictionaries']
+    columns = [
+        [None if code is None else dictionaries[name][code] for code in data[name]] if name in dictionaries else data[name]
+        for name in page['columns']
+    ]
+    return [dict(zip(page['columns'], values)) for values in zip(*columns)]
+
+
+class ProjectionParityTests(TestCase):
+    """values() projections must render exactly what the serializers render"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x' * 12)
+        UserRole.objects.create(user=cls.admin, role='admin')
+        north = Base.objects.create(name='North', location='Hill', code='N')
+        south = Base.objects.create(name='South', location='Coast', code='S')
+        rifles = EquipmentType.objects.create(name='Rifle', unit='units')
+        fuel = EquipmentType.objects.create(name='Fuel', unit='liters', minimum_stock=Decimal('10.50'))
+        now = timezone.now()
+
+        for base, equipment_type, quantity in [
+            (north, rifles, Decimal('12')), (north, fuel, Decimal('130.25')), (south, fuel, Decimal('0')),
+        ]:
+            Inventory.objects.create(base=base, equipment_type=equipment_type, quantity=quantity)
+        # created_by is NULL on every other row
+        for index in range(4):
+            created_by = cls.admin if index % 2 else None
+            day = now - timedelta(days=index, microseconds=index * 1234)
+            Purchase.objects.create(
+                base=north, equipment_type=fuel, quantity=Decimal('40.10') + index, supplier='Depot',
+                purchase_date=day, created_by=created_by
+            )
+            Transfer.objects.create(
+                from_base=north, to_base=south, equipment_type=fuel, quantity=Decimal('5.05'),
+                status='completed' if index % 2 else 'pending', transfer_date=day, created_by=created_by
+            )
+            Assignment.objects.create(
+                base=north, equipment_type=rifles, personnel_name=f'Sgt. {index}', assigned_quantity=3,
+                returned_quantity=Decimal(index) / 2, assignment_date=day, created_by=created_by
+            )
+            Expenditure.objects.create(
+                base=south, equipment_type=fuel, quantity=Decimal('0.01'), reason='Training',
+                expenditure_date=day, created_by=created_by
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def assert_rows_match(self, projection, fields=None):
+        kwargs = {} if fields is None else {'fields': fields}
+        serializer = projection.serializer_class(**kwargs)
+        plan = projection.compile(serializer)
+        self.assertIsNotNone(plan, f'no projection for fields={fields}')
+        queryset = projection.model.objects.order_by('pk')
+        renderer = ORJSONRenderer()
+        expected = renderer.render(projection.serializer_class(serializer.optimize(queryset), many=True, **kwargs).data)
+        self.assertEqual(renderer.render(plan.rows(plan.values(queryset))), expected)
+
+    def test_all_fields(self):
+        for name, projection in PROJECTIONS.items():
+            with self.subTest(name):
+                self.assert_rows_match(projection)
+
+    def test_field_subsets(self):
+        for name, projection in PROJECTIONS.items():
+            readable = [name for name, field in projection.serializer_class().fields.items() if not field.write_only]
+            for fields in [readable[:1], readable[::2], readable[1::3], readable[::-1]]:
+                with self.subTest(name, fields=fields):
+                    self.assert_rows_match(projection, fields)
+
+    def test_null_created_by(self):
+        for name in ['purchases', 'transfers', 'assignments', 'expenditures']:
+            projection = PROJECTIONS[name]
+            self.assertTrue(projection.model.objects.filter(created_by__isnull=True).exists())
+            for fields in [['id', 'created_by', 'created_by_name'], ['created_by_name']]:
+                with self.subTest(name, fields=fields):
+                    self.assert_rows_match(projection, fields)
+
+    def queries(self, projection):
+        """Query strings covering all fields, a subset and the NULL-able created_by_name"""
+        readable = [name for name, field in projection.serializer_class().fields.items() if not field.write_only]
+        subsets = [readable[::2], [name for name in readable if name in ('id', 'created_by_name')]]
+        return [''] + [f'fields={",".join(fields)}' for fields in subsets]
+
+    def test_list_endpoints_match_serializer(self):
+        for name, projection in PROJECTIONS.items():
+            for query in self.queries(projection):
+                url = f'/api/v1/{name}/?{query}'
+                with self.subTest(url):
+                    with override_settings(FAST_LIST_SERIALIZATION=False):
+                        expected = self.client.get(url)
+                    response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.content, expected.content)
+
+    def test_columnar_matches_rows(self):
+        for name, projection in PROJECTIONS.items():
+            for query in self.queries(projection):
+                with self.subTest(name, query=query):
+                    rows = self.client.get(f'/api/v1/{name}/?{query}').json()['results']
+                    page = self.client.get(f'/api/v1/{name}/?format=columnar&{query}').json()['results']
+                    # Keys the row output omits (NULL relations) are null in columnar output
+                    expected = [{column: row.get(column) for column in page['columns']} for row in rows]
+                    self.assertEqual(decode(page), expected)
+
+
+class ReconciliationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.base = Base.objects.create(name='North', location='Hill', code='N')
+        cls.fuel = EquipmentType.objects.create(name='Fuel', unit='liters')
+        cls.rifles = EquipmentType.objects.create(name='Rifle', unit='units')
+        Purchase.objects.create(base=cls.base, equipment_type=cls.fuel, quantity=Decimal('10'), purchase_date=timezone.now())
+        Purchase.objects.create(base=cls.base, equipment_type=cls.rifles, quantity=Decimal('4'), purchase_date=timezone.now())
+        Inventory.objects.create(base=cls.base, equipment_type=cls.fuel, quantity=Decimal('7'))
+
+    def quantity(self, equipment_type):
+        return Inventory.objects.get(base=self.base, equipment_type=equipment_type).quantity
+
+    def test_report_and_repair(self):
+        report = reconcile(repair=True)
+        self.assertEqual(report['drift_count'], 2)
+        self.assertEqual(report['repaired'], {'updated': 1, 'created': 1})
+        self.assertEqual(self.quantity(self.fuel), Decimal('10'))
+        self.assertEqual(self.quantity(self.rifles), Decimal('4'))
+        self.assertEqual(reconcile()['drift_count'], 0)
+
+    def test_repair_after_concurrent_adjust(self):
+        drift = reconcile()['drift']
+        # A purchase commits between the diff and the repair
+        Purchase.objects.create(base=self.base, equipment_type=self.fuel, quantity=Decimal('5'), purchase_date=timezone.now())
+        adjust_inventory(self.base.pk, self.fuel.pk, Decimal('5'))
+        repair_drift(drift)
+        self.assertEqual(self.quantity(self.fuel), Decimal('15'))
+        self.assertEqual(reconcile()['drift_count'], 0)
+
+
+def failing_job(job):
+    raise RuntimeError('boom')
+
+
+def slow_job(job, seconds):
+    time.sleep(seconds)
+    return Job.objects.get(pk=job.pk).heartbeat_at.isoformat()
+
+
+@mock.patch.dict(jobs.REGISTRY, {'failing': (failing_job, None, False), 'slow': (slow_job, None, False)})
+class JobTests(TestCase):
+
+    def test_stale_job_is_reclaimed(self):
+        job = jobs.enqueue('slow', {'seconds': 0})
+        first = jobs.claim('a')
+        self.assertEqual(first.pk, job.pk)
+        self.assertIsNone(jobs.claim('b'), 'a fresh heartbeat keeps the job with its worker')
+
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=301))
+        second = jobs.claim('b')
+        self.assertEqual((second.pk, second.locked_by, second.attempts), (job.pk, 'b', 2))
+        # The first worker finishing late does not overwrite the new owner's state
+        jobs._finish(first, status='succeeded', result='stale')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.result), ('running', 'b', None))
+
+    def test_claim_loses_to_a_heartbeat(self):
+        job = jobs.enqueue('slow', {'seconds': 0})
+        jobs.claim('a')
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=301))
+        candidate = Job.objects.get(pk=job.pk)
+        # The owner's heartbeat lands between reading the row and taking it
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now())
+        self.assertFalse(jobs._mark_running(candidate, 'b', timezone.now()))
+
+    def test_failure_is_retried_then_failed(self):
+        job = jobs.enqueue('failing')
+        for attempt in range(1, job.max_attempts + 1):
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            with self.assertLogs('assets.jobs', 'ERROR'):
+                jobs.run(jobs.claim('a'))
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            self.assertIn('RuntimeError: boom', job.error)
+            if attempt < job.max_attempts:
+                self.assertEqual(job.status, 'queued')
+                self.assertGreater(job.run_at, timezone.now())
+                self.assertIsNone(jobs.claim('a'), 'retries wait for their backoff')
+        self.assertEqual(job.status, 'failed')
+
+    def test_abandoned_last_attempt_fails(self):
+        job = jobs.enqueue('slow', {'seconds': 0})
+        Job.objects.filter(pk=job.pk).update(
+            status='running', attempts=job.max_attempts, heartbeat_at=timezone.now() - timedelta(seconds=301)
+        )
+        self.assertIsNone(jobs.claim('a'))
+        self.assertEqual(jobs.fail_abandoned(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+
+@mock.patch.dict(jobs.REGISTRY, {'slow': (slow_job, None, False)})
+class JobHeartbeatTests(TransactionTestCase):
+
+    @override_settings(JOB_HEARTBEAT_SECONDS=0.05)
+    def test_heartbeat_while_running(self):
+        job = jobs.enqueue('slow', {'seconds': 0.5})
+        claimed = jobs.claim('a')
+        jobs.run(claimed)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+        self.assertGreater(job.result, claimed.heartbeat_at.isoformat())
+
+
+@override_settings(EVENTS_RELAY='local', EVENTS_HEARTBEAT_SECONDS=0.05)
+class EventStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.north = Base.objects.create(name='North', location='Hill', code='N')
+        cls.south = Base.objects.create(name='South', location='Coast', code='S')
+        cls.user = User.objects.create_user('commander', password='x' * 12)
+        UserRole.objects.create(user=cls.user, role='base_commander', assigned_base=cls.north)
+
+    def open(self, token, on_keep_alive=None, timeout=5):
+        """Run the stream until it ends (or ``timeout``); returns the body chunks and whether it ended"""
+        scope = {'type': 'http', 'method': 'GET', 'headers': [(b'authorization', f'Bearer {token}'.encode())]}
+        chunks = []
+
+        async def run():
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] != 'http.response.body':
+                    return
+                chunks.append(message)
+                if message['body'] == b': keep-alive\n\n' and on_keep_alive is not None:
+                    if await on_keep_alive():
+                        disconnect.set()
+
+            try:
+                await asyncio.wait_for(events.stream(scope, receive, send), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                await events.hub.stop()
+
+        async_to_sync(run)()
+        return [chunk['body'] for chunk in chunks], bool(chunks) and not chunks[-1].get('more_body', False)
+
+    def test_stream_ends_when_the_token_expires(self):
+        token = RefreshToken.for_user(self.user).access_token
+        token.set_exp(lifetime=timedelta(seconds=1))
+        started = time.monotonic()
+        bodies, ended = self.open(str(token))
+        self.assertTrue(ended)
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertEqual(bodies[-1], b'event: resync\ndata: {}\n\n')
+
+    def test_stream_ends_for_a_deactivated_user(self):
+        async def deactivate():
+            await sync_to_async(User.objects.filter(pk=self.user.pk).update)(is_active=False)
+
+        bodies, ended = self.open(str(RefreshToken.for_user(self.user).access_token), deactivate)
+        self.assertTrue(ended)
+        self.assertEqual(bodies[-1], b'')
+
+    def test_scope_change_takes_effect(self):
+        state = {'step': 0}
+
+        async def reassign():
+            state['step'] += 1
+            if state['step'] == 1:
+                await sync_to_async(UserRole.objects.filter(user=self.user).update)(assigned_base=self.south)
+            elif state['step'] == 3:
+                for base in (self.north, self.south):
+                    events.hub.dispatch({'type': 'inventory', 'base_ids': [base.pk], 'base_id': base.pk})
+            return state['step'] == 4
+
+        bodies, ended = self.open(str(RefreshToken.for_user(self.user).access_token), reassign)
+        self.assertFalse(ended)
+        frames = [body for body in bodies if body.startswith(b'event:')]
+        self.assertEqual(frames, [
+            b'event: resync\ndata: {}\n\n',
+            f'event: inventory\ndata: {{"base_id":{self.south.pk}}}\n\n'.encode(),
+        ])
+
+
+class AuditLogTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x' * 12)
+        UserRole.objects.create(user=cls.admin, role='admin')
+        cls.login = APILog.objects.create(
+            endpoint='/api/v1/auth/login/', method='POST', status_code=200,
+            request_body='{"username": "admin", "password": "hunter2"}', response_body='{"access": "a.b.c"}'
+        )
+        cls.purchase = APILog.objects.create(
+            endpoint='/api/v1/purchases/', method='POST', status_code=201,
+            request_body='{"quantity": "5.00", "nested": [{"new_password": "p", "token": "t"}]}',
+            # Cut at API_LOG_BODY_MAX_BYTES
+            response_body='{"id": 7, "refresh": "r.s.t", "access": "a.b',
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_list_leaves_out_bodies(self):
+        results = self.client.get('/api/v1/audit-logs/').json()['results']
+        self.assertEqual({log['id'] for log in results}, {self.login.pk, self.purchase.pk})
+        for log in results:
+            self.assertNotIn('request_body', log)
+            self.assertNotIn('response_body', log)
+        self.assertEqual(self.client.get('/api/v1/audit-logs/?fields=request_body').status_code, 400)
+
+    def test_detail_redacts_bodies(self):
+        login = self.client.get(f'/api/v1/audit-logs/{self.login.pk}/').json()
+        self.assertEqual((login['request_body'], login['response_body']), ('[redacted]', '[redacted]'))
+
+        purchase = self.client.get(f'/api/v1/audit-logs/{self.purchase.pk}/').json()
+        self.assertEqual(json.loads(purchase['request_body']), {
+            'quantity': '5.00', 'nested': [{'new_password': '[redacted]', 'token': '[redacted]'}]
+        })
+        self.assertEqual(purchase['response_body'], '{"id": 7, "refresh": "[redacted]", "access": "[redacted]"')
+
+
+# Buffers are flushed by the tests, not by a background thread
+@mock.patch.object(BatchWriter, '_ensure_thread')
+class TokenRevocationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('officer', password='x' * 12)
+        UserRole.objects.create(user=cls.user, role='logistics_officer')
+
+    def setUp(self):
+        tokens.revocations.flush()
+        tokens._state.update(filter=None, loaded_at=None, synced_at=None, synced_through=None)
+        self.client = APIClient()
+
+    def refresh(self, token):
+        return self.client.post('/api/v1/auth/refresh/', {'refresh': str(token)}, format='json')
+
+    def test_rotation_revokes_the_old_token(self, ensure_thread):
+        token = RefreshToken.for_user(self.user)
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json()['refresh'], str(token))
+        self.assertEqual(self.refresh(token).status_code, 401)
+        # Still revoked once written and confirmed against the table
+        tokens.revocations.flush()
+        self.assertTrue(RevokedToken.objects.filter(jti=token['jti']).exists())
+        self.assertEqual(self.refresh(token).status_code, 401)
+        self.assertEqual(self.refresh(response.json()['refresh']).status_code, 200)
+
+    def test_revocation_by_another_process(self, ensure_thread):
+        token = RefreshToken.for_user(self.user)
+        tokens.revocation_filter()
+        RevokedToken.objects.create(jti=token['jti'], expires_at=timezone.now() + timedelta(days=1))
+        # Due for its next sync
+        tokens._state['synced_at'] -= settings.REVOCATION_SYNC_SECONDS + 1
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_logout_survives_a_filter_rebuild(self, ensure_thread):
+        revoked, kept = RefreshToken.for_user(self.user), RefreshToken.for_user(self.user)
+        self.assertEqual(self.client.post('/api/v1/auth/logout/', {'refresh': str(revoked)}, format='json').status_code, 200)
+        RevokedToken.objects.create(jti='expired', expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(tokens.rebuild_filter()['pruned'], 1)
+        tokens._state.update(filter=None)
+        self.assertEqual(self.refresh(revoked).status_code, 401)
+        self.assertEqual(self.refresh(kept).status_code, 200)
+
+
+class SyncCursorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x' * 12)
+        UserRole.objects.create(user=cls.admin, role='admin')
+        base = Base.objects.create(name='North', location='Hill', code='N')
+        fuel = EquipmentType.objects.create(name='Fuel', unit='liters')
+        cls.purchases = [
+            Purchase.objects.create(base=base, equipment_type=fuel, quantity=Decimal(index + 1), purchase_date=timezone.now())
+            for index in range(4)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def page(self, since=''):
+        response = self.client.get('/api/v1/sync/', {'since': since, 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        purchases = body['changes']['purchases']
+        return body, [row['id'] for row in purchases['changed']], purchases['deleted']
+
+    def test_resume_across_deletes(self):
+        first, second, third, fourth = self.purchases
+        body, changed, deleted = self.page()
+        self.assertEqual((changed, deleted, body['has_more']), ([first.pk, second.pk], [], True))
+
+        # One row already synced and one not yet synced are deleted between pages
+        for purchase in (first, third):
+            purchase.is_deleted = True
+            purchase.save()
+
+        body, changed, deleted = self.page(body['cursor'])
+        self.assertEqual((changed, deleted, body['has_more']), ([fourth.pk], [first.pk], True))
+        body, changed, deleted = self.page(body['cursor'])
+        self.assertEqual((changed, deleted, body['has_more']), ([], [third.pk], False))
+        body, changed, deleted = self.page(body['cursor'])
+        self.assertEqual((changed, deleted, body['has_more']), ([], [], False))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/v1/sync/', {'since': 'nowhere:1'}).status_code, 400)
+
+
+class StockAlertTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.base = Base.objects.create(name='North', location='Hill', code='N')
+        cls.fuel = EquipmentType.objects.create(name='Fuel', unit='liters', minimum_stock=Decimal('10'))
+        cls.rifles = EquipmentType.objects.create(name='Rifle', unit='units')
+        StockThreshold.objects.create(
+            base=cls.base, equipment_type=cls.rifles, minimum=Decimal('10'), resolve_at=Decimal('15')
+        )
+        for equipment_type in (cls.fuel, cls.rifles):
+            Inventory.objects.create(base=cls.base, equipment_type=equipment_type, quantity=Decimal('20'))
+
+    def setUp(self):
+        # Thresholds are cached per process, across test transactions
+        reference.clear()
+
+    def alerts(self, equipment_type):
+        return list(StockAlert.objects.filter(base=self.base, equipment_type=equipment_type).order_by('pk'))
+
+    def test_open_and_resolve_at_the_threshold(self):
+        adjust_inventory(self.base.pk, self.rifles.pk, Decimal('-10'))
+        self.assertEqual(self.alerts(self.rifles), [], 'stock at the minimum is not low')
+
+        adjust_inventory(self.base.pk, self.rifles.pk, Decimal('-0.01'))
+        adjust_inventory(self.base.pk, self.rifles.pk, Decimal('-4'))
+        [alert] = self.alerts(self.rifles)
+        self.assertEqual((alert.minimum, alert.quantity, alert.lowest_quantity), (Decimal('10'), Decimal('9.99'), Decimal('5.99')))
+
+        # Back above the minimum but short of resolve_at: still open
+        adjust_inventory(self.base.pk, self.rifles.pk, Decimal('9'))
+        alert.refresh_from_db()
+        self.assertIsNone(alert.resolved_at)
+
+        adjust_inventory(self.base.pk, self.rifles.pk, Decimal('0.01'))
+        alert.refresh_from_db()
+        self.assertIsNotNone(alert.resolved_at)
+        self.assertEqual(alert.resolved_quantity, Decimal('15'))
+
+        # A new dip opens a new alert
+        adjust_inventory(self.base.pk, self.rifles.pk, Decimal('-6'))
+        self.assertEqual([alert.resolved_at is None for alert in self.alerts(self.rifles)], [False, True])
+
+    @override_settings(STOCK_ALERT_HYSTERESIS=0.1)
+    def test_minimum_stock_fallback(self):
+        adjust_inventory(self.base.pk, self.fuel.pk, Decimal('-10.01'))
+        [alert] = self.alerts(self.fuel)
+        adjust_inventory(self.base.pk, self.fuel.pk, Decimal('1.00'))
+        alert.refresh_from_db()
+        self.assertIsNone(alert.resolved_at)
+        # minimum_stock * (1 + STOCK_ALERT_HYSTERESIS)
+        adjust_inventory(self.base.pk, self.fuel.pk, Decimal('0.01'))
+        alert.refresh_from_db()
+        self.assertEqual(alert.resolved_quantity, Decimal('11'))
+
+
+class SolverTests(SimpleTestCase):
+
+    def solve(self, supply, demand, cost):
+        flow = rebalancing.solve(np.array(supply), np.array(demand), np.array(cost))
+        self.assertTrue((flow >= 0).all())
+        self.assertTrue((flow.sum(axis=1) <= supply).all())
+        self.assertTrue((flow.sum(axis=0) <= demand).all())
+        self.assertFalse(flow[np.array(cost) == rebalancing.INF].any(), 'flow on a missing route')
+        return flow, int((flow * np.array(cost)).sum())
+
+    def test_beats_cheapest_first(self):
+        # Both suppliers are cheapest to receiver 0; sending supplier 0 there costs 505
+        flow, cost = self.solve([5, 5], [5, 5], [[1, 2], [1, 100]])
+        self.assertEqual(flow.tolist(), [[0, 5], [5, 0]])
+        self.assertEqual(cost, 15)
+
+    def test_missing_routes(self):
+        INF = rebalancing.INF
+        flow, cost = self.solve([4, 6], [3, 3, 5], [[4, 6, INF], [5, INF, 2]])
+        self.assertEqual(flow.sum(), 10)
+        self.assertEqual(cost, 35)
+
+    def test_unreachable_demand(self):
+        INF = rebalancing.INF
+        flow, cost = self.solve([3, 4], [2, 9], [[1, INF], [INF, INF]])
+        self.assertEqual(flow.tolist(), [[2, 0], [0, 0]])
+        self.assertEqual(cost, 2)
+
+
+class LotDrawTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.base = Base.objects.create(name='North', location='Hill', code='N')
+        cls.fuel = EquipmentType.objects.create(name='Fuel', unit='liters', lot_policy='fefo')
+        now = timezone.now()
+        # (received, expires): oldest, soonest to expire, never expires
+        cls.lots = {}
+        for name, received, expires in [('A', 3, 30), ('B', 2, 5), ('C', 1, None)]:
+            purchase = Purchase.objects.create(
+                base=cls.base, equipment_type=cls.fuel, quantity=Decimal('10'), purchase_date=now - timedelta(days=received)
+            )
+            expires_at = None if expires is None else (now + timedelta(days=expires)).date()
+            cls.lots[name] = lots.receive(purchase, name, expires_at).pk
+
+    def draw(self, transaction_id, quantity, policy):
+        allocations = lots.allocate('expenditure', transaction_id, self.base.pk, self.fuel.pk, Decimal(quantity), policy)
+        names = {pk: name for name, pk in self.lots.items()}
+        return [(names[allocation.lot_id], allocation.quantity) for allocation in allocations]
+
+    def remaining(self):
+        by_id = dict(StockLot.objects.values_list('id', 'remaining'))
+        return {name: by_id[pk] for name, pk in self.lots.items()}
+
+    def test_fifo(self):
+        self.assertEqual(self.draw(1, '4', 'fifo'), [('A', Decimal('4'))])
+        self.assertEqual(sorted(self.draw(2, '8', 'fifo')), [('A', Decimal('6')), ('B', Decimal('2'))])
+        self.assertEqual(sorted(self.draw(3, '9.5', 'fifo')), [('B', Decimal('8')), ('C', Decimal('1.5'))])
+        self.assertEqual(self.remaining(), {'A': Decimal('0'), 'B': Decimal('0'), 'C': Decimal('8.5')})
+
+    def test_fefo(self):
+        self.assertEqual(self.draw(1, '4', 'fefo'), [('B', Decimal('4'))])
+        self.assertEqual(sorted(self.draw(2, '12', 'fefo')), [('A', Decimal('6')), ('B', Decimal('6'))])
+        self.assertEqual(self.remaining(), {'A': Decimal('4'), 'B': Decimal('0'), 'C': Decimal('10')})
+        # Recalled lots are skipped; lots without an expiry come last
+        StockLot.objects.filter(pk=self.lots['A']).update(recalled=True)
+        self.assertEqual(self.draw(3, '5', 'fefo'), [('C', Decimal('5'))])
+
+    def test_short_and_restored(self):
+        self.draw(1, '25', 'fifo')
+        # Only what the lots hold is allocated
+        self.assertEqual(sorted(self.draw(2, '10', 'fifo')), [('C', Decimal('5'))])
+        lots.restore('expenditure', 1, self.base.pk, self.fuel.pk, Decimal('12'))
+        # Back into the drawn lots, soonest expiry first
+        self.assertEqual(self.remaining(), {'A': Decimal('2'), 'B': Decimal('10'), 'C': Decimal('0')})
@@ -0,0 +1,172 @@
+"""
+Refresh-token rotation and revocation without a per-request DB lookup.
+
+Revoked refresh-token ids (JTIs) are stored in ``RevokedToken`` until the
+token would have expired anyway. Each process keeps a Bloom filter of
+them. It is loaded from the persisted ``RevocationFilter`` snapshot and
+topped up every REVOCATION_SYNC_SECONDS with rows recorded since then.
+
+- A refresh whose JTI misses the filter (the common case) is accepted
+  without touching the database.
+- A hit is confirmed against the table, because of false positives.
+- Rotation revokes the old token in the local filter at once and writes
+  the row through a BatchWriter. Other processes see it within
+  REVOCATION_FLUSH_SECONDS + REVOCATION_SYNC_SECONDS.
+
+The ``rebuild_revocation_filter`` job prunes expired rows and persists a
+fresh snapshot. Workers queue it once the snapshot is older than
+REVOCATION_REBUILD_SECONDS.
+
+Last-login timestamps are buffered the same way, so a login costs no
+write.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .batching import BatchWriter
+from .bloom import BloomFilter
+from .models import Job, RevocationFilter, RevokedToken
+
+
+REBUILD_JOB = 'rebuild_revocation_filter'
+
+_lock = threading.Lock()
+_state = {'filter': None, 'loaded_at': None, 'synced_at': None, 'synced_through': None}
+
+
+def _write_revocations(rows):
+    RevokedToken.objects.bulk_create(rows, ignore_conflicts=True, batch_size=500)
+
+
+def _write_last_logins(users):
+    User.objects.bulk_update(users, ['last_login'], batch_size=500)
+
+
+revocations = BatchWriter('revocations', _write_revocations, interval=settings.REVOCATION_FLUSH_SECONDS)
+last_logins = BatchWriter('last_login', _write_last_logins, interval=settings.LAST_LOGIN_FLUSH_SECONDS)
+
+
+def _sync(now):
+    """Add rows recorded since the last sync (with overlap for slow commits)"""
+    since = _state['synced_through'] - timedelta(seconds=settings.REVOCATION_SYNC_OVERLAP)
+    synced_through = timezone.now()
+    revocation_filter = _state['filter']
+    for jti in RevokedToken.objects.filter(recorded_at__gte=since).values_list('jti', flat=True).iterator():
+        revocation_filter.add(jti)
+    _state['synced_at'] = now
+    _state['synced_through'] = synced_through
+
+
+def _load(now):
+    snapshot = RevocationFilter.objects.order_by('-built_at').first()
+    if snapshot is None:
+        revocation_filter = BloomFilter(settings.REVOCATION_FILTER_CAPACITY, settings.REVOCATION_FILTER_ERROR_RATE)
+        synced_through = timezone.now() - settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME']
+    else:
+        revocation_filter = BloomFilter(snapshot.capacity, bits=bytes(snapshot.bits), hash_count=snapshot.hash_count)
+        revocation_filter.count = snapshot.item_count
+        synced_through = snapshot.built_at
+
+    # Revocations made here but not written yet are not in the table
+    for row in revocations.pending_items():
+        revocation_filter.add(row.jti)
+
+    _state.update(filter=revocation_filter, loaded_at=now, synced_through=synced_through)
+    _sync(now)
+
+    rebuild_after = timedelta(seconds=settings.REVOCATION_REBUILD_SECONDS)
+    if snapshot is None or timezone.now() - snapshot.built_at > rebuild_after or revocation_filter.saturated:
+        schedule_rebuild()
+
+
+def revocation_filter():
+    """This process's filter, reloaded or synced when due"""
+    now = time.monotonic()
+    with _lock:
+        current = _state['filter']
+        if current is None or now - _state['loaded_at'] > settings.REVOCATION_FILTER_RELOAD_SECONDS:
+            _load(now)
+        elif now - _state['synced_at'] > settings.REVOCATION_SYNC_SECONDS:
+            _sync(now)
+        return _state['filter']
+
+
+def is_revoked(jti):
+    if jti not in revocation_filter():
+        return False
+    # Bloom filters give false positives: confirm the hit
+    return revocations.pending(jti) is not None or RevokedToken.objects.filter(jti=jti).exists()
+
+
+def revoke(jti, expires_at):
+    revocations.add(jti, RevokedToken(jti=jti, expires_at=expires_at, revoked_at=timezone.now()))
+    with _lock:
+        if _state['filter'] is not None:
+            _state['filter'].add(jti)
+
+
+def schedule_rebuild():
+    """Queue a filter rebuild unless one is already pending"""
+    from .jobs import enqueue
+
+    if not Job.objects.filter(kind=REBUILD_JOB, status__in=['queued', 'running']).exists():
+        enqueue(REBUILD_JOB)
+
+
+def rebuild_filter():
+    """Prune expired revocations and persist a fresh filter snapshot"""
+    revocations.flush()
+    pruned, _ = RevokedToken.objects.filter(expires_at__lt=timezone.now()).delete()
+
+    built_at = timezone.now()
+    rows = RevokedToken.objects.filter(recorded_at__lt=built_at)
+    capacity = max(settings.REVOCATION_FILTER_CAPACITY, rows.count() * 2)
+    bloom = BloomFilter(capacity, settings.REVOCATION_FILTER_ERROR_RATE)
+    for jti in rows.values_list('jti', flat=True).iterator(chunk_size=5000):
+        bloom.add(jti)
+
+    with transaction.atomic():
+        RevocationFilter.objects.all().delete()
+        RevocationFilter.objects.create(
+            bits=bytes(bloom.bits),
+            hash_count=bloom.hash_count,
+            capacity=capacity,
+            item_count=bloom.count,
+            built_at=built_at
+        )
+    return {'pruned': pruned, 'tokens': bloom.count, 'capacity': capacity, 'bytes': len(bloom.bits)}
+
+
+def record_login(user):
+    """Set ``user.last_login`` now and write it with the next batch"""
+    user.last_login = timezone.now()
+    last_logins.add(user.pk, User(pk=user.pk, last_login=user.last_login))
+
+
+class RefreshToken(BaseRefreshToken):
+    """Refresh token checked against the revocation filter"""
+
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        if is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is revoked'))
+
+    def blacklist(self):
+        """Revoke this token (simplejwt calls this on rotation when BLACKLIST_AFTER_ROTATION is set)"""
+        revoke(self.payload[api_settings.JTI_CLAIM], datetime_from_epoch(self.payload['exp']))
+
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    token_class = RefreshToken
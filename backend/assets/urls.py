@@ -3,11 +3,13 @@ from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 
 from .views import (
-    register, login, current_user, dashboard_stats, role_choices,
+    register, login, logout, bulk_provision_users, current_user, dashboard_stats, dashboard_series, sync_changes, consumption_forecast, rebalance_stock, role_choices,
     initialize_role_codes, get_role_codes, populate_demo_bases,
     populate_equipment_types, seed_transaction_data, setup_all_demo_data,
     BaseViewSet, EquipmentTypeViewSet, InventoryViewSet,
-    PurchaseViewSet, TransferViewSet, AssignmentViewSet, ExpenditureViewSet
+    PurchaseViewSet, TransferViewSet, AssignmentViewSet, ExpenditureViewSet, JobViewSet,
+    StockThresholdViewSet, StockAlertViewSet, TransferCostViewSet, AuditLogViewSet, OrgNodeViewSet, SerializedAssetViewSet,
+    StockLotViewSet
 )
 
 router = DefaultRouter()
@@ -18,12 +20,22 @@ router.register(r'purchases', PurchaseViewSet, basename='purchase')
 router.register(r'transfers', TransferViewSet, basename='transfer')
 router.register(r'assignments', AssignmentViewSet, basename='assignment')
 router.register(r'expenditures', ExpenditureViewSet, basename='expenditure')
+router.register(r'jobs', JobViewSet, basename='job')
+router.register(r'stock-thresholds', StockThresholdViewSet, basename='stockthreshold')
+router.register(r'alerts', StockAlertViewSet, basename='stockalert')
+router.register(r'transfer-costs', TransferCostViewSet, basename='transfercost')
+router.register(r'org-nodes', OrgNodeViewSet, basename='orgnode')
+router.register(r'serialized-assets', SerializedAssetViewSet, basename='serializedasset')
+router.register(r'lots', StockLotViewSet, basename='stocklot')
+router.register(r'audit-logs', AuditLogViewSet, basename='auditlog')
 
 urlpatterns = [
     # Authentication endpoints
     path('auth/register/', register, name='register'),
     path('auth/login/', login, name='login'),
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('auth/logout/', logout, name='logout'),
+    path('auth/users/bulk/', bulk_provision_users, name='bulk_provision_users'),
     path('auth/user/', current_user, name='current_user'),
     path('auth/roles/', role_choices, name='role_choices'),
     
@@ -39,6 +51,12 @@ urlpatterns = [
     
     # Dashboard
     path('dashboard/stats/', dashboard_stats, name='dashboard_stats'),
+    path('dashboard/series/', dashboard_series, name='dashboard_series'),
+    path('forecast/', consumption_forecast, name='consumption_forecast'),
+    path('rebalance/', rebalance_stock, name='rebalance_stock'),
+    
+    # Delta sync
+    path('sync/', sync_changes, name='sync_changes'),
     
     # Router URLs
     path('', include(router.urls)),
@@ -1,23 +1,54 @@
 from rest_framework import viewsets, status, filters, permissions
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
+from django.conf import settings
 from django.contrib.auth import authenticate
-from django.db.models import Q, Sum, F
+from django.db import IntegrityError, transaction
+from django.db.models import CharField, Count, F, Func, Q, Sum, Value, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
-from datetime import datetime
+from datetime import timedelta
+import csv
 
 from .models import (
     Base, EquipmentType, Inventory, Purchase, Transfer,
-    Assignment, Expenditure, UserRole, RoleCode
+    Assignment, Expenditure, UserRole, RoleCode, Job, StockAlert, StockThreshold, TransferCost, APILog, OrgNode, SerializedAsset,
+    StockLot, LotAllocation
 )
 from .serializers import (
     UserSerializer, UserRegistrationSerializer, BaseSerializer,
     EquipmentTypeSerializer, InventorySerializer, PurchaseSerializer,
-    TransferSerializer, AssignmentSerializer, ExpenditureSerializer
+    TransferSerializer, AssignmentSerializer, ExpenditureSerializer, JobSerializer,
+    StockAlertSerializer, StockThresholdSerializer, TransferCostSerializer, APILogSerializer, APILogDetailSerializer, OrgNodeSerializer,
+    SerializedAssetSerializer, SerializedRegisterSerializer, SerializedMoveSerializer,
+    StockLotSerializer, LotAllocationSerializer, LotRecallSerializer, RebalancePlanSerializer
 )
-from .permissions import IsAdmin, BaseAccessPermission, CanModifyAssignments
+from .permissions import IsAdmin, IsLogisticsOfficer, BaseAccessPermission, CanModifyAssignments
+from . import forecasting, hierarchy, projections, rebalancing, reference, serialized, series, sync
+from .jobs import enqueue
+from .provisioning import provision_users, read_csv, without_passwords
+from .renderers import ColumnarRenderer
+from .tokens import RefreshToken, record_login
+from .sharding import route_queryset, shard_aliases, shard_partitions
+from .reconciliation import reconcile as reconcile_inventory
+
+
+def node_param(request):
+    """The ``node_id`` query parameter (an OrgNode) as an int, or None"""
+    value = request.query_params.get('node_id')
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValidationError({'node_id': 'A valid integer is required.'})
+    return int(value)
 
 
 class BaseListPermission(permissions.BasePermission):
@@ -63,6 +94,7 @@ def login(request):
     user = authenticate(username=username, password=password)
     
     if user:
+        record_login(user)
         refresh = RefreshToken.for_user(user)
         
         return Response({
@@ -79,6 +111,51 @@ def login(request):
     )
 
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def logout(request):
+    """Revoke a refresh token"""
+    token = request.data.get('refresh')
+    if not token:
+        return Response({'error': 'refresh is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        RefreshToken(token).blacklist()
+    except TokenError:
+        return Response({'error': 'Invalid or expired refresh token'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({'message': 'Logged out'})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdmin])
+def bulk_provision_users(request):
+    """
+    Create users from a CSV (multipart ``file`` or a ``csv`` field) with columns
+    username, email, role, base[, first_name, last_name, password].
+    Small files are provisioned inline; larger ones run as a background job (202).
+    """
+    upload = request.FILES.get('file')
+    csv_text = upload.read().decode('utf-8-sig') if upload else request.data.get('csv', '')
+    try:
+        rows = read_csv(csv_text)
+    except (UnicodeDecodeError, ValueError, csv.Error) as error:
+        return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    if not rows:
+        return Response({'error': 'No rows to provision'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if len(rows) > settings.PROVISION_SYNC_ROWS:
+        job = enqueue('provision_users', {'csv_text': csv_text}, user=request.user)
+        return Response(
+            JobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': reverse('job-detail', args=[job.id], request=request)}
+        )
+    
+    report = provision_users(rows)
+    return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def current_user(request):
@@ -157,9 +234,8 @@ def initialize_role_codes(request):
 @permission_classes([AllowAny])
 def get_role_codes(request):
     """Get all active role codes (for signup page)"""
-    role_codes = RoleCode.objects.filter(is_active=True).values('role', 'code')
     return Response({
-        'role_codes': list(role_codes)
+        'role_codes': [{'role': role, 'code': code} for role, code in reference.role_codes().items()]
     })
 
 
@@ -267,11 +343,9 @@ def populate_equipment_types(request):
 def setup_all_demo_data(request):
     """
     All-in-one setup endpoint - populates bases, equipment types, and optionally transaction data.
-    Query param: include_transactions=true to also seed transaction data (requires authentication)
+    Query param: include_transactions=true to also seed transaction data (requires authentication);
+    the transactions are created by a background job and the response is 202 with its status.
     """
-    from datetime import timedelta
-    import random
-    
     results = {
         'bases': {'created': 0, 'total': 0},
         'equipment_types': {'created': 0, 'total': 0},
@@ -331,78 +405,21 @@ def setup_all_demo_data(request):
                 'message': 'Bases and equipment created successfully, but transaction data requires login'
             }, status=status.HTTP_401_UNAUTHORIZED)
         
-        # Get data for transactions
-        bases = list(Base.objects.filter(is_deleted=False))
-        equipment_types = list(EquipmentType.objects.filter(is_deleted=False))
-        
-        if bases and equipment_types:
-            # Check if data already exists
-            existing_purchases = Purchase.objects.filter(is_deleted=False).count()
-            
-            if existing_purchases < 20:
-                created_data = {
-                    'purchases': 0,
-                    'transfers': 0,
-                    'assignments': 0,
-                    'expenditures': 0
-                }
-                
-                # Create sample transactions (reduced numbers for faster execution)
-                for i in range(15):
-                    days_ago = random.randint(1, 90)
-                    purchase_date = datetime.now().date() - timedelta(days=days_ago)
-                    
-                    base = random.choice(bases)
-                    equipment_type = random.choice(equipment_types)
-                    quantity = random.randint(10, 200)
-                    
-                    Purchase.objects.create(
-                        base=base,
-                        equipment_type=equipment_type,
-                        quantity=quantity,
-                        supplier=random.choice([
-                            'Defense Supplies Inc.', 'Military Equipment Corp.',
-                            'Global Arms Ltd.', 'Strategic Resources Co.'
-                        ]),
-                        purchase_date=purchase_date,
-                        created_by=request.user
-                    )
-                    
-                    # Update inventory
-                    inventory, created = Inventory.objects.get_or_create(
-                        base=base,
-                        equipment_type=equipment_type,
-                        defaults={'quantity': 0}
-                    )
-                    inventory.quantity += quantity
-                    inventory.save()
-                    created_data['purchases'] += 1
-                
-                # Create transfers
-                for i in range(10):
-                    from_base = random.choice(bases)
-                    to_base = random.choice([b for b in bases if b != from_base])
-                    
-                    Transfer.objects.create(
-                        from_base=from_base,
-                        to_base=to_base,
-                        equipment_type=random.choice(equipment_types),
-                        quantity=random.randint(5, 50),
-                        status=random.choice(['pending', 'completed']),
-                        transfer_date=datetime.now().date() - timedelta(days=random.randint(1, 60)),
-                        created_by=request.user
-                    )
-                    created_data['transfers'] += 1
-                
-                results['transactions'] = {
-                    'created': created_data,
-                    'totals': {
-                        'purchases': Purchase.objects.filter(is_deleted=False).count(),
-                        'transfers': Transfer.objects.filter(is_deleted=False).count()
-                    }
-                }
-            else:
-                results['transactions'] = {'message': 'Transaction data already exists'}
+        # Check if data already exists
+        existing_purchases = Purchase.objects.filter(is_deleted=False).count()
+        
+        if existing_purchases < 20:
+            job = enqueue('seed_sample_transactions', user=request.user)
+            results['transactions'] = {
+                'message': 'Seeding transaction data in the background',
+                'job': JobSerializer(job).data
+            }
+            return Response({
+                'message': 'Demo data setup started',
+                'results': results
+            }, status=status.HTTP_202_ACCEPTED, headers={'Location': reverse('job-detail', args=[job.id], request=request)})
+        
+        results['transactions'] = {'message': 'Transaction data already exists'}
     
     return Response({
         'message': 'Demo data setup complete',
@@ -413,10 +430,10 @@ def setup_all_demo_data(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def seed_transaction_data(request):
-    """Seed demo transaction data (purchases, transfers, assignments, expenditures)"""
-    from datetime import timedelta
-    import random
-    
+    """
+    Seed demo transaction data (purchases, transfers, assignments, expenditures).
+    Runs as a background job; poll the returned job for progress.
+    """
     user = request.user
     
     # Get existing data
@@ -443,140 +460,11 @@ def seed_transaction_data(request):
             'expenditures': Expenditure.objects.filter(is_deleted=False).count()
         })
     
-    created_data = {
-        'purchases': 0,
-        'transfers': 0,
-        'assignments': 0,
-        'expenditures': 0
-    }
-    
-    # Create Purchases (30 records over the last 90 days)
-    for i in range(30):
-        days_ago = random.randint(1, 90)
-        purchase_date = datetime.now().date() - timedelta(days=days_ago)
-        
-        base = random.choice(bases)
-        equipment_type = random.choice(equipment_types)
-        quantity = random.randint(10, 500)
-        
-        purchase = Purchase.objects.create(
-            base=base,
-            equipment_type=equipment_type,
-            quantity=quantity,
-            supplier=random.choice([
-                'Defense Supplies Inc.',
-                'Military Equipment Corp.',
-                'Global Arms Ltd.',
-                'Strategic Resources Co.',
-                'National Defense Suppliers',
-                'Allied Equipment Group'
-            ]),
-            purchase_date=purchase_date,
-            created_by=user
-        )
-        
-        # Update inventory
-        inventory, created = Inventory.objects.get_or_create(
-            base=base,
-            equipment_type=equipment_type,
-            defaults={'quantity': 0}
-        )
-        inventory.quantity += quantity
-        inventory.save()
-        created_data['purchases'] += 1
-    
-    # Create Transfers (20 records)
-    for i in range(20):
-        days_ago = random.randint(1, 60)
-        transfer_date = datetime.now().date() - timedelta(days=days_ago)
-        
-        from_base = random.choice(bases)
-        to_base = random.choice([b for b in bases if b != from_base])
-        
-        Transfer.objects.create(
-            from_base=from_base,
-            to_base=to_base,
-            equipment_type=random.choice(equipment_types),
-            quantity=random.randint(5, 100),
-            status=random.choice(['pending', 'in_transit', 'completed']),
-            transfer_date=transfer_date,
-            created_by=user
-        )
-        created_data['transfers'] += 1
-    
-    # Create Assignments (25 records)
-    personnel_names = [
-        'Sgt. John Smith', 'Cpl. Sarah Johnson', 'Lt. Michael Brown',
-        'Pvt. Emily Davis', 'Sgt. David Wilson', 'Cpl. Jessica Martinez',
-        'Lt. Robert Anderson', 'Pvt. Amanda Taylor', 'Sgt. Christopher Lee',
-        'Cpl. Jennifer White', 'Lt. Matthew Harris', 'Pvt. Ashley Clark',
-        'Sgt. Daniel Lewis', 'Cpl. Melissa Walker', 'Lt. James Hall'
-    ]
-    
-    for i in range(25):
-        days_ago = random.randint(1, 120)
-        assignment_date = datetime.now().date() - timedelta(days=days_ago)
-        
-        assigned_qty = random.randint(1, 20)
-        returned_qty = random.randint(0, assigned_qty) if random.random() > 0.3 else 0
-        
-        return_date = None
-        if returned_qty > 0:
-            return_date = assignment_date + timedelta(days=random.randint(7, 60))
-        
-        Assignment.objects.create(
-            base=random.choice(bases),
-            equipment_type=random.choice(equipment_types),
-            personnel_name=random.choice(personnel_names),
-            personnel_id=f'MIL-{random.randint(10000, 99999)}',
-            assigned_quantity=assigned_qty,
-            returned_quantity=returned_qty,
-            assignment_date=assignment_date,
-            return_date=return_date,
-            created_by=user
-        )
-        created_data['assignments'] += 1
-    
-    # Create Expenditures (15 records)
-    expenditure_reasons = [
-        'Training Exercise',
-        'Combat Operations',
-        'Equipment Testing',
-        'Maintenance and Repair',
-        'Emergency Response',
-        'Field Operations',
-        'Tactical Drills',
-        'Equipment Damage',
-        'Lost in Field',
-        'Routine Consumption'
-    ]
-    
-    for i in range(15):
-        days_ago = random.randint(1, 90)
-        expenditure_date = datetime.now().date() - timedelta(days=days_ago)
-        
-        Expenditure.objects.create(
-            base=random.choice(bases),
-            equipment_type=random.choice(equipment_types),
-            quantity=random.randint(1, 50),
-            reason=random.choice(expenditure_reasons),
-            expenditure_date=expenditure_date,
-            created_by=user
-        )
-        created_data['expenditures'] += 1
-    
+    job = enqueue('seed_transactions', user=user)
     return Response({
-        'message': 'Successfully created transaction data',
-        'created': created_data,
-        'totals': {
-            'purchases': Purchase.objects.filter(is_deleted=False).count(),
-            'transfers': Transfer.objects.filter(is_deleted=False).count(),
-            'assignments': Assignment.objects.filter(is_deleted=False).count(),
-            'expenditures': Expenditure.objects.filter(is_deleted=False).count(),
-            'inventory_items': Inventory.objects.count()
-        }
-    }, status=status.HTTP_201_CREATED)
-
+        'message': 'Seeding transaction data in the background',
+        'job': JobSerializer(job).data
+    }, status=status.HTTP_202_ACCEPTED, headers={'Location': reverse('job-detail', args=[job.id], request=request)})
 
 
 @api_view(['GET'])
@@ -587,6 +475,7 @@ def dashboard_stats(request):
     
     # Get filters from query params
     base_id = request.query_params.get('base_id')
+    node_id = node_param(request)
     equipment_type_id = request.query_params.get('equipment_type_id')
     start_date = request.query_params.get('start_date')
     end_date = request.query_params.get('end_date')
@@ -597,7 +486,7 @@ def dashboard_stats(request):
         if user_role.role == 'admin':
             bases = Base.objects.filter(is_deleted=False)
         elif user_role.role == 'base_commander':
-            bases = Base.objects.filter(id=user_role.assigned_base.id, is_deleted=False)
+            bases = Base.objects.filter(id__in=hierarchy.scope_base_ids(user_role), is_deleted=False)
         else:
             bases = Base.objects.filter(is_deleted=False)
     except UserRole.DoesNotExist:
@@ -606,11 +495,9 @@ def dashboard_stats(request):
     # Apply base filter
     if base_id:
         bases = bases.filter(id=base_id)
-    
-    # Build query filters
-    filters = Q(base__in=bases)
-    if equipment_type_id:
-        filters &= Q(equipment_type_id=equipment_type_id)
+    # Roll up every base beneath an organizational node
+    if node_id is not None:
+        bases = bases.filter(org_node__ancestor_links__ancestor_id=node_id)
     
     date_filters = Q()
     if start_date:
@@ -618,34 +505,67 @@ def dashboard_stats(request):
     if end_date:
         date_filters &= Q(created_at__lte=end_date)
     
-    # Calculate statistics
-    inventory_total = Inventory.objects.filter(
-        base__in=bases
-    ).aggregate(total=Sum('quantity'))['total'] or 0
-    
-    purchases_total = Purchase.objects.filter(
-        filters & date_filters, is_deleted=False
-    ).aggregate(total=Sum('quantity'))['total'] or 0
+    inventory_total = purchases_total = transfers_in = transfers_out = 0
+    assigned_total = expended_total = 0
+    breakdown = {'purchases': {}, 'transfers_in': {}, 'transfers_out': {}}
     
-    transfers_in = Transfer.objects.filter(
-        Q(to_base__in=bases) & date_filters,
-        status='completed',
-        is_deleted=False
-    ).aggregate(total=Sum('quantity'))['total'] or 0
-    
-    transfers_out = Transfer.objects.filter(
-        Q(from_base__in=bases) & date_filters,
-        status='completed',
-        is_deleted=False
-    ).aggregate(total=Sum('quantity'))['total'] or 0
-    
-    assigned_total = Assignment.objects.filter(
-        filters & date_filters, is_deleted=False
-    ).aggregate(total=Sum(F('assigned_quantity') - F('returned_quantity')))['total'] or 0
-    
-    expended_total = Expenditure.objects.filter(
-        filters & date_filters, is_deleted=False
-    ).aggregate(total=Sum('quantity'))['total'] or 0
+    # Calculate statistics (one pass per shard when sharding is enabled)
+    for alias, shard_bases in shard_partitions(bases):
+        # Build query filters
+        filters = Q(base__in=shard_bases)
+        if equipment_type_id:
+            filters &= Q(equipment_type_id=equipment_type_id)
+        
+        inventory_total += Inventory.objects.using(alias).filter(
+            base__in=shard_bases
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        
+        purchases_total += Purchase.objects.using(alias).filter(
+            filters & date_filters, is_deleted=False
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        
+        transfers_in += Transfer.objects.using(alias).filter(
+            Q(to_base__in=shard_bases) & date_filters,
+            status='completed',
+            is_deleted=False
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        
+        transfers_out += Transfer.objects.using(alias).filter(
+            Q(from_base__in=shard_bases) & date_filters,
+            status='completed',
+            is_deleted=False
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        
+        assigned_total += Assignment.objects.using(alias).filter(
+            filters & date_filters, is_deleted=False
+        ).aggregate(total=Sum(F('assigned_quantity') - F('returned_quantity')))['total'] or 0
+        
+        expended_total += Expenditure.objects.using(alias).filter(
+            filters & date_filters, is_deleted=False
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        
+        # Get breakdown data
+        purchases_list = Purchase.objects.using(alias).filter(
+            filters & date_filters, is_deleted=False
+        ).values('equipment_type__name').annotate(total=Sum('quantity'))
+        
+        transfers_in_list = Transfer.objects.using(alias).filter(
+            Q(to_base__in=shard_bases) & date_filters,
+            status='completed',
+            is_deleted=False
+        ).values('equipment_type__name').annotate(total=Sum('quantity'))
+        
+        transfers_out_list = Transfer.objects.using(alias).filter(
+            Q(from_base__in=shard_bases) & date_filters,
+            status='completed',
+            is_deleted=False
+        ).values('equipment_type__name').annotate(total=Sum('quantity'))
+        
+        for key, rows in [('purchases', purchases_list), ('transfers_in', transfers_in_list),
+                          ('transfers_out', transfers_out_list)]:
+            for row in rows:
+                name = row['equipment_type__name']
+                breakdown[key][name] = breakdown[key].get(name, 0) + row['total']
     
     # Calculate opening and closing balance
     # For simplicity, opening balance = current inventory - net movement
@@ -653,23 +573,6 @@ def dashboard_stats(request):
     opening_balance = inventory_total - net_movement
     closing_balance = inventory_total
     
-    # Get breakdown data
-    purchases_list = Purchase.objects.filter(
-        filters & date_filters, is_deleted=False
-    ).values('equipment_type__name').annotate(total=Sum('quantity'))
-    
-    transfers_in_list = Transfer.objects.filter(
-        Q(to_base__in=bases) & date_filters,
-        status='completed',
-        is_deleted=False
-    ).values('equipment_type__name').annotate(total=Sum('quantity'))
-    
-    transfers_out_list = Transfer.objects.filter(
-        Q(from_base__in=bases) & date_filters,
-        status='completed',
-        is_deleted=False
-    ).values('equipment_type__name').annotate(total=Sum('quantity'))
-    
     return Response({
         'opening_balance': float(opening_balance),
         'closing_balance': float(closing_balance),
@@ -677,14 +580,249 @@ def dashboard_stats(request):
         'assigned_total': float(assigned_total),
         'expended_total': float(expended_total),
         'breakdown': {
-            'purchases': list(purchases_list),
-            'transfers_in': list(transfers_in_list),
-            'transfers_out': list(transfers_out_list),
+            key: [{'equipment_type__name': name, 'total': total} for name, total in totals.items()]
+            for key, totals in breakdown.items()
         }
     })
 
 
-class BaseViewSet(viewsets.ModelViewSet):
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def dashboard_series(request):
+    """
+    Get time-bucketed movement series for charts.
+    Query params: interval (day|week|month), group_by (base|equipment_type),
+    base_id, node_id, equipment_type_id, start_date, end_date (YYYY-MM-DD),
+    max_points
+    """
+    user = request.user
+    
+    interval = request.query_params.get('interval', 'day')
+    group_by = request.query_params.get('group_by') or None
+    node_id = node_param(request)
+    
+    if interval not in series.INTERVALS:
+        return Response(
+            {'error': f'interval must be one of: {", ".join(series.INTERVALS)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if group_by and group_by not in series.GROUP_BY_CHOICES:
+        return Response(
+            {'error': f'group_by must be one of: {", ".join(series.GROUP_BY_CHOICES)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        base_id = int(request.query_params['base_id']) if request.query_params.get('base_id') else None
+        equipment_type_id = int(request.query_params['equipment_type_id']) if request.query_params.get('equipment_type_id') else None
+        start_date = parse_date(request.query_params.get('start_date') or '') or None
+        end_date = parse_date(request.query_params.get('end_date') or '') or None
+        max_points = int(request.query_params.get('max_points', series.MAX_POINTS))
+    except ValueError:
+        return Response(
+            {'error': 'Invalid base_id, equipment_type_id, start_date, end_date or max_points'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    max_points = max(1, min(max_points, series.MAX_POINTS))
+    
+    # Filter bases based on user role
+    try:
+        user_role = user.role
+        if user_role.role == 'base_commander':
+            bases = Base.objects.filter(id__in=hierarchy.scope_base_ids(user_role), is_deleted=False)
+        else:
+            bases = Base.objects.filter(is_deleted=False)
+    except UserRole.DoesNotExist:
+        return Response({'error': 'User role not found'}, status=status.HTTP_403_FORBIDDEN)
+    
+    if base_id is not None:
+        bases = bases.filter(id=base_id)
+    if node_id is not None:
+        bases = bases.filter(org_node__ancestor_links__ancestor_id=node_id)
+    
+    return Response(series.movement_series(
+        bases.values('id'),
+        interval=interval,
+        group_by=group_by,
+        equipment_type_id=equipment_type_id,
+        start_date=start_date,
+        end_date=end_date,
+        max_points=max_points,
+    ))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_changes(request):
+    """
+    Changed and soft-deleted inventory and transaction rows since a cursor.
+    Query params: since (cursor from the previous response; omit for a
+    full sync), limit. Repeat with the returned cursor while has_more.
+    """
+    try:
+        cursor = sync.parse_cursor(request.query_params.get('since'))
+        limit = int(request.query_params.get('limit', settings.SYNC_BATCH_SIZE))
+    except ValueError:
+        return Response({'error': 'Invalid since or limit'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, settings.SYNC_MAX_BATCH_SIZE))
+    
+    return Response(sync.changes_since(request.user, cursor, limit))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def consumption_forecast(request):
+    """
+    Consumption rates and days of supply per base and equipment type,
+    soonest stock-out first.
+    Query params: base_id, equipment_type_id, max_days, history_days
+    """
+    try:
+        base_id = int(request.query_params['base_id']) if request.query_params.get('base_id') else None
+        equipment_type_id = int(request.query_params['equipment_type_id']) if request.query_params.get('equipment_type_id') else None
+        max_days = float(request.query_params['max_days']) if request.query_params.get('max_days') else None
+        history_days = int(request.query_params.get('history_days', settings.FORECAST_HISTORY_DAYS))
+    except ValueError:
+        return Response(
+            {'error': 'Invalid base_id, equipment_type_id, max_days or history_days'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    history_days = max(28, min(history_days, 366))
+    
+    base_ids = [base_id] if base_id is not None else None
+    try:
+        user_role = request.user.role
+        if user_role.role == 'base_commander':
+            # Base commanders only see their assigned bases
+            scope = hierarchy.scope_base_ids(user_role)
+            base_ids = [b for b in base_ids or scope if b in scope]
+    except UserRole.DoesNotExist:
+        pass
+    
+    return Response({
+        'history_days': history_days,
+        'results': forecasting.forecast(base_ids, equipment_type_id, max_days, history_days),
+    })
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated, IsAdmin | IsLogisticsOfficer])
+def rebalance_stock(request):
+    """
+    Transfers that bring every base to its stock target at the lowest
+    total cost. GET previews them; POST saves them as pending transfers.
+    Query params: equipment_type_id, base_id (both repeatable)
+    """
+    try:
+        equipment_type_ids = [int(value) for value in request.query_params.getlist('equipment_type_id')] or None
+        base_ids = [int(value) for value in request.query_params.getlist('base_id')] or None
+    except ValueError:
+        return Response({'error': 'Invalid equipment_type_id or base_id'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if request.method == 'GET':
+        return Response(RebalancePlanSerializer(rebalancing.recommend(equipment_type_ids, base_ids)).data)
+    
+    plan = rebalancing.save(equipment_type_ids, base_ids, request.user)
+    return Response(RebalancePlanSerializer(plan).data, status=status.HTTP_201_CREATED)
+
+
+class SparseFieldsViewMixin:
+    """
+    ``?fields=a,b`` and ``?expand=relation`` on reads: the serializer only
+    renders, and the queryset only loads, what was asked for (see
+    serializers.SparseFieldsMixin). Writes always use the full serializer.
+    """
+    # Set by ValuesListMixin to read values() rows instead of models
+    values_plan = None
+    
+    def _sparse_params(self):
+        if self.request.method not in ('GET', 'HEAD'):
+            return {}
+        params = {}
+        for name in ('fields', 'expand'):
+            value = self.request.query_params.get(name)
+            if value:
+                params[name] = list(dict.fromkeys(part.strip() for part in value.split(',') if part.strip()))
+        return params
+    
+    def get_serializer(self, *args, **kwargs):
+        for name, value in self._sparse_params().items():
+            kwargs.setdefault(name, value)
+        return super().get_serializer(*args, **kwargs)
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in ('GET', 'HEAD'):
+            return queryset
+        query = queryset.query
+        ordering = query.order_by or (query.get_meta().ordering if query.default_ordering else [])
+        ordering = [field for field in ordering if isinstance(field, str) and field != '?']
+        if self.values_plan is not None:
+            return self.values_plan.values(queryset, ordering)
+        serializer = self.get_serializer_class()(context=self.get_serializer_context(), **self._sparse_params())
+        return serializer.optimize(queryset, ordering)
+
+
+class ValuesListMixin:
+    """
+    Render GET list pages from values() rows through ``values_projection``
+    (see projections.py) instead of model instances and the serializer;
+    the output is identical. ?expand= falls back to the serializer, as
+    does any field the projection cannot reproduce.
+    
+    ?format=columnar returns the page as ``{columns, dictionaries, data}``
+    built straight from values_list() tuples (see ColumnarPlan).
+    """
+    values_projection = None
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarRenderer]
+    
+    def list(self, request, *args, **kwargs):
+        if getattr(request.accepted_renderer, 'format', None) == ColumnarRenderer.format:
+            return self.columnar_list(request)
+        if (
+            not settings.FAST_LIST_SERIALIZATION or self.values_projection is None
+            or 'expand' in self._sparse_params()
+        ):
+            return super().list(request, *args, **kwargs)
+        plan = self.values_projection.compile(self.get_serializer())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+        
+        self.values_plan = plan
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.rows(page))
+        return Response(plan.rows(queryset))
+    
+    def columnar_list(self, request):
+        if self.values_projection is None or 'expand' in self._sparse_params():
+            return Response({'detail': 'format=columnar does not support expand.'}, status=status.HTTP_400_BAD_REQUEST)
+        plan = self.values_projection.compile(self.get_serializer(), projections.ColumnarPlan)
+        if plan is None:
+            return Response({'detail': 'These fields cannot be returned in columnar format.'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        self.values_plan = plan
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.columnar(page))
+        return Response(plan.columnar(queryset))
+
+
+class ShardRoutingMixin:
+    """
+    Run the filtered queryset on the shard of the bases it is scoped to
+    (set ``shard_base_ids`` in get_queryset) when they share one, or fan
+    out across all shards.
+    """
+    shard_base_ids = None
+    
+    def filter_queryset(self, queryset):
+        return route_queryset(super().filter_queryset(queryset), self.shard_base_ids)
+
+
+class BaseViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """ViewSet for Base model"""
     queryset = Base.objects.filter(is_deleted=False)
     serializer_class = BaseSerializer
@@ -702,11 +840,15 @@ class BaseViewSet(viewsets.ModelViewSet):
             try:
                 user_role = user.role
                 if user_role.role == 'base_commander':
-                    # Base commanders only see their assigned base
-                    queryset = queryset.filter(id=user_role.assigned_base.id)
+                    # Base commanders only see their assigned bases
+                    queryset = queryset.filter(id__in=hierarchy.scope_base_ids(user_role))
             except UserRole.DoesNotExist:
                 pass
         
+        node_id = node_param(self.request)
+        if node_id is not None:
+            queryset = queryset.filter(org_node__ancestor_links__ancestor_id=node_id)
+        
         return queryset
     
     def perform_destroy(self, instance):
@@ -715,7 +857,7 @@ class BaseViewSet(viewsets.ModelViewSet):
         instance.save()
 
 
-class EquipmentTypeViewSet(viewsets.ModelViewSet):
+class EquipmentTypeViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """ViewSet for EquipmentType model"""
     queryset = EquipmentType.objects.filter(is_deleted=False)
     serializer_class = EquipmentTypeSerializer
@@ -729,10 +871,11 @@ class EquipmentTypeViewSet(viewsets.ModelViewSet):
         instance.save()
 
 
-class InventoryViewSet(viewsets.ReadOnlyModelViewSet):
+class InventoryViewSet(ShardRoutingMixin, ValuesListMixin, SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for Inventory model (read-only)"""
     queryset = Inventory.objects.all()
     serializer_class = InventorySerializer
+    values_projection = projections.INVENTORY
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['base', 'equipment_type']
     ordering_fields = ['base__name', 'equipment_type__name', 'quantity']
@@ -741,21 +884,53 @@ class InventoryViewSet(viewsets.ReadOnlyModelViewSet):
         queryset = super().get_queryset()
         user = self.request.user
         
+        # Every base beneath an organizational node
+        node_id = node_param(self.request)
+        if node_id is not None:
+            self.shard_base_ids = hierarchy.base_ids_under(node_id)
+            queryset = queryset.filter(base_id__in=self.shard_base_ids)
+        
         try:
             user_role = user.role
             if user_role.role == 'base_commander':
-                # Base commanders only see their assigned base
-                queryset = queryset.filter(base=user_role.assigned_base)
+                # Base commanders only see their assigned bases
+                self.shard_base_ids = hierarchy.scope_base_ids(user_role)
+                queryset = queryset.filter(base_id__in=self.shard_base_ids)
         except UserRole.DoesNotExist:
             pass
         
         return queryset
+    
+    @action(detail=False, methods=['get', 'post'], permission_classes=[IsAuthenticated, IsAdmin])
+    def reconcile(self, request):
+        """
+        Compare inventory with the transaction history.
+        GET reports drift; POST queues a background job that also repairs it.
+        Optional base_id limits the check.
+        """
+        base_ids = None
+        base_id = request.query_params.get('base_id')
+        if base_id:
+            base_ids = list(Base.objects.filter(id=base_id).values_list('id', flat=True))
+            if not base_ids:
+                return Response({'error': 'Base not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        if request.method == 'POST':
+            job = enqueue('reconcile_inventory', {'base_ids': base_ids, 'repair': True}, user=request.user)
+            return Response(
+                JobSerializer(job).data,
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Location': reverse('job-detail', args=[job.id], request=request)}
+            )
+        
+        return Response(reconcile_inventory(base_ids))
 
 
-class PurchaseViewSet(viewsets.ModelViewSet):
+class PurchaseViewSet(ShardRoutingMixin, ValuesListMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """ViewSet for Purchase model"""
     queryset = Purchase.objects.filter(is_deleted=False)
     serializer_class = PurchaseSerializer
+    values_projection = projections.PURCHASES
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['base', 'equipment_type']
     ordering_fields = ['purchase_date', 'created_at']
@@ -776,7 +951,8 @@ class PurchaseViewSet(viewsets.ModelViewSet):
         try:
             user_role = user.role
             if user_role.role == 'base_commander':
-                queryset = queryset.filter(base=user_role.assigned_base)
+                self.shard_base_ids = hierarchy.scope_base_ids(user_role)
+                queryset = queryset.filter(base_id__in=self.shard_base_ids)
         except UserRole.DoesNotExist:
             pass
         
@@ -788,10 +964,11 @@ class PurchaseViewSet(viewsets.ModelViewSet):
         instance.save()
 
 
-class TransferViewSet(viewsets.ModelViewSet):
+class TransferViewSet(ShardRoutingMixin, ValuesListMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """ViewSet for Transfer model"""
     queryset = Transfer.objects.filter(is_deleted=False)
     serializer_class = TransferSerializer
+    values_projection = projections.TRANSFERS
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['from_base', 'to_base', 'equipment_type', 'status']
     ordering_fields = ['transfer_date', 'created_at']
@@ -812,9 +989,10 @@ class TransferViewSet(viewsets.ModelViewSet):
         try:
             user_role = user.role
             if user_role.role == 'base_commander':
-                # Show transfers involving their base
+                # Show transfers involving their bases
+                self.shard_base_ids = hierarchy.scope_base_ids(user_role)
                 queryset = queryset.filter(
-                    Q(from_base=user_role.assigned_base) | Q(to_base=user_role.assigned_base)
+                    Q(from_base_id__in=self.shard_base_ids) | Q(to_base_id__in=self.shard_base_ids)
                 )
         except UserRole.DoesNotExist:
             pass
@@ -827,10 +1005,11 @@ class TransferViewSet(viewsets.ModelViewSet):
         instance.save()
 
 
-class AssignmentViewSet(viewsets.ModelViewSet):
+class AssignmentViewSet(ShardRoutingMixin, ValuesListMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """ViewSet for Assignment model"""
     queryset = Assignment.objects.filter(is_deleted=False)
     serializer_class = AssignmentSerializer
+    values_projection = projections.ASSIGNMENTS
     permission_classes = [IsAuthenticated, CanModifyAssignments]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['base', 'equipment_type']
@@ -852,7 +1031,8 @@ class AssignmentViewSet(viewsets.ModelViewSet):
         try:
             user_role = user.role
             if user_role.role == 'base_commander':
-                queryset = queryset.filter(base=user_role.assigned_base)
+                self.shard_base_ids = hierarchy.scope_base_ids(user_role)
+                queryset = queryset.filter(base_id__in=self.shard_base_ids)
         except UserRole.DoesNotExist:
             pass
         
@@ -864,10 +1044,11 @@ class AssignmentViewSet(viewsets.ModelViewSet):
         instance.save()
 
 
-class ExpenditureViewSet(viewsets.ModelViewSet):
+class ExpenditureViewSet(ShardRoutingMixin, ValuesListMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """ViewSet for Expenditure model"""
     queryset = Expenditure.objects.filter(is_deleted=False)
     serializer_class = ExpenditureSerializer
+    values_projection = projections.EXPENDITURES
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['base', 'equipment_type']
     ordering_fields = ['expenditure_date', 'created_at']
@@ -888,7 +1069,8 @@ class ExpenditureViewSet(viewsets.ModelViewSet):
         try:
             user_role = user.role
             if user_role.role == 'base_commander':
-                queryset = queryset.filter(base=user_role.assigned_base)
+                self.shard_base_ids = hierarchy.scope_base_ids(user_role)
+                queryset = queryset.filter(base_id__in=self.shard_base_ids)
         except UserRole.DoesNotExist:
             pass
         
@@ -898,3 +1080,401 @@ class ExpenditureViewSet(viewsets.ModelViewSet):
         # Soft delete
         instance.is_deleted = True
         instance.save()
+
+
+class SerializedAssetPagination(CursorPagination):
+    """Keyset pages by id: no COUNT(*) or OFFSET over tens of millions of items"""
+    ordering = ('id',)
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class SerializedAssetViewSet(ShardRoutingMixin, viewsets.ModelViewSet):
+    """
+    Serial-numbered items (see serialized.py). Items are retired, not deleted.
+    Query params: serial_number, base, equipment_type, status, assignee, node_id
+    """
+    queryset = SerializedAsset.objects.select_related('base', 'equipment_type')
+    serializer_class = SerializedAssetSerializer
+    pagination_class = SerializedAssetPagination
+    http_method_names = ['get', 'post', 'put', 'patch', 'head', 'options']
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['serial_number', 'base', 'equipment_type', 'assignee']
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        
+        item_status = self.request.query_params.get('status')
+        if item_status:
+            codes = [code for code, name in SerializedAsset.STATUS_NAMES.items() if name == item_status]
+            if not codes:
+                raise ValidationError({'status': f'Unknown status {item_status!r}'})
+            queryset = queryset.filter(status=codes[0])
+        
+        node_id = node_param(self.request)
+        if node_id is not None:
+            self.shard_base_ids = hierarchy.base_ids_under(node_id)
+            queryset = queryset.filter(base_id__in=self.shard_base_ids)
+        
+        try:
+            user_role = user.role
+            if user_role.role == 'base_commander':
+                self.shard_base_ids = hierarchy.scope_base_ids(user_role)
+                queryset = queryset.filter(base_id__in=self.shard_base_ids)
+        except UserRole.DoesNotExist:
+            pass
+        
+        return queryset
+    
+    @action(detail=False, methods=['post'])
+    def register(self, request):
+        """Register many items of one equipment type at a base in one insert"""
+        serializer = SerializedRegisterSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        scope = hierarchy.user_scope(request.user)
+        if scope is not None and data['base'].pk not in scope:
+            return Response({'error': 'You can only register items at your bases'}, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            items = serialized.register(data['base'].pk, data['equipment_type'].pk, data['serial_numbers'], status=data['status'])
+        except IntegrityError:
+            return Response({'error': 'Some serial numbers were registered concurrently'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'registered': len(items)}, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['post'])
+    def move(self, request):
+        """
+        Move and/or re-tag many items with one UPDATE per shard.
+        Body: ids or serial_numbers (+ equipment_type), and base, status and/or assignee
+        """
+        serializer = SerializedMoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        filters = serializer.item_filters()
+        scope = hierarchy.user_scope(request.user)
+        if scope is not None:
+            filters['base_id__in'] = scope
+        base = data.get('base')
+        moved = serialized.move(
+            filters, base_id=base.pk if base else None,
+            status=data.get('status'), assignee=data.get('assignee')
+        )
+        return Response({'moved': moved})
+    
+    @action(detail=False)
+    def counts(self, request):
+        """Item counts per base, equipment type and status (same filters as the list)"""
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.order_by().values_list('base_id', 'equipment_type_id', 'status').annotate(count=Count('id'))
+        return Response([
+            {
+                'base': base_id,
+                'equipment_type': equipment_type_id,
+                'status': SerializedAsset.STATUS_NAMES.get(item_status, item_status),
+                'count': count,
+            }
+            for base_id, equipment_type_id, item_status, count in rows
+        ])
+
+
+class StockLotViewSet(ShardRoutingMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Lots of lot-tracked equipment types (see lots.py).
+    Query params: base, equipment_type, lot_number, recalled, node_id,
+    expiring_within (days; open lots expiring by then, soonest first)
+    """
+    queryset = StockLot.objects.select_related('base', 'equipment_type')
+    serializer_class = StockLotSerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['base', 'equipment_type', 'lot_number', 'recalled']
+    ordering_fields = ['expires_at', 'received_at', 'remaining']
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        
+        expiring_within = self.request.query_params.get('expiring_within')
+        if expiring_within:
+            if not expiring_within.isdigit():
+                raise ValidationError({'expiring_within': 'A number of days is required.'})
+            # Served by the partial (expires_at, base, equipment_type) index
+            queryset = queryset.filter(
+                remaining__gt=0, expires_at__lte=timezone.localdate() + timedelta(days=int(expiring_within))
+            ).order_by('expires_at', 'base', 'equipment_type')
+        
+        node_id = node_param(self.request)
+        if node_id is not None:
+            self.shard_base_ids = hierarchy.base_ids_under(node_id)
+            queryset = queryset.filter(base_id__in=self.shard_base_ids)
+        
+        try:
+            user_role = user.role
+            if user_role.role == 'base_commander':
+                self.shard_base_ids = hierarchy.scope_base_ids(user_role)
+                queryset = queryset.filter(base_id__in=self.shard_base_ids)
+        except UserRole.DoesNotExist:
+            pass
+        
+        return queryset
+    
+    @action(detail=True)
+    def allocations(self, request, pk=None):
+        """The assignments, expenditures and transfers that drew from this lot"""
+        lot = self.get_object()
+        allocations = LotAllocation.objects.using(lot._state.db).filter(lot=lot)
+        return Response(LotAllocationSerializer(allocations, many=True).data)
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    def recall(self, request):
+        """
+        Flag (or with recalled=false clear) every copy of a lot at every
+        base; recalled lots are no longer drawn from
+        """
+        serializer = LotRecallSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        changed = 0
+        for alias in shard_aliases():
+            changed += StockLot.objects.using(alias).filter(
+                equipment_type=data['equipment_type'], lot_number=data['lot_number']
+            ).update(recalled=data['recalled'], updated_at=timezone.now())
+        if not changed:
+            return Response({'error': 'Lot not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'lots': changed, 'recalled': data['recalled']})
+
+
+class StockThresholdViewSet(viewsets.ModelViewSet):
+    """Per-base low-stock thresholds; admins manage them, base commanders see their base's"""
+    queryset = StockThreshold.objects.select_related('base', 'equipment_type')
+    serializer_class = StockThresholdSerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['base', 'equipment_type']
+    ordering_fields = ['minimum', 'updated_at']
+    
+    def get_permissions(self):
+        if self.request.method in permissions.SAFE_METHODS:
+            return [IsAuthenticated()]
+        return [IsAuthenticated(), IsAdmin()]
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        
+        try:
+            user_role = user.role
+            if user_role.role == 'base_commander':
+                queryset = queryset.filter(base_id__in=hierarchy.scope_base_ids(user_role))
+        except UserRole.DoesNotExist:
+            pass
+        
+        return queryset
+
+
+class OrgNodeViewSet(viewsets.ModelViewSet):
+    """
+    Theaters, regions and commands above the bases; admins manage them.
+    Query params: parent, level
+    """
+    queryset = OrgNode.objects.select_related('parent')
+    serializer_class = OrgNodeSerializer
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_fields = ['parent', 'level']
+    search_fields = ['name', 'code']
+    ordering_fields = ['name', 'code', 'level']
+    
+    def get_permissions(self):
+        if self.request.method in permissions.SAFE_METHODS:
+            return [IsAuthenticated()]
+        return [IsAuthenticated(), IsAdmin()]
+    
+    def destroy(self, request, *args, **kwargs):
+        node = self.get_object()
+        if node.children.exists():
+            return Response(
+                {'error': 'Move or delete the child nodes first'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return super().destroy(request, *args, **kwargs)
+
+
+class TransferCostViewSet(viewsets.ModelViewSet):
+    """Per-unit costs between bases used by /rebalance/; admins manage them"""
+    queryset = TransferCost.objects.select_related('from_base', 'to_base')
+    serializer_class = TransferCostSerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['from_base', 'to_base']
+    ordering_fields = ['cost', 'updated_at']
+    
+    def get_permissions(self):
+        if self.request.method in permissions.SAFE_METHODS:
+            return [IsAuthenticated()]
+        return [IsAuthenticated(), IsAdmin()]
+
+
+class StockAlertViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Low-stock alerts recorded by the inventory write path (see alerts.py).
+    Query params: status (open|resolved), base, equipment_type
+    """
+    queryset = StockAlert.objects.select_related('base', 'equipment_type')
+    serializer_class = StockAlertSerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['base', 'equipment_type']
+    ordering_fields = ['opened_at', 'resolved_at', 'lowest_quantity']
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        
+        alert_status = self.request.query_params.get('status')
+        if alert_status == 'open':
+            queryset = queryset.filter(resolved_at__isnull=True)
+        elif alert_status == 'resolved':
+            queryset = queryset.filter(resolved_at__isnull=False)
+        
+        try:
+            user_role = user.role
+            if user_role.role == 'base_commander':
+                queryset = queryset.filter(base_id__in=hierarchy.scope_base_ids(user_role))
+        except UserRole.DoesNotExist:
+            pass
+        
+        return queryset
+
+
+class JobViewSet(SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
+    """Status of background jobs; users see their own jobs, admins see all"""
+    queryset = Job.objects.select_related('created_by')
+    serializer_class = JobSerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['kind', 'status']
+    ordering_fields = ['created_at', 'finished_at']
+    
+    def get_queryset(self):
+        # Always read from the primary so polling sees progress immediately
+        queryset = super().get_queryset().using('default')
+        user = self.request.user
+        
+        try:
+            if user.role.role == 'admin':
+                return queryset
+        except UserRole.DoesNotExist:
+            pass
+        
+        return queryset.filter(created_by=user)
+    
+    def retrieve(self, request, *args, **kwargs):
+        job = self.get_object()
+        result = job.result if isinstance(job.result, dict) else {}
+        if job.created_by_id != request.user.id or not any(
+            'password' in entry for entry in result.get('generated_passwords', [])
+        ):
+            return Response(self.get_serializer(job).data)
+        
+        # Generated passwords are shown to the job's creator once, then erased
+        with transaction.atomic():
+            job = self.get_queryset().select_for_update().get(pk=job.pk)
+            serializer = self.get_serializer(job)
+            serializer.context['reveal_passwords'] = True
+            data = serializer.data
+            if isinstance(job.result, dict):
+                Job.objects.filter(pk=job.pk).update(result=without_passwords(job.result))
+        return Response(data)
+
+
+class AuditLogPagination(CursorPagination):
+    """Keyset pages: each page seeks from the last timestamp instead of counting and skipping rows"""
+    ordering = ('-timestamp', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class EndpointPattern(Func):
+    """A request path with numeric segments (object ids) replaced by {id}"""
+    function = 'REGEXP_REPLACE'
+    output_field = CharField()
+
+    def __init__(self, expression):
+        super().__init__(expression, Value('/[0-9]+(?=/|$)'), Value('/{id}'), Value('g'))
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # SQLite has no regexp_replace(); development logs group by raw path
+        return compiler.compile(self.source_expressions[0])
+
+
+class AuditLogViewSet(SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only API request log for security reviews (admins only). Captured
+    bodies are only returned by the detail route, redacted.
+    Query params: user, endpoint, endpoint__startswith, method, status_code,
+    status_code__gte, status_code__lt, timestamp__gte, timestamp__lt
+    """
+    queryset = APILog.objects.all()
+    serializer_class = APILogSerializer
+    permission_classes = [IsAuthenticated, IsAdmin]
+    pagination_class = AuditLogPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        'user': ['exact'],
+        'endpoint': ['exact', 'startswith'],
+        'method': ['exact'],
+        'status_code': ['exact', 'gte', 'lt'],
+        'timestamp': ['gte', 'lt'],
+    }
+    
+    def get_serializer_class(self):
+        return APILogDetailSerializer if self.action == 'retrieve' else APILogSerializer
+    
+    @action(detail=False)
+    def stats(self, request):
+        """
+        Per-endpoint request counts, error rates (status >= 400) and top
+        users for the filtered window (default: the last 24 hours). Object
+        ids in paths are grouped as {id} (PostgreSQL), and only the busiest
+        endpoints and their top users leave the database.
+        Extra query params: limit (endpoints, default 50, max 500),
+        top (users per endpoint, default 5)
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 500)
+            top = max(int(request.query_params.get('top', 5)), 0)
+        except ValueError:
+            return Response({'error': 'Invalid limit or top'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = DjangoFilterBackend().filter_queryset(request, APILog.objects.all(), self)
+        if 'timestamp__gte' not in request.query_params:
+            queryset = queryset.filter(timestamp__gte=timezone.now() - timedelta(days=1))
+        queryset = queryset.order_by().annotate(pattern=EndpointPattern('endpoint'))
+        counts = {'requests': Count('id'), 'errors': Count('id', filter=Q(status_code__gte=400))}
+        totals = queryset.aggregate(**counts)
+        
+        results = [
+            {'endpoint': row['pattern'], 'requests': row['requests'], 'errors': row['errors'],
+             'error_rate': round(row['errors'] / row['requests'], 4), 'top_users': []}
+            for row in queryset.values('pattern').annotate(**counts).order_by('-requests', 'pattern')[:limit]
+        ]
+        if results and top:
+            by_endpoint = {entry['endpoint']: entry for entry in results}
+            users = queryset.filter(pattern__in=by_endpoint).values('pattern', 'user_id', 'user__username').annotate(
+                **counts
+            ).annotate(
+                rank=Window(RowNumber(), partition_by=[F('pattern')], order_by=[F('requests').desc(), F('user_id')])
+            ).filter(rank__lte=top).order_by('pattern', 'rank')
+            for row in users:
+                by_endpoint[row['pattern']]['top_users'].append({
+                    'user': row['user_id'], 'username': row['user__username'],
+                    'requests': row['requests'], 'errors': row['errors'],
+                })
+        return Response({
+            'requests': totals['requests'],
+            'errors': totals['errors'],
+            'error_rate': round(totals['errors'] / totals['requests'], 4) if totals['requests'] else 0,
+            'endpoints': results,
+        })
@@ -11,6 +11,9 @@ python manage.py collectstatic --no-input
 # Run database migrations
 python manage.py migrate
 
+# Shared cache table (replica read-your-writes pins)
+python manage.py createcachetable
+
 # Create demo bases (will skip if already exist)
 python manage.py create_demo_bases
 
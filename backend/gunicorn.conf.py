@@ -0,0 +1,75 @@
+"""
+Gunicorn production boot profile.
+
+The application is preloaded and warmed in the master (GUNICORN_PRELOAD,
+on by default) so forked workers share its memory copy-on-write and
+serve their first request warm. Each worker logs its boot time and
+memory (rss/pss/private) when it is ready.
+
+Workers are uvicorn's (GUNICORN_WORKER_CLASS), serving the ASGI app
+military_ams.asgi:application, because the /api/v1/events/ stream only
+exists there. Django runs the sync views of the ASGI app in a thread per
+request, so a worker still serves requests concurrently. The thread hop
+adds some latency to each request, and each request opens its own
+database connection, since persistent connections are not reused under
+ASGI. Size WEB_CONCURRENCY and the database's connection limit with that
+in mind.
+"""
+import os
+import random
+import time
+
+import decouple
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = decouple.config('WEB_CONCURRENCY', default=2, cast=int)
+worker_class = decouple.config('GUNICORN_WORKER_CLASS', default='uvicorn.workers.UvicornWorker')
+preload_app = decouple.config('GUNICORN_PRELOAD', default=True, cast=bool)
+# Recycle workers before slow leaks add up; jitter avoids restarting them all at once
+max_requests = decouple.config('GUNICORN_MAX_REQUESTS', default=1000, cast=int)
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+errorlog = '-'
+loglevel = decouple.config('GUNICORN_LOG_LEVEL', default='info')
+
+_forked_at = {}
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is imported, before any fork
+    if not server.cfg.preload_app:
+        return
+    from military_ams.warmup import format_usage, memory_usage, warm_up
+
+    elapsed = warm_up()
+    server.log.info('Warmed application in %.1fms; master %s', elapsed * 1000, format_usage(memory_usage()))
+
+
+def pre_fork(server, worker):
+    if server.cfg.preload_app:
+        from django.db import connections
+
+        connections.close_all()
+
+
+def post_fork(server, worker):
+    _forked_at[worker.pid] = time.monotonic()
+    # Workers must not share the master's random state
+    random.seed()
+    if server.cfg.preload_app:
+        from military_ams.warmup import reset_connections
+
+        reset_connections()
+
+
+def post_worker_init(worker):
+    from military_ams.warmup import format_usage, memory_usage, warm_up
+
+    if not worker.cfg.preload_app:
+        warm_up()
+    worker.log.info(
+        'Worker %s ready in %.1fms %s', worker.pid,
+        (time.monotonic() - _forked_at.pop(worker.pid, time.monotonic())) * 1000,
+        format_usage(memory_usage())
+    )
@@ -1,5 +1,11 @@
 """
 ASGI config for military_ams project.
+
+Everything is served by Django except the server-sent event stream at
+/api/v1/events/ (assets/events.py), which holds connections open with
+one coroutine each. This is the app every deployment serves:
+``gunicorn -c gunicorn.conf.py military_ams.asgi:application`` runs it on
+uvicorn workers (see gunicorn.conf.py).
 """
 
 import os
@@ -8,4 +14,29 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'military_ams.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from assets import events  # noqa: E402  (needs the app registry)
+
+EVENTS_PATH = '/api/v1/events/'
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await events.hub.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await events.hub.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        await events.stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
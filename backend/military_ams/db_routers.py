@@ -0,0 +1,88 @@
+"""
+Database routers for military_ams project.
+
+ReplicaRouter sends reads to the ``replica`` alias while a request has
+opted in (see ``assets.middleware.ReplicaRoutingMiddleware``); all writes
+and every read outside such a request go to ``default``.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+
+REPLICA_ALIAS = 'replica'
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+# Last replica health check for this process: (checked_at, healthy)
+_replica_health = [0.0, True]
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def _replica_lag_seconds():
+    """Replication lag of the replica in seconds (0 when not measurable)"""
+    connection = connections[REPLICA_ALIAS]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+        )
+        return float(cursor.fetchone()[0] or 0)
+
+
+def replica_healthy():
+    """
+    Whether the replica is reachable and within REPLICA_MAX_LAG_SECONDS.
+
+    The check runs at most once per REPLICA_HEALTH_CHECK_INTERVAL seconds
+    per process; an unreachable or lagging replica sends reads back to
+    the primary until the next check.
+    """
+    now = time.monotonic()
+    if now - _replica_health[0] < settings.REPLICA_HEALTH_CHECK_INTERVAL:
+        return _replica_health[1]
+    try:
+        healthy = _replica_lag_seconds() <= settings.REPLICA_MAX_LAG_SECONDS
+    except DatabaseError:
+        healthy = False
+    _replica_health[:] = [now, healthy]
+    return healthy
+
+
+@contextmanager
+def use_replica(enabled=True):
+    """Route reads inside the block to the replica (when configured and healthy)"""
+    token = _read_from_replica.set(enabled and replica_configured() and replica_healthy())
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+class ReplicaRouter:
+    """Primary/replica router driven by the ``use_replica`` context"""
+
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get():
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', REPLICA_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -6,6 +6,7 @@ from pathlib import Path
 from datetime import timedelta
 from decouple import config
 import dj_database_url
+import importlib.util
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'assets.middleware.ReplicaRoutingMiddleware',
     'assets.middleware.APILoggingMiddleware',
 ]
 
@@ -93,6 +95,117 @@ else:
         }
     }
 
+# Optional read replica: safe-method requests read from it (see db_routers.py)
+# e.g. REPLICA_DATABASE_URL=sqlite:///replica.sqlite3 for local testing
+REPLICA_DATABASE_URL = config('REPLICA_DATABASE_URL', default=None)
+
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = dj_database_url.parse(REPLICA_DATABASE_URL)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+# Optional base-partitioned sharding of the transaction and inventory tables
+# (see assets/sharding.py); 'default' is always the first shard.
+# e.g. SHARD_DATABASE_URLS=shard1=postgres://...,shard2=postgres://...
+SHARD_DATABASE_URLS = config('SHARD_DATABASE_URLS', default='')
+SHARDS = []
+
+for entry in filter(None, (item.strip() for item in SHARD_DATABASE_URLS.split(','))):
+    alias, url = entry.split('=', 1)
+    DATABASES[alias] = dj_database_url.parse(url)
+    SHARDS.append(alias)
+
+if SHARDS:
+    SHARDS.insert(0, 'default')
+
+# Seconds each process caches the base -> shard map
+SHARD_MAP_TTL = config('SHARD_MAP_TTL', default=30, cast=int)
+
+DATABASE_ROUTERS = [
+    'assets.sharding.ShardRouter',
+    'military_ams.db_routers.ReplicaRouter',
+]
+
+# Shared by every worker: replica read-your-writes pins live here
+# (assets/middleware.py). Defaults to a table in the primary database,
+# created by `manage.py createcachetable`; a process-local backend is
+# refused while a replica is configured.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('CACHE_LOCATION', default='django_cache'),
+    }
+}
+
+# Seconds a client keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
+# Reads fall back to the primary while the replica lags more than this
+REPLICA_MAX_LAG_SECONDS = config('REPLICA_MAX_LAG_SECONDS', default=10, cast=float)
+REPLICA_HEALTH_CHECK_INTERVAL = config('REPLICA_HEALTH_CHECK_INTERVAL', default=5, cast=float)
+
+# Seconds each process caches bases, equipment types and role codes (assets/reference.py)
+REFERENCE_CACHE_TTL = config('REFERENCE_CACHE_TTL', default=60, cast=int)
+
+# CSVs with more rows than this are provisioned by a background job
+PROVISION_SYNC_ROWS = config('PROVISION_SYNC_ROWS', default=25, cast=int)
+
+# Changes returned per /sync/ batch by default, and the most a client may ask for
+SYNC_BATCH_SIZE = config('SYNC_BATCH_SIZE', default=500, cast=int)
+SYNC_MAX_BATCH_SIZE = config('SYNC_MAX_BATCH_SIZE', default=5000, cast=int)
+
+# An open low-stock alert resolves once stock is this fraction above the minimum
+# (unless the threshold sets resolve_at)
+STOCK_ALERT_HYSTERESIS = config('STOCK_ALERT_HYSTERESIS', default=0.1, cast=float)
+
+# Days of expenditure and assignment history behind /forecast/
+FORECAST_HISTORY_DAYS = config('FORECAST_HISTORY_DAYS', default=90, cast=int)
+
+# Per-unit cost of moving stock between bases without a TransferCost row
+# (assets/rebalancing.py); empty: such bases are not connected
+REBALANCE_DEFAULT_COST = config('REBALANCE_DEFAULT_COST', default='1', cast=lambda value: float(value) if value else None)
+
+# Admin changelists show the planner's row estimate instead of running
+# COUNT(*) when it expects more rows than this (assets/admin.py)
+ADMIN_EXACT_COUNT_LIMIT = config('ADMIN_EXACT_COUNT_LIMIT', default=10000, cast=int)
+
+# API audit log bodies (assets/middleware.py). Every /api/ request is
+# logged; bodies only for a sample of requests, per path prefix (longest
+# match wins, e.g. "/api/v1/auth/=0,/api/v1/sync/=0.05"), cut to
+# API_LOG_BODY_MAX_BYTES and stored compressed. Safe methods and
+# streaming responses are logged without bodies.
+API_LOG_BODY_SAMPLE_RATE = config('API_LOG_BODY_SAMPLE_RATE', default=1.0, cast=float)
+API_LOG_BODY_SAMPLE_RATES = config(
+    'API_LOG_BODY_SAMPLE_RATES',
+    default='',
+    cast=lambda value: {
+        prefix.strip(): float(rate)
+        for prefix, rate in (item.split('=', 1) for item in value.split(',') if item.strip())
+    }
+)
+API_LOG_BODY_MAX_BYTES = config('API_LOG_BODY_MAX_BYTES', default=5000, cast=int)
+API_LOG_SAFE_METHOD_BODIES = config('API_LOG_SAFE_METHOD_BODIES', default=False, cast=bool)
+
+# Most serial-numbered items one register or move request may touch
+# (assets/serialized.py)
+SERIALIZED_BATCH_MAX = config('SERIALIZED_BATCH_MAX', default=10000, cast=int)
+
+# Server-sent events (assets/events.py): relay between ASGI workers is auto
+# (LISTEN/NOTIFY on PostgreSQL, else Unix sockets), postgres, unix or local
+EVENTS_RELAY = config('EVENTS_RELAY', default='auto')
+EVENTS_SOCKET_DIR = config('EVENTS_SOCKET_DIR', default='/tmp/military-ams-events')
+# Events a slow client may fall behind before it is told to resync
+EVENTS_QUEUE_SIZE = config('EVENTS_QUEUE_SIZE', default=100, cast=int)
+EVENTS_HEARTBEAT_SECONDS = config('EVENTS_HEARTBEAT_SECONDS', default=15, cast=float)
+
+# Background jobs (assets/jobs.py, run by manage.py run_workers)
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=3, cast=int)
+JOB_RETRY_DELAY = config('JOB_RETRY_DELAY', default=10, cast=float)
+JOB_RETRY_MAX_DELAY = config('JOB_RETRY_MAX_DELAY', default=600, cast=float)
+# Running jobs without a heartbeat for this long are handed to another worker
+JOB_STALE_SECONDS = config('JOB_STALE_SECONDS', default=300, cast=int)
+# How often a worker refreshes the heartbeat of the job it is running
+JOB_HEARTBEAT_SECONDS = config('JOB_HEARTBEAT_SECONDS', default=30, cast=float)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -147,18 +260,51 @@ REST_FRAMEWORK = {
     'DATETIME_FORMAT': '%Y-%m-%d %H:%M:%S',
 }
 
+# orjson/MessagePack renderers and parsers (assets/renderers.py), each used
+# only when its library is installed; FAST_RENDERERS=False restores DRF's
+FAST_RENDERERS = config('FAST_RENDERERS', default=True, cast=bool)
+if FAST_RENDERERS and importlib.util.find_spec('orjson'):
+    JSON_RENDERER, JSON_PARSER = 'assets.renderers.ORJSONRenderer', 'assets.renderers.ORJSONParser'
+else:
+    JSON_RENDERER, JSON_PARSER = 'rest_framework.renderers.JSONRenderer', 'rest_framework.parsers.JSONParser'
+REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = [JSON_RENDERER, 'rest_framework.renderers.BrowsableAPIRenderer']
+REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'] = [
+    JSON_PARSER, 'rest_framework.parsers.FormParser', 'rest_framework.parsers.MultiPartParser'
+]
+if FAST_RENDERERS and importlib.util.find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].insert(1, 'assets.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].insert(1, 'assets.renderers.MessagePackParser')
+
+# Serve list pages of the transaction and inventory viewsets from values()
+# rows instead of the serializers (assets/projections.py)
+FAST_LIST_SERIALIZATION = config('FAST_LIST_SERIALIZATION', default=True, cast=bool)
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
-    'UPDATE_LAST_LOGIN': True,
+    # last_login is written in batches by assets.tokens.record_login
+    'UPDATE_LAST_LOGIN': False,
     'ALGORITHM': 'HS256',
     'AUTH_HEADER_TYPES': ('Bearer',),
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
+    # Rotation revokes through the Bloom filter in assets/tokens.py
+    'TOKEN_REFRESH_SERIALIZER': 'assets.tokens.TokenRefreshSerializer',
 }
 
+# Refresh-token revocation filter (assets/tokens.py)
+REVOCATION_FILTER_CAPACITY = config('REVOCATION_FILTER_CAPACITY', default=100000, cast=int)
+REVOCATION_FILTER_ERROR_RATE = config('REVOCATION_FILTER_ERROR_RATE', default=0.001, cast=float)
+# Other processes see a revocation within REVOCATION_FLUSH_SECONDS + REVOCATION_SYNC_SECONDS
+REVOCATION_FLUSH_SECONDS = config('REVOCATION_FLUSH_SECONDS', default=2, cast=float)
+REVOCATION_SYNC_SECONDS = config('REVOCATION_SYNC_SECONDS', default=5, cast=float)
+REVOCATION_SYNC_OVERLAP = 60
+REVOCATION_FILTER_RELOAD_SECONDS = config('REVOCATION_FILTER_RELOAD_SECONDS', default=3600, cast=int)
+REVOCATION_REBUILD_SECONDS = config('REVOCATION_REBUILD_SECONDS', default=86400, cast=int)
+LAST_LOGIN_FLUSH_SECONDS = config('LAST_LOGIN_FLUSH_SECONDS', default=30, cast=float)
+
 # CORS settings
 # For development, allow all origins
 CORS_ALLOW_ALL_ORIGINS = config('DEBUG', default=True, cast=bool)
@@ -25,6 +25,8 @@ def api_root(request):
                 'assignments': '/api/v1/assignments/',
                 'expenditures': '/api/v1/expenditures/',
                 'dashboard': '/api/v1/dashboard/stats/',
+                'dashboard_series': '/api/v1/dashboard/series/',
+                'jobs': '/api/v1/jobs/',
             }
         }
     })
@@ -0,0 +1,114 @@
+"""
+Boot-time warm-up and per-process measurements for gunicorn (see
+gunicorn.conf.py).
+
+With ``preload_app`` the master imports the project and runs ``warm_up``
+once before forking, so workers inherit URL resolvers, model metadata,
+serializer classes and reference data copy-on-write instead of building
+them on their first requests.
+"""
+import logging
+import time
+
+from django.db import connections
+
+
+logger = logging.getLogger('military_ams.boot')
+
+
+def warm_up():
+    """Build lazily-populated caches; returns the elapsed seconds"""
+    started = time.perf_counter()
+
+    from django.apps import apps
+    from django.urls import get_resolver, reverse
+
+    # URL resolver: populates the reverse/namespace dicts for every pattern
+    resolver = get_resolver()
+    resolver._populate()
+    reverse('api_root')
+
+    # Model metadata (field maps, related objects) used by every queryset
+    for model in apps.get_models():
+        model._meta.get_fields()
+        model._meta._forward_fields_map
+        model._meta.fields_map
+
+    # Serializer field declarations and the model field introspection
+    # DRF does when building ModelSerializer fields
+    from rest_framework.serializers import ModelSerializer
+    from assets import serializers
+
+    for name in dir(serializers):
+        serializer_class = getattr(serializers, name)
+        if isinstance(serializer_class, type) and issubclass(serializer_class, ModelSerializer) \
+                and serializer_class is not ModelSerializer:
+            serializer_class().fields
+
+    # Reference data, the token revocation filter and the shard map
+    from assets import reference, sharding, tokens
+
+    reference.warm()
+    tokens.revocation_filter()
+    if sharding.sharding_enabled():
+        sharding.shard_map()
+
+    # Never hand an open connection to a forked worker
+    connections.close_all()
+    return time.perf_counter() - started
+
+
+def reset_connections():
+    """
+    Forget DB connections inherited across a fork without closing them.
+
+    Closing would send a terminate message on a socket the parent still
+    owns; dropping the reference lets Django open a fresh connection.
+    """
+    for connection in connections.all(initialized_only=True):
+        connection.connection = None
+        connection.closed_in_transaction = False
+        connection.in_atomic_block = False
+        connection.savepoint_ids = []
+        connection.needs_rollback = False
+
+
+def memory_usage(pid=None):
+    """
+    Memory of a process in KiB from /proc (Linux).
+
+    ``rss`` counts pages shared with the master; ``pss`` splits shared
+    pages between the processes sharing them and ``private`` counts only
+    pages unique to the process, which is what each extra worker costs.
+    """
+    path = f'/proc/{pid or "self"}/smaps_rollup'
+    usage = {}
+    try:
+        with open(path) as handle:
+            for line in handle:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty', 'Shared_Clean', 'Shared_Dirty'):
+                    usage[key] = int(value.split()[0])
+    except OSError:
+        import resource
+        return {'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    return {
+        'rss': usage.get('Rss', 0),
+        'pss': usage.get('Pss', 0),
+        'private': usage.get('Private_Clean', 0) + usage.get('Private_Dirty', 0),
+        'shared': usage.get('Shared_Clean', 0) + usage.get('Shared_Dirty', 0),
+    }
+
+
+def format_usage(usage):
+    return ' '.join(f'{key}={value / 1024:.1f}MiB' for key, value in usage.items())
+
+
+def worker_pids(master_pid):
+    """Child pids of ``master_pid`` (Linux)"""
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as handle:
+            return [int(pid) for pid in handle.read().split()]
+    except OSError:
+        return []
+
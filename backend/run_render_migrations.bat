@@ -31,6 +31,7 @@ echo.
 echo [5/5] Running migrations...
 echo.
 python manage.py migrate
+python manage.py createcachetable
 
 echo.
 echo ========================================
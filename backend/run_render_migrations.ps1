@@ -35,6 +35,7 @@ Write-Host ""
 Write-Host "[5/6] Running migrations..." -ForegroundColor Yellow
 Write-Host ""
 python manage.py migrate
+python manage.py createcachetable
 Write-Host ""
 
 # Step 6: Verify migrations